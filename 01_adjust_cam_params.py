@@ -42,7 +42,7 @@ FRAMES_PER_SEC = 5
 
 def main():
     common.run_hw_diagnostics()
-    aruco_detector = detection.build_aruco_detector()
+    aruco_detector = detection.get_aruco_detector()
 
     camera_index = camera.pick_camera()
     cap = camera.capture(camera_index)
@@ -46,7 +46,7 @@ def draw_aruco_positions(image, corners, ids, H, known_ids):
 
 
 def main():
-    aruco_detector = detection.build_aruco_detector()
+    aruco_detector = detection.get_aruco_detector()
     image = cv.imread("assets/board_with_tags_2.jpg")
 
     # Detect ArUco markers
@@ -47,7 +47,7 @@ def main():
     camera.load_properties(cap, camera_index)
 
     # Initialize ArUco detector
-    aruco_detector = detection.build_aruco_detector()
+    aruco_detector = detection.get_aruco_detector()
 
     # Initialize world
     world = World(blocking=False)
@@ -7,11 +7,10 @@
 import cv2 as cv
 import numpy as np
 
-from lib import common, camera
+from lib import common, camera, detection
 
 # ------------------------------
 # ENTER CALIBRATION PARAMETERS HERE:
-ARUCO_DICT = cv.aruco.DICT_6X6_250
 SQUARES_VERTICALLY = 8
 SQUARES_HORIZONTALLY = 5
 SQUARE_LENGTH = 0.0327  # square size in meters
@@ -21,8 +20,13 @@ MARGIN_PX = 20  # size of the margin in pixels
 BOARD_OUTPUT_FILE = './assets/calibration_board.png'
 
 
+def calibration_dictionary():
+    """Dictionary of the "calibration" detector profile (DICT_6X6_250 unless tuned), read once the profile is loaded."""
+    return cv.aruco.getPredefinedDictionary(detection.DETECTOR_PROFILES["calibration"]["dictionary"])
+
+
 def generate_calibration_board():
-    dictionary = cv.aruco.getPredefinedDictionary(ARUCO_DICT)
+    dictionary = calibration_dictionary()
     board = cv.aruco.CharucoBoard((SQUARES_VERTICALLY, SQUARES_HORIZONTALLY), SQUARE_LENGTH, MARKER_LENGTH, dictionary)
     size_ratio = SQUARES_HORIZONTALLY / SQUARES_VERTICALLY
     img = cv.aruco.CharucoBoard.generateImage(board, (LENGTH_PX, int(LENGTH_PX * size_ratio)), marginSize=MARGIN_PX)
@@ -44,6 +48,9 @@ def add_trackbars(window_name, cap):
 
 
 def main():
+    # Load the tuned detector settings first: they may change the dictionary of the board
+    detection.load_detector_profile("calibration")
+
     # Generate calibration board
     generate_calibration_board()
 
@@ -54,9 +61,8 @@ def main():
     camera.load_properties(cap, camera_index)
 
     # Define the chessboard pattern
-    dictionary = cv.aruco.getPredefinedDictionary(ARUCO_DICT)
+    dictionary = calibration_dictionary()
     board = cv.aruco.CharucoBoard((SQUARES_VERTICALLY, SQUARES_HORIZONTALLY), SQUARE_LENGTH, MARKER_LENGTH, dictionary)
-    detector_params = cv.aruco.DetectorParameters()
 
     # Add trackbars to the window
     add_trackbars("image", cap)
@@ -75,7 +81,7 @@ def main():
         # image = cv.resize(image, (1280, 720))
         # image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
 
-        marker_corners, marker_ids, _ = cv.aruco.detectMarkers(image, dictionary, parameters=detector_params)
+        marker_corners, marker_ids = detection.detect_markers(image, "calibration")
 
         if marker_ids is not None and len(marker_ids) >= 4:
             ret, charuco_corners, charuco_ids = \
@@ -50,7 +50,6 @@ class Stream:
     def __init__(self, index, camera_index):
         self.index = index
         self.camera_index = camera_index
-        self.aruco_detector = detection.build_aruco_detector()
 
         cap = camera.capture(self.camera_index)
         camera.load_properties(cap, camera_index)
@@ -76,7 +75,7 @@ class Stream:
         return False
 
     def detect(self):
-        corners, ids, _rejected = self.aruco_detector.detectMarkers(self.last_image)
+        corners, ids = detection.detect_markers(self.last_image)
         self.last_detection = corners, ids
         print(f"Detected ids", ids)
 
@@ -85,20 +84,18 @@ class Stream:
         if ids is None or len(ids) == 0:
             return None
 
-        ret, rvec, tvec = \
-            vision.estimate_pose(corners, ids, vision.FIELD_MARKERS, self.camera_matrix, self.dist_coeffs)
-
-        if ret:
-            self.last_pose = rvec, tvec
-            pos = vision.get_camera_position(rvec, tvec)
+        pose = vision.estimate_pose(corners, ids, vision.FIELD_MARKERS, self.camera_matrix, self.dist_coeffs)
+        if pose is not None:
+            self.last_pose = pose
+            pos = pose.camera_center
             print(f"Camera {self.index} Position: X={pos[0]:.3f}, Y={pos[1]:.3f}, Z={pos[2]:.3f}")
 
     def draw_cross(self, image, world_point, text=None):
         if self.last_pose is None:
             return
 
-        camera_rvec, camera_tvec = self.last_pose
-        image_points, _ = cv.projectPoints(world_point, camera_rvec, camera_tvec, self.camera_matrix, self.dist_coeffs)
+        image_points, _ = cv.projectPoints(world_point, self.last_pose.rvec, self.last_pose.tvec, self.camera_matrix,
+                                           self.dist_coeffs)
         u, v = map(int, image_points.ravel())
         half_size = 50
         cv.line(image, (u - half_size, v), (u + half_size, v), (0, 255, 0), 3)
@@ -114,28 +111,26 @@ class Stream:
         self.draw_cross(image, np.array([[150., 200., 0.]]))
         return image
 
-    def image_to_world_point(self, image_point, z_world):
-        rvec, tvec = self.last_pose
-        return vision.image_to_world_point(image_point, z_world, rvec, tvec, self.camera_matrix, self.dist_coeffs)
+    def image_to_world_points(self, image_points, z_world):
+        return self.last_pose.image_to_world_points(image_points, z_world, self.camera_matrix, self.dist_coeffs)
 
     def world_positions(self):
         corners, ids = self.last_detection
-        if ids is None or len(ids) == 0:
+        if ids is None or len(ids) == 0 or self.last_pose is None:
             return []
 
+        indices, marker_ids = vision.MARKERS.select(ids, [vision.MarkerRole.TIN_CAN, vision.MarkerRole.OPPONENT_BLUE,
+                                                          vision.MarkerRole.OPPONENT_YELLOW])
+        if len(indices) == 0:
+            return []
+
+        centers = [corners[i][0].mean(axis=0) for i in indices]
+        world_points = self.image_to_world_points(centers, vision.MARKERS.height[marker_ids])
+
         world_positions = []
-        for id, corner in zip(ids, corners):
-            marker_id = id[0]
-            corner = corner[0]
-            if (marker_id == vision.MarkerId.TIN_CAN or
-                    vision.MarkerId.ROBOT_BLUE_LO <= marker_id <= vision.MarkerId.ROBOT_BLUE_HI or
-                    vision.MarkerId.ROBOT_YELLOW_LO <= marker_id <= vision.MarkerId.ROBOT_YELLOW_HI):
-                center = corner.mean(axis=0)
-                z_world = vision.z_world(marker_id)
-                world_point = self.image_to_world_point(center, z_world)
-
-                print(f"Marker {marker_id} at {world_point[:2]}")
-                world_positions.append((marker_id, world_point[0], world_point[1], world_point[2]))
+        for marker_id, world_point in zip(marker_ids, world_points):
+            print(f"Marker {marker_id} at {world_point[:2]}")
+            world_positions.append((marker_id, world_point[0], world_point[1], world_point[2]))
 
         return world_positions
 
@@ -154,9 +149,7 @@ class Reconstruction:
         for i, stream in enumerate(self.streams):
             last_pose = stream.last_pose
             if last_pose is not None:
-                rvec, tvec = last_pose
-                position = vision.get_camera_position(rvec, tvec)
-                webcam = Webcam(position, rvec)
+                webcam = Webcam(last_pose.camera_center, last_pose.rvec)
                 self.world.add_webcam(i + 1, webcam)
 
         for marker_id, x, y, z in self.world_positions:
@@ -175,9 +168,12 @@ class Reconstruction:
 def main():
     # Select and initialize cameras
     common.run_hw_diagnostics()
+    detection.load_detector_profile("field")
     available_cameras = camera.list_available_cameras()
 
-    indices = [cam["index"] for cam in available_cameras if cam["name"] == "W4DS--SN0001"]
+    cameras = sorted((cam for cam in available_cameras if cam["name"] == "W4DS--SN0001"),
+                     key=lambda cam: cam["usb_path"])
+    indices = [cam["index"] for cam in cameras]
     if len(indices) >= 2:
         cam_index_1, cam_index_2 = indices[0], indices[1]
     else:
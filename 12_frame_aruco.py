@@ -19,7 +19,8 @@ def main():
 
     # Initialize camera and detector
     camera_matrix, dist_coeffs = camera.load_calibration(camera_name="W4DS--SN0001")
-    aruco_detector = detection.build_aruco_detector()
+    detection.load_detector_profile("field")
+    aruco_detector = detection.get_aruco_detector()
 
     for frame_nb in sorted(images.keys()):
         print(f"Frame {frame_nb}")
@@ -29,18 +30,19 @@ def main():
         corners, ids, _rejected = aruco_detector.detectMarkers(image)
 
         # Pose estimation
-        ret, rvec, tvec = \
-            vision.estimate_pose(corners, ids, vision.FIELD_MARKERS, camera_matrix, dist_coeffs)
-
-        if ret:
-            camera_pos = vision.get_camera_position(rvec, tvec)
-            print(f"  Camera Position: X={camera_pos[0]:.3f}, Y={camera_pos[1]:.3f}, Z={camera_pos[2]:.3f}")
-
-        for id, corner in zip(ids, corners):
-            marker_id = id[0]
-            center = corner[0].mean(axis=0)
-            z_world = 0.0 if marker_id == 7 else vision.z_world(marker_id)  # HACK: Marker 7 is on the ground
-            world_point = vision.image_to_world_point(center, z_world, rvec, tvec, camera_matrix, dist_coeffs)
+        pose = vision.estimate_pose(corners, ids, vision.FIELD_MARKERS, camera_matrix, dist_coeffs)
+        if pose is None:
+            continue
+
+        camera_pos = pose.camera_center
+        print(f"  Camera Position: X={camera_pos[0]:.3f}, Y={camera_pos[1]:.3f}, Z={camera_pos[2]:.3f}")
+
+        marker_ids = [id[0] for id in ids]
+        centers = [corner[0].mean(axis=0) for corner in corners]
+        z_world = [0.0 if marker_id == 7 else vision.z_world(marker_id)  # HACK: Marker 7 is on the ground
+                   for marker_id in marker_ids]
+        world_points = pose.image_to_world_points(centers, z_world, camera_matrix, dist_coeffs)
+        for marker_id, world_point in zip(marker_ids, world_points):
             print(f"  Tag {marker_id}: {world_point}")
 
 
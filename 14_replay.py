@@ -0,0 +1,102 @@
+# ----------------
+# Run the competition analysis on recorded frames, without cameras, and measure the throughput.
+# Usage: python 14_replay.py [--realtime] [--tracked] [--serial] [--start=SECONDS] source_1 [source_2]
+#   source: recordings/<session> folder, logs/<session> folder, 11_capture.py frame folder or video file.
+#   With a single recordings/<session> folder, both recorded cameras are replayed; --start skips the first SECONDS
+#   of the recording, seeking through its index.
+#   With a single logs/<session> folder, both cameras are cropped from the debug boards.
+#   --serial: analyse the two cameras one after the other, to measure the gain of the Analyser camera pool.
+# ----------------
+
+import sys
+from collections import Counter
+from datetime import timedelta
+from time import monotonic
+
+from lib import board, detection, eagle_packet, recording
+from models.analyser import Analyser
+from models.persistent_state import PersistentState
+from models.replay_stream import ReplayStream
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    realtime = "--realtime" in sys.argv[1:]
+    tracked = "--tracked" in sys.argv[1:]
+    serial = "--serial" in sys.argv[1:]
+    start_offset = next((float(arg.split("=", 1)[1]) for arg in sys.argv[1:] if arg.startswith("--start=")), 0.0)
+    if len(args) == 1 and recording.is_recording(args[0]):
+        time_range = recording.RecordingReader(args[0]).time_range()
+        start = time_range[0] + timedelta(seconds=start_offset) if time_range else None
+        stream_1 = ReplayStream(args[0], 1, realtime=realtime, tracked=tracked, start=start)
+        stream_2 = ReplayStream(args[0], 2, realtime=realtime, tracked=tracked, start=start)
+    elif len(args) == 1:
+        regions = board.DEBUG_CAPTURE_REGIONS
+        stream_1 = ReplayStream(args[0], 1, realtime=realtime, tracked=tracked, region=regions[0])
+        stream_2 = ReplayStream(args[0], 2, realtime=realtime, tracked=tracked, region=regions[1])
+    elif len(args) == 2:
+        stream_1 = ReplayStream(args[0], 1, realtime=realtime, tracked=tracked)
+        stream_2 = ReplayStream(args[1], 2, realtime=realtime, tracked=tracked)
+    else:
+        print(f"Usage: python {sys.argv[0]} [--realtime] [--tracked] [--serial] [--start=SECONDS] source_1 "
+              f"[source_2]")
+        exit(1)
+
+    if detection.load_detector_profile("field"):
+        print(f"Using tuned detector profile {detection.detector_profile_path('field')}")
+
+    persistent_state = PersistentState()
+    frame_count = 0
+    robot_detections = 0
+    robot_reports = 0  # Frames where the robot was sent, measured or predicted by the tracker
+    analysis_time = 0.0  # Wall-clock seconds spent in Analyser.generate_world
+    stage_times = Counter()  # FrameContext stage -> total seconds, over both cameras
+    start = monotonic()
+
+    try:
+        while True:
+            capture_1 = stream_1.capture()
+            capture_2 = stream_2.capture()
+            if capture_1 is None or capture_2 is None:
+                break
+
+            frame_start = monotonic()
+            analyser = Analyser(capture_1, capture_2, parallel=not serial)
+            world, persistent_state = analyser.generate_world(persistent_state)
+            analysis_time += monotonic() - frame_start
+            robot_detections += world.robot_detected
+
+            # The packet would leave once the frame is analysed, in the time base of the recording
+            send_time = max(capture_1.time, capture_2.time) + timedelta(seconds=monotonic() - frame_start)
+            world.predict_poses(persistent_state.robot_tracker, persistent_state.opponent_tracker, send_time)
+            eagle_packet.frame_payload(world.to_eagle_packet())
+
+            frame_count += 1
+            robot_reports += world.robot_detected
+            for capture in [capture_1, capture_2]:
+                stage_times.update(capture.context.timings)
+    except KeyboardInterrupt:
+        print("User interrupted the program.")
+    finally:
+        stream_1.close()
+        stream_2.close()
+
+    elapsed = monotonic() - start
+    print(f"Processed {frame_count} frames in {elapsed:.2f} s: {frame_count / max(elapsed, 1e-9):.1f} FPS, "
+          f"{1000 * elapsed / max(frame_count, 1):.1f} ms per frame")
+    print(f"Analysis ({'serial' if serial else 'parallel'} cameras): "
+          f"{1000 * analysis_time / max(frame_count, 1):.1f} ms per frame")
+    print(f"Robot detected in {robot_detections} frames, sent in {robot_reports} frames "
+          f"({robot_reports - robot_detections} predicted while unseen)")
+    print("Per frame: " + ", ".join(f"{stage} {1000 * seconds / max(frame_count, 1):.1f} ms"
+                                    for stage, seconds in stage_times.items()))
+    for stream in [stream_1, stream_2]:
+        print(stream.statistics())
+        if stream.tracker is not None:
+            print(f"  {stream.tracker.statistics()}")
+        if stream.camera_index in persistent_state.pose_locks:
+            print(f"  {persistent_state.pose_locks[stream.camera_index].statistics()}")
+
+
+if __name__ == "__main__":
+    main()
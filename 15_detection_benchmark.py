@@ -0,0 +1,211 @@
+# ----------------
+# Compare marker detection modes against the single-scale detector: latency, recall and corner accuracy.
+# Usage: python 15_detection_benchmark.py [image_or_folder ...]
+#   Defaults to assets/board_with_tags_*.jpg. Folders are searched recursively for .jpg files.
+# ----------------
+
+import glob
+import os
+import sys
+from time import perf_counter
+
+import cv2 as cv
+import numpy as np
+
+from lib import detection, vision
+
+REPEATS = 3  # Detections per image and mode; the fastest one is kept
+
+MODES = {
+    "single-scale": lambda image: detection.detect_markers(image, scale=1),
+    "pyramid x2": lambda image: detection.detect_markers_pyramid(image, 2),
+    "pyramid x4": lambda image: detection.detect_markers_pyramid(image, 4),
+    "tiled 2x2": lambda image: detection.detect_markers_tiled(image, (2, 2)),
+    "tiled 3x2": lambda image: detection.detect_markers_tiled(image, (3, 2)),
+}
+REFERENCE_MODE = "single-scale"
+SCALING_TILES = (3, 2)  # Tiles used to measure the scaling of tiled detection with the number of workers
+
+# Full dictionary against dictionaries restricted to the markers we use: (marker_ids, max_correction_bits, params)
+DICTIONARIES = {
+    "full DICT_4X4_250": (None, None, {}),
+    "restricted": (vision.USED_MARKER_IDS, None, {}),
+    "restricted, 2 bits corrected": (vision.USED_MARKER_IDS, 2, {"errorCorrectionRate": 1.0}),
+}
+
+
+def list_images(paths):
+    if not paths:
+        return sorted(glob.glob("assets/board_with_tags_*.jpg"))
+
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            images.extend(sorted(glob.glob(os.path.join(path, "**", "*.jpg"), recursive=True)))
+        else:
+            images.append(path)
+    return images
+
+
+def timed_detection(detect, image):
+    best_time, result = None, None
+    for _ in range(REPEATS):
+        start = perf_counter()
+        result = detect(image)
+        elapsed = perf_counter() - start
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+    return best_time, result
+
+
+def match_markers(reference, candidate):
+    """Returns (matched, reference_count, candidate_count, corner_errors) where corner_errors are in pixels."""
+    pairs = detection.match_detections(reference, candidate)
+    errors = []
+    for ref_index, index in pairs:
+        errors.extend(np.linalg.norm(candidate[0][index].reshape(4, 2) - reference[0][ref_index].reshape(4, 2),
+                                     axis=1))
+    count = lambda ids: 0 if ids is None else len(ids)
+    return len(pairs), count(reference[1]), count(candidate[1]), errors
+
+
+def main():
+    image_paths = list_images(sys.argv[1:])
+    if not image_paths:
+        print(f"Usage: python {sys.argv[0]} [image_or_folder ...]")
+        exit(1)
+
+    totals = {name: {"time": 0.0, "matched": 0, "reference": 0, "detected": 0, "errors": []} for name in MODES}
+    for path in image_paths:
+        image = cv.imread(path)
+        if image is None:
+            continue
+
+        results = {name: timed_detection(detect, image) for name, detect in MODES.items()}
+        reference = results[REFERENCE_MODE][1]
+        for name, (elapsed, result) in results.items():
+            matched, reference_count, detected_count, errors = match_markers(reference, result)
+            total = totals[name]
+            total["time"] += elapsed
+            total["matched"] += matched
+            total["reference"] += reference_count
+            total["detected"] += detected_count
+            total["errors"].extend(errors)
+
+    print(f"{len(image_paths)} images, reference: {REFERENCE_MODE}")
+    print(f"{'mode':<24} {'time (ms)':>10} {'speedup':>8} {'recall':>8} {'extra':>6} {'err mean':>9} {'err max':>8}")
+    reference_time = totals[REFERENCE_MODE]["time"]
+    for name, total in totals.items():
+        recall = total["matched"] / total["reference"] if total["reference"] else float("nan")
+        extra = total["detected"] - total["matched"]
+        errors = total["errors"] or [float("nan")]
+        print(f"{name:<24} {1000 * total['time'] / len(image_paths):>10.1f} "
+              f"{reference_time / total['time']:>7.1f}x {recall:>8.1%} {extra:>6} "
+              f"{np.mean(errors):>8.2f}px {np.max(errors):>6.2f}px")
+
+    print_tiled_scaling(image_paths)
+    print_dictionary_comparison(image_paths)
+    print_backend_comparison(image_paths)
+
+
+def print_tiled_scaling(image_paths):
+    """Print the speedup and parallel efficiency of tiled detection for 1 to N workers."""
+    images = [image for image in map(cv.imread, image_paths) if image is not None]
+    max_workers = min(SCALING_TILES[0] * SCALING_TILES[1], os.cpu_count() or 1)
+
+    print(f"\nTiled detection {SCALING_TILES[0]}x{SCALING_TILES[1]} scaling")
+    print(f"{'workers':>7} {'time (ms)':>10} {'speedup':>8} {'efficiency':>10}")
+    single_worker_time = None
+    for workers in range(1, max_workers + 1):
+        detect = lambda image: detection.detect_markers_tiled(image, SCALING_TILES, workers=workers)
+        elapsed = sum(timed_detection(detect, image)[0] for image in images)
+        single_worker_time = single_worker_time or elapsed
+        speedup = single_worker_time / elapsed
+        print(f"{workers:>7} {1000 * elapsed / len(images):>10.1f} {speedup:>7.2f}x {speedup / workers:>10.0%}")
+
+
+def print_dictionary_comparison(image_paths):
+    """
+    Compare the full dictionary with restricted ones: time per candidate quad (thresholding and the quad search are
+    the same for all, so differences come from identification) and false positives. Only the IDs of
+    `vision.USED_MARKER_IDS` appear on the field, so any other ID found by the full dictionary is a false positive,
+    and so is any marker found by a restricted dictionary where the full dictionary found none of our markers.
+    """
+    images = [image for image in map(cv.imread, image_paths) if image is not None]
+    settings = detection.DETECTOR_PROFILES["field"]
+    used_ids = set(vision.USED_MARKER_IDS)
+
+    references = []
+    full_detector = detection.build_detector(settings["dictionary"], settings["params"])
+    for image in images:
+        corners, ids, _rejected = full_detector.detectMarkers(image)
+        keep = [k for k in range(0 if ids is None else len(ids)) if int(ids[k][0]) in used_ids]
+        references.append(([corners[k] for k in keep], ids[keep] if keep else None))
+
+    base_dictionary = cv.aruco.getPredefinedDictionary(settings["dictionary"])
+    distance = detection.min_codeword_distance(base_dictionary.bytesList[vision.USED_MARKER_IDS],
+                                               base_dictionary.markerSize)
+    print(f"\nDictionaries (minimum codeword distance between the markers we use: {distance} bits)")
+    print(f"{'dictionary':<30} {'time (ms)':>10} {'candidates':>10} {'us/cand.':>9} {'found':>6} {'missed':>6} "
+          f"{'false +':>7}")
+    for name, (marker_ids, max_correction_bits, params) in DICTIONARIES.items():
+        detector = detection.build_detector(settings["dictionary"], {**settings["params"], **params},
+                                            marker_ids=marker_ids, max_correction_bits=max_correction_bits)
+        elapsed, candidates, found, missed, false_positives = 0.0, 0, 0, 0, 0
+        for image, reference in zip(images, references):
+            best_time = None
+            for _ in range(REPEATS):
+                start = perf_counter()
+                corners, ids, rejected = detector.detectMarkers(image)
+                best_time = min(best_time or float("inf"), perf_counter() - start)
+            elapsed += best_time
+            candidates += len(corners) + len(rejected)
+
+            ids_list = [] if ids is None else [int(i) for i in ids.ravel()]
+            matched = len(detection.match_detections(reference, (corners, ids)))
+            found += len(ids_list)
+            missed += (0 if reference[1] is None else len(reference[1])) - matched
+            false_positives += len(ids_list) - matched
+
+        print(f"{name:<30} {1000 * elapsed / len(images):>10.1f} {candidates / len(images):>10.0f} "
+              f"{1e6 * elapsed / max(candidates, 1):>9.1f} {found:>6} {missed:>6} {false_positives:>7}")
+
+
+def print_backend_comparison(image_paths):
+    """
+    Compare the detection backends on the "field" profile: latency, recall against the classic ArUco backend, and
+    recall of the opponent tags alone, the smallest markers we need to see from across the field.
+    """
+    images = [image for image in map(cv.imread, image_paths) if image is not None]
+    settings = detection.DETECTOR_PROFILES["field"]
+    opponent_ids = set(range(vision.MarkerId.ROBOT_BLUE_LO, vision.MarkerId.ROBOT_YELLOW_HI + 1))
+
+    detectors = {backend: detection.build_detector(settings["dictionary"], settings["params"], backend=backend)
+                 for backend in detection.DETECTION_BACKENDS}
+    references = [detectors["aruco"].detectMarkers(image)[:2] for image in images]
+
+    print("\nBackends (reference: aruco)")
+    print(f"{'backend':<12} {'time (ms)':>10} {'speedup':>8} {'recall':>8} {'opponent':>9} {'extra':>6}")
+    reference_time = None
+    for backend, detector in detectors.items():
+        elapsed, matched, expected, opponent_matched, opponent_expected, detected = 0.0, 0, 0, 0, 0, 0
+        for image, reference in zip(images, references):
+            best_time, result = timed_detection(lambda frame: detector.detectMarkers(frame)[:2], image)
+            elapsed += best_time
+
+            ref_ids = [] if reference[1] is None else [int(i) for i in reference[1].ravel()]
+            pairs = detection.match_detections(reference, result)
+            matched += len(pairs)
+            expected += len(ref_ids)
+            opponent_matched += sum(ref_ids[ref_index] in opponent_ids for ref_index, _ in pairs)
+            opponent_expected += sum(marker_id in opponent_ids for marker_id in ref_ids)
+            detected += 0 if result[1] is None else len(result[1])
+
+        reference_time = reference_time or elapsed
+        recall = matched / expected if expected else float("nan")
+        opponent_recall = opponent_matched / opponent_expected if opponent_expected else float("nan")
+        print(f"{backend:<12} {1000 * elapsed / len(images):>10.1f} {reference_time / elapsed:>7.1f}x "
+              f"{recall:>8.1%} {opponent_recall:>9.1%} {detected - matched:>6}")
+
+
+if __name__ == "__main__":
+    main()
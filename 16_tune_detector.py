@@ -0,0 +1,175 @@
+# ----------------
+# Tune the ArUco DetectorParameters of a profile on recorded frames.
+# Each candidate parameter set is scored by its per-ID recall against the current profile and its mean detection
+# time. The Pareto-optimal candidates are printed, and the fastest one meeting the recall target is saved to
+# detector-settings/<profile>.yaml, which `detection.load_detector_profile()` loads.
+# Usage: python 16_tune_detector.py [--profile field] [--samples 60] [--max-frames 40] [--min-recall 0.98]
+#                                   [--debug-boards] image_or_folder ...
+#   --debug-boards: the frames are ImageLogger debug boards, tune on the two camera insets.
+# ----------------
+
+import argparse
+import glob
+import itertools
+import os
+import random
+from collections import Counter
+from time import perf_counter
+
+import cv2 as cv
+import yaml
+
+from lib import board, detection
+
+PARAMETER_GRID = {
+    "adaptiveThreshWinSizeMin": [3, 5, 7],
+    "adaptiveThreshWinSizeMax": [7, 13, 23],
+    "adaptiveThreshWinSizeStep": [4, 10, 20],
+    "polygonalApproxAccuracyRate": [0.03, 0.05, 0.08],
+    "cornerRefinementMethod": [cv.aruco.CORNER_REFINE_NONE, cv.aruco.CORNER_REFINE_SUBPIX],
+    "perspectiveRemovePixelPerCell": [2, 4],
+    "minMarkerPerimeterRate": [0.003, 0.01],
+}
+
+
+def load_frames(paths, max_frames, debug_boards):
+    image_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            image_paths.extend(sorted(glob.glob(os.path.join(path, "**", "*.jpg"), recursive=True)))
+        else:
+            image_paths.append(path)
+
+    # Spread the frames over the whole corpus
+    step = max(1, len(image_paths) // max_frames)
+    frames = []
+    for path in image_paths[::step][:max_frames]:
+        image = cv.imread(path, cv.IMREAD_GRAYSCALE)
+        if image is None:
+            continue
+        if debug_boards:
+            frames.extend(board.crop_debug_board(image, region) for region in board.DEBUG_CAPTURE_REGIONS)
+        else:
+            frames.append(image)
+    return frames
+
+
+def candidates(base_params, samples, seed=0):
+    """Yield the base parameters, then `samples` random valid combinations of the grid applied over them."""
+    yield dict(base_params)
+
+    names = list(PARAMETER_GRID)
+    combinations = [dict(zip(names, values)) for values in itertools.product(*PARAMETER_GRID.values())]
+    combinations = [c for c in combinations if c["adaptiveThreshWinSizeMin"] <= c["adaptiveThreshWinSizeMax"]]
+    random.Random(seed).shuffle(combinations)
+    for combination in combinations[:samples]:
+        yield {**base_params, **combination}
+
+
+def evaluate(detector, frames, references):
+    """Return (mean detection time in seconds, per-ID recall dict, overall recall)."""
+    elapsed = 0.0
+    found = Counter()
+    expected = Counter()
+    for frame, reference in zip(frames, references):
+        start = perf_counter()
+        corners, ids, _rejected = detector.detectMarkers(frame)
+        elapsed += perf_counter() - start
+
+        ref_ids = [] if reference[1] is None else [int(i) for i in reference[1].ravel()]
+        expected.update(ref_ids)
+        found.update(ref_ids[ref_index] for ref_index, _ in detection.match_detections(reference, (corners, ids)))
+
+    recall_per_id = {marker_id: found[marker_id] / count for marker_id, count in expected.items()}
+    overall = sum(found.values()) / sum(expected.values()) if expected else 1.0
+    return elapsed / len(frames), recall_per_id, overall
+
+
+def pareto_front(results):
+    """Keep the results that no other result beats on both recall and time."""
+    front = []
+    for result in results:
+        dominated = any(
+            other["min_recall"] >= result["min_recall"] and other["time"] <= result["time"] and
+            (other["min_recall"] > result["min_recall"] or other["time"] < result["time"])
+            for other in results)
+        if not dominated:
+            front.append(result)
+    return sorted(front, key=lambda result: result["time"])
+
+
+def to_yaml_value(value):
+    return float(value) if isinstance(value, float) else int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the DetectorParameters of a detection profile.")
+    parser.add_argument("paths", nargs="+", help="images or folders of logged frames")
+    parser.add_argument("--profile", default="field")
+    parser.add_argument("--samples", type=int, default=60, help="number of random parameter sets to try")
+    parser.add_argument("--max-frames", type=int, default=40)
+    parser.add_argument("--min-recall", type=float, default=0.98, help="minimum recall of every marker ID")
+    parser.add_argument("--debug-boards", action="store_true", help="frames are ImageLogger debug boards")
+    args = parser.parse_args()
+
+    frames = load_frames(args.paths, args.max_frames, args.debug_boards)
+    if not frames:
+        print("No frames found")
+        exit(1)
+
+    settings = detection.DETECTOR_PROFILES[args.profile]
+    build = lambda params: detection.build_detector(settings["dictionary"], params,
+                                                    marker_ids=settings.get("marker_ids"),
+                                                    max_correction_bits=settings.get("max_correction_bits"),
+                                                    backend=settings.get("backend", "aruco"))
+    reference_detector = build(settings["params"])
+    references = [reference_detector.detectMarkers(frame)[:2] for frame in frames]
+    print(f"{len(frames)} frames, {sum(0 if ids is None else len(ids) for _, ids in references)} reference markers")
+
+    results = []
+    for params in candidates(settings["params"], args.samples):
+        detector = build(params)
+        elapsed, recall_per_id, overall = evaluate(detector, frames, references)
+        min_recall = min(recall_per_id.values(), default=1.0)
+        results.append({"params": params, "time": elapsed, "recall": overall, "min_recall": min_recall,
+                        "recall_per_id": recall_per_id})
+        print(f"{1000 * elapsed:7.1f} ms  recall {overall:6.1%}  worst ID {min_recall:6.1%}  {params}")
+
+    front = pareto_front(results)
+    print("\nPareto front:")
+    for result in front:
+        print(f"{1000 * result['time']:7.1f} ms  recall {result['recall']:6.1%}  "
+              f"worst ID {result['min_recall']:6.1%}  {result['params']}")
+
+    eligible = [result for result in front if result["min_recall"] >= args.min_recall]
+    if not eligible:
+        print(f"No parameter set reaches a recall of {args.min_recall:.0%} on every ID")
+        exit(1)
+    best = eligible[0]
+    baseline = results[0]
+    print(f"\nSelected: {1000 * best['time']:.1f} ms ({baseline['time'] / best['time']:.1f}x faster than the "
+          f"current profile), recall {best['recall']:.1%}")
+
+    path = detection.detector_profile_path(args.profile)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        yaml.safe_dump({
+            "dictionary": detection.dictionary_name(settings["dictionary"]),
+            "params": {name: to_yaml_value(value) for name, value in best["params"].items()},
+            "scale": settings.get("scale", 1),
+            "marker_ids": None if settings.get("marker_ids") is None else [int(i) for i in settings["marker_ids"]],
+            "max_correction_bits": settings.get("max_correction_bits"),
+            "backend": settings.get("backend", "aruco"),
+            "tuning": {
+                "frames": len(frames),
+                "mean_time_ms": round(1000 * best["time"], 2),
+                "baseline_time_ms": round(1000 * baseline["time"], 2),
+                "recall": round(best["recall"], 4),
+                "recall_per_id": {int(k): round(v, 4) for k, v in sorted(best["recall_per_id"].items())},
+            },
+        }, file)
+    print(f"Saved {path}")
+
+
+if __name__ == "__main__":
+    main()
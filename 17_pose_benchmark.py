@@ -0,0 +1,110 @@
+# ----------------
+# Compare the camera pose solvers of vision.estimate_pose on logged frames: latency, reprojection error and stability.
+# The cameras are fixed, so a stable solver gives the same camera position on every frame of a sequence.
+# Usage: python 17_pose_benchmark.py [--camera-name W4DS--SN0001] [--outlier 20] [--debug-boards] source ...
+#   source: logs/<session> folder, 11_capture.py frame folder or video file, all from the same camera.
+#   --outlier: also move one corner of each frame by this many pixels, to measure the robustness to bad corners.
+#   --debug-boards: the frames are ImageLogger debug boards, use the first camera inset.
+# ----------------
+
+import argparse
+from time import perf_counter
+
+import numpy as np
+
+from lib import board, detection, vision
+from models.replay_stream import ReplayStream
+
+REPEATS = 5  # Pose estimations per frame and mode; the fastest one is kept
+
+# name -> (warm start from the previous frame's pose, RANSAC)
+MODES = {
+    "IPPE": (False, False),
+    "warm start": (True, False),
+    "RANSAC": (False, True),
+    "warm start + RANSAC": (True, True),
+}
+
+
+def load_frames(sources, camera_name, debug_boards):
+    """Yield (image, camera_matrix, dist_coeffs) for the frames of the sources."""
+    region = board.DEBUG_CAPTURE_REGIONS[0] if debug_boards else None
+    for source in sources:
+        stream = ReplayStream(source, camera_name=camera_name, region=region)
+        try:
+            while (capture := stream.capture()) is not None:
+                yield capture.image, stream.camera_matrix, stream.dist_coeffs
+        finally:
+            stream.close()
+
+
+def add_outlier(corners, ids, offset):
+    """Move the first corner of the first field marker by `offset` pixels."""
+    corners = [corner.copy() for corner in corners]
+    for index, marker_id in enumerate(ids.ravel()):
+        if marker_id in vision.FIELD_MARKERS:
+            corners[index][0][0] += offset
+            break
+    return corners
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the camera pose solvers.")
+    parser.add_argument("paths", nargs="+", help="recordings of a single camera (see ReplayStream)")
+    parser.add_argument("--camera-name", default="W4DS--SN0001", help="camera whose calibration to use")
+    parser.add_argument("--outlier", type=float, default=0.0, help="pixels added to one corner per frame")
+    parser.add_argument("--debug-boards", action="store_true", help="frames are ImageLogger debug boards")
+    args = parser.parse_args()
+
+    # Detect the markers once, all the modes solve the same corners
+    detections = []
+    camera_matrix = dist_coeffs = None
+    for image, camera_matrix, dist_coeffs in load_frames(args.paths, args.camera_name, args.debug_boards):
+        if camera_matrix is None:
+            print(f"No calibration for camera {args.camera_name}")
+            exit(1)
+        corners, ids = detection.detect_markers(image)
+        if ids is None or sum(int(i) in vision.FIELD_MARKERS for i in ids.ravel()) < 2:
+            continue
+        if args.outlier:
+            corners = add_outlier(corners, ids, args.outlier)
+        detections.append((corners, ids))
+
+    if not detections:
+        print("No frame with at least 2 field markers")
+        exit(1)
+
+    print(f"{len(detections)} frames" + (f", one corner moved by {args.outlier:.0f} px" if args.outlier else ""))
+    print(f"{'mode':<22} {'time (us)':>10} {'error (px)':>10} {'inliers':>8} {'failures':>8} {'jitter (mm)':>11} "
+          f"{'step (mm)':>10}")
+    for name, (warm_start, ransac) in MODES.items():
+        elapsed, errors, inliers, positions, failures = 0.0, [], [], [], 0
+        guess = None
+        for corners, ids in detections:
+            best_time = None
+            for _ in range(REPEATS):
+                start = perf_counter()
+                pose = vision.estimate_pose(corners, ids, vision.FIELD_MARKERS, camera_matrix, dist_coeffs,
+                                            guess=guess, ransac=ransac)
+                best_time = min(best_time or float("inf"), perf_counter() - start)
+            elapsed += best_time
+
+            if pose is None:
+                failures += 1
+                continue
+            errors.append(pose.reprojection_error)
+            inliers.append(pose.inlier_count)
+            positions.append(pose.camera_center)
+            if warm_start:
+                guess = pose
+
+        positions = np.array(positions)
+        # Jitter: spread of the camera position over the sequence. Step: mean move from one frame to the next.
+        jitter = 1000 * np.linalg.norm(positions.std(axis=0)) if len(positions) else float("nan")
+        steps = np.linalg.norm(np.diff(positions, axis=0), axis=1) if len(positions) > 1 else [float("nan")]
+        print(f"{name:<22} {1e6 * elapsed / len(detections):>10.0f} {np.mean(errors or [np.nan]):>10.2f} "
+              f"{np.mean(inliers or [np.nan]):>8.1f} {failures:>8} {jitter:>11.2f} {1000 * np.mean(steps):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
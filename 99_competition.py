@@ -3,17 +3,28 @@ import cv2 as cv
 from datetime import datetime
 import signal
 import sys
+import threading
 import traceback
 
-from lib import board, eagle_packet, camera, common, ble_robot
+from lib import board, eagle_packet, camera, common, ble_robot, detection
 from lib.eagle_packet import frame_to_human
 from lib.image_logger import ImageLogger
+from lib.latest_value import LatestValue
+from lib.recording import Recorder
 from models.analyser import Analyser
 from models.persistent_state import PersistentState
-from models.stream import Stream
+from models.process_stream import ProcessStream
+from models.stream_set import StreamSet
 
 SCREEN_WIDTH, SCREEN_HEIGHT = 1920, 1080
 CAMERA_NAME = "W4DS--SN0001"
+LOG_JPEG_QUALITY = 90
+LOG_SCALE = 1.0  # Downscale of the logged debug boards; 14_replay.py and the tuning scripts scale them back
+# Record the camera frames, detections, poses and packets to recordings/, within the disk budgets of the Recorder, see
+# lib/recording.py
+RECORD = True
+RECORD_JPEG_QUALITY = 90
+RECORD_FRAME_INTERVAL = 0.2  # Seconds between two recorded frames of a camera; detections and poses are all recorded
 
 
 def dump_threads(signum, frame):
@@ -25,13 +36,19 @@ def dump_threads(signum, frame):
 
 
 def init_streams():
+    """Open every camera named CAMERA_NAME (at least the 2 side cameras, plus the overhead one if plugged in)."""
     while True:
         available_cameras = camera.list_available_cameras()
-        indices = [cam["index"] for cam in available_cameras if cam["name"] == CAMERA_NAME]
+        # The cameras report the same serial: order them by USB port so that they don't swap on reboot
+        cameras = sorted((cam for cam in available_cameras if cam["name"] == CAMERA_NAME),
+                         key=lambda cam: cam["usb_path"])
+        indices = [cam["index"] for cam in cameras]
         if len(indices) >= 2:
-            cam_index_1, cam_index_2 = indices[0], indices[1]
-            print("Available cameras: ", available_cameras, " - Using cameras: ", cam_index_1, cam_index_2)
-            return Stream(cam_index_1), Stream(cam_index_2)
+            print("Available cameras: ", available_cameras, " - Using cameras: ", *indices)
+            # Each camera is decoded in its own process, so that a stalled camera can't freeze the loop. The images
+            # of a result stay pinned until the render stage releases them, while the pose stage captures the next
+            # frames; results dropped by the render queue are released as soon as the queue replaces them
+            return [ProcessStream(index, tracked=True, pinned=6) for index in indices]
         else:
             print(f"Could not find 2 cameras with name '{CAMERA_NAME}'. Retrying...")
             pygame.time.delay(1000)
@@ -52,84 +69,167 @@ def show_cv_image(screen, cv_image):
     pygame.display.flip()
 
 
+def pose_loop(streams, stream_set, render_queue, stop, recorder=None):
+    """
+    Capture, analyse and send, as fast as the cameras and the analysis allow. Each result is handed over to the
+    render stage through `render_queue`, which only keeps the newest one, so drawing and logging never delay a pose.
+    Every frame and packet goes to `recorder`, if any, which writes them in the background.
+    """
+    persistent_state = PersistentState()
+    try:
+        while not stop.is_set():
+            # Capture images
+            captures = stream_set.capture()
+
+            # Analyse camera frames
+            analyser = Analyser(*captures)
+            world, persistent_state = analyser.generate_world(persistent_state)
+
+            # Send Bluetooth frame as quickly as possible after capture, with the poses predicted to the send time
+            # rather than the capture time: the robots kept moving while the frames were analysed
+            send_time = datetime.now()
+            world.predict_poses(persistent_state.robot_tracker, persistent_state.opponent_tracker, send_time)
+            frame = eagle_packet.frame_payload(
+                world.to_eagle_packet()
+            )
+            # print(frame_to_human(frame))
+
+            # Send the frame
+            ble_robot.send_frame(frame)
+            print("Packet set for transmission:", frame.hex())
+            print(f"BLE Status: client={ble_robot.ble_client is not None}, "
+                  f"sending={ble_robot._sending}, "
+                  f"pending={ble_robot._pending_frame is not None}")
+
+            # Record what was captured, seen and sent, after sending: queuing copies the images
+            if recorder is not None:
+                recorder.add_captures(captures)
+                recorder.add_world(send_time, world)
+                recorder.add_packet(send_time, frame)
+
+            # Create log entries with timestamps
+            log_entries = []
+            for number, (stream, capture) in enumerate(zip(streams, captures), start=1):
+                if capture is None:
+                    log_entries.append((send_time, common.format_time(send_time, f"Capture {number} stale - "
+                                                                                 f"{stream.statistics()}")))
+                    continue
+                log_entries += [
+                    (capture.time, common.format_time(capture.time, f"Capture {number} - {stream.statistics()}")),
+                    (capture.time, common.format_time(capture.time, f"Frame {number} - "
+                                                                    f"{capture.context.timing_summary()}")),
+                ]
+            skew = next((capture.skew for capture in captures if capture is not None), None)
+            log_entries += [
+                (send_time, common.format_time(send_time, f"Skew {(skew or 0.0) * 1000:.1f} ms - "
+                                                          f"{stream_set.statistics()}")),
+                (send_time, common.format_time(send_time, f"Send packet - render queue "
+                                                          f"{render_queue.statistics()}"))
+            ]
+            if recorder is not None:
+                log_entries.append((send_time, common.format_time(send_time, f"Recorder - {recorder.statistics()}")))
+            render_queue.put((captures, world, log_entries))
+
+            wait_for_new_frames(streams, captures)
+    except Exception:
+        traceback.print_exc()
+    finally:
+        stop.set()
+
+
+def wait_for_new_frames(streams, captures, timeout=0.2):
+    """
+    Don't analyse the same frames twice when the analysis is faster than the cameras. Without any live capture, wait
+    for the next frame of the first camera, so that a stalled set doesn't make the pose loop spin.
+    """
+    for stream, capture in zip(streams, captures):
+        if capture is not None:
+            stream.wait_for_frame(capture.seq, timeout)
+            return
+    streams[0].wait_for_frame(streams[0].frame_count, timeout)
+
+
 def main():
     # If the process is stuck, run `kill -USR1 <pid>` to dump the thread stack
     signal.signal(signal.SIGUSR1, dump_threads)
 
     common.run_hw_diagnostics()
-    stream_1, stream_2 = init_streams()
+    if detection.load_detector_profile("field"):
+        print(f"Using tuned detector profile {detection.detector_profile_path('field')}")
+    streams = init_streams()
+    stream_set = StreamSet(streams)
 
     screen, clock = init_pygame()
-    image_logger = ImageLogger()
+    image_logger = ImageLogger(quality=LOG_JPEG_QUALITY, scale=LOG_SCALE)
+    recorder = Recorder(quality=RECORD_JPEG_QUALITY, frame_interval=RECORD_FRAME_INTERVAL) if RECORD else None
 
     ble_robot.start_ble_thread(ble_robot.MacAddress.ROBOT)
 
+    # Stages: capture -> analyse -> send on the pose thread, at full rate; render on the main thread (pygame needs
+    # it), taking the newest result of the pose thread; JPEG logging on the ImageLogger encoder threads, recording on
+    # the Recorder thread
+    stop = threading.Event()
+    render_queue = LatestValue()  # (captures, world, log entries)
+    pose_thread = threading.Thread(target=pose_loop, args=(streams, stream_set, render_queue, stop, recorder),
+                                   name="pose", daemon=True)
+    pose_thread.start()
+
     try:
-        persistent_state = PersistentState()
-        running = True
         debug_mode = False
 
-        while running:
+        while not stop.is_set():
             # Check for events
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    running = False
+                    stop.set()
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_q or event.key == pygame.K_ESCAPE:  # Esc or Q to quit
-                        running = False
+                        stop.set()
                     if event.key == pygame.K_d:
                         debug_mode = not debug_mode
 
-            # Capture images
-            capture_1 = stream_1.capture()
-            capture_2 = stream_2.capture()
-
-            # Analyse camera frames
-            analyser = Analyser(capture_1, capture_2)
-            world, persistent_state = analyser.generate_world(persistent_state)
-
-            # Send Bluetooth frame as quickly as possible after capture
-            frame = eagle_packet.frame_payload(
-                world.to_eagle_packet()
-            )
-            # print(frame_to_human(frame))
-
-            # Send the frame
-            send_time = datetime.now()
-            ble_robot.send_frame(frame)
-            print("Packet set for transmission:", frame.hex())
-            print(f"BLE Status: client={ble_robot.ble_client is not None}, "
-                  f"sending={ble_robot._sending}, "
-                  f"pending={ble_robot._pending_frame is not None}")
-
-            # Create log entries with timestamps
-            log_entries = [
-                (capture_1.time, common.format_time(capture_1.time, f"Capture 1")),
-                (capture_2.time, common.format_time(capture_2.time, f"Capture 2")),
-                (send_time, common.format_time(send_time, f"Send packet"))
-            ]
+            # Newest analysed frame, if any since the last one drawn; the timeout keeps the window responsive
+            result = render_queue.get(timeout=0.1)
+            if result is None:
+                continue
+            captures, world, log_entries = result
 
             # Get robot logs and combine with our logs
             robot_logs = ble_robot.read_buffer()
-            all_logs = log_entries + robot_logs
+            render_time = datetime.now()
+            all_logs = log_entries + robot_logs + [
+                (render_time, common.format_time(render_time, f"Image logger - {image_logger.statistics()}"))]
 
-            # Draw the UI while the packet is being sent in the background
-            debug_board_img = board.draw_interface_debug(capture_1, capture_2, world, all_logs)
+            # Draw the UI while the pose thread moves on to the next frames
+            debug_board_img = board.draw_interface_debug(captures, world, all_logs)
             if debug_mode:
                 board_img = debug_board_img
             else:
                 board_img = board.draw_interface(world.team_color, world.score)
             show_cv_image(screen, board_img)
 
-            # Save logs
+            # Save logs, in the background
             image_logger.append(debug_board_img)
 
-            clock.tick(6)  # FPS
+            # The camera images are drawn: let the camera workers reuse their slots
+            for capture in captures:
+                if capture is not None:
+                    capture.release()
+
+            clock.tick(6)  # UI FPS; the poses are sent at the rate of the pose thread
 
     except KeyboardInterrupt:
         print("User interrupted the program.")
 
     finally:
+        stop.set()
+        pose_thread.join(timeout=2.0)
+        image_logger.close()
+        print(f"Render queue: {render_queue.statistics()}, image logger: {image_logger.statistics()}")
+        if recorder is not None:
+            recorder.close()
+            print(f"Recorder: {recorder.statistics()}")
+        stream_set.close()
         pygame.quit()
         print("Cleaning up...")
 
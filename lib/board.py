@@ -4,6 +4,14 @@ import os
 
 IMAGE_WIDTH, IMAGE_HEIGHT = 1920, 1080
 
+# Location of the camera insets in the debug interface, as (x, y, width, height)
+DEBUG_MINI_WIDTH = 800
+DEBUG_MINI_HEIGHT = (DEBUG_MINI_WIDTH * IMAGE_HEIGHT) // IMAGE_WIDTH
+DEBUG_CAPTURE_REGIONS = [
+    (100, 50, DEBUG_MINI_WIDTH, DEBUG_MINI_HEIGHT),
+    (IMAGE_WIDTH - DEBUG_MINI_WIDTH - 100, 50, DEBUG_MINI_WIDTH, DEBUG_MINI_HEIGHT),
+]
+
 
 def load_logo(width, height):
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -64,23 +72,35 @@ def draw_interface(team_color, score):
     return img
 
 
-def draw_interface_debug(capture_1, capture_2, world, log_lines):
+def draw_interface_debug(captures, world, log_lines):
+    """captures: one Capture per camera, or None for a camera without a fresh frame. The first two are drawn."""
     img = _draw_common_elements()
 
-    mini_width = 800
-    mini_height = (mini_width * IMAGE_HEIGHT) // IMAGE_WIDTH
-
     def insert_capture(image, x, y):
-        image = cv.resize(image, (mini_width, mini_height))
+        image = cv.resize(image, (DEBUG_MINI_WIDTH, DEBUG_MINI_HEIGHT))
         img[y:y + image.shape[0], x:x + image.shape[1]] = image
 
-    insert_capture(capture_1.debug_image(), 100, 50)
-    insert_capture(capture_2.debug_image(), IMAGE_WIDTH - mini_width - 100, 50)
-    insert_capture(world.debug_image(log_lines), (IMAGE_WIDTH - mini_width) // 2, 80 + mini_height)
+    for capture, region in zip(captures, DEBUG_CAPTURE_REGIONS):
+        if capture is not None:
+            insert_capture(capture.context.debug_overlay(), *region[:2])
+    insert_capture(world.debug_image(log_lines), (IMAGE_WIDTH - DEBUG_MINI_WIDTH) // 2, 80 + DEBUG_MINI_HEIGHT)
 
     return img
 
 
+def crop_debug_board(image, region):
+    """
+    Crop a region of a logged debug board, e.g. one of DEBUG_CAPTURE_REGIONS, at the size it has on a full-size
+    board. Boards logged downscaled (see ImageLogger) are cropped at their scale and resized back.
+    """
+    x, y, w, h = region
+    scale = image.shape[1] / IMAGE_WIDTH
+    if scale == 1:
+        return image[y:y + h, x:x + w]
+    crop = image[round(y * scale):round((y + h) * scale), round(x * scale):round((x + w) * scale)]
+    return cv.resize(crop, (w, h))
+
+
 def _draw_common_elements():
     img = np.ones((IMAGE_HEIGHT, IMAGE_WIDTH, 3), np.uint8) * 220
 
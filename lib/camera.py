@@ -4,6 +4,8 @@ import subprocess
 import numpy as np
 import yaml
 
+from lib import camera_discovery
+
 CAMERA_PROPERTIES = {
     cv.CAP_PROP_ZOOM: "Zoom",
     cv.CAP_PROP_FRAME_WIDTH: "Width",
@@ -99,6 +101,11 @@ ALL_CAMERA_PROPERTIES = {
 
 
 def camera_name(camera_index):
+    camera = camera_discovery.find_camera(camera_index)
+    if camera is not None:
+        return camera["name"]
+
+    # Fall back to udev for devices that are not described in sysfs
     cmd = f"udevadm info --name=/dev/video{camera_index}"
     result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
     if result.returncode != 0:
@@ -111,21 +118,11 @@ def camera_name(camera_index):
 
 
 def list_available_cameras():
-    saved_log_level = cv.getLogLevel()
-    cv.setLogLevel(0)  # Suppress errors when camera is not available
-
-    try:
-        def test_camera(index):
-            cap = cv.VideoCapture(index)
-            if cap.isOpened():
-                cap.release()
-                return {"index": index, "name": camera_name(index)}
-            return None
-
-        return [cam for cam in map(test_camera, range(10)) if cam]
-
-    finally:
-        cv.setLogLevel(saved_log_level)
+    """
+    Return the available cameras as dicts with "index", "name" and "usb_path" keys.
+    Read from sysfs and cached until a camera is plugged or unplugged, so it is cheap to poll.
+    """
+    return camera_discovery.list_cameras()
 
 
 def pick_camera():
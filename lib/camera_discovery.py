@@ -0,0 +1,102 @@
+import os
+import re
+
+# Camera discovery from sysfs metadata.
+#
+# Each V4L2 node is listed in /sys/class/video4linux/videoN, with a `device` symlink to its USB interface, e.g.
+#   /sys/devices/pci0000:00/0000:00:14.0/usb1/1-2/1-2:1.0
+# The parent directory (1-2) is the USB device, which holds the `product` and `serial` strings that udev reports
+# as ID_MODEL and ID_SERIAL_SHORT. Its name is the USB port path, which stays the same as long as the camera is
+# plugged into the same port, so it tells apart cameras that report the same serial.
+#
+# Nothing here opens a capture handle or spawns a process, so listing the cameras takes well under a millisecond.
+
+SYSFS_VIDEO4LINUX = "/sys/class/video4linux"
+
+_cache = None  # (sysfs_root, signature, cameras)
+
+
+def list_cameras(sysfs_root=SYSFS_VIDEO4LINUX):
+    """
+    Return the video capture devices as a list of dicts sorted by index:
+        {"index": 2, "name": "W4DS--SN0001", "usb_path": "1-2.3"}
+
+    The result is cached and only recomputed when a device is plugged or unplugged.
+    """
+    global _cache
+
+    signature = _signature(sysfs_root)
+    if _cache is not None and _cache[0] == sysfs_root and _cache[1] == signature:
+        return [dict(cam) for cam in _cache[2]]
+
+    cameras = []
+    for entry, device_path in signature:
+        camera = _read_camera(sysfs_root, entry, device_path)
+        if camera is not None:
+            cameras.append(camera)
+    cameras.sort(key=lambda cam: cam["index"])
+
+    _cache = sysfs_root, signature, cameras
+    return [dict(cam) for cam in cameras]
+
+
+def find_camera(camera_index, sysfs_root=SYSFS_VIDEO4LINUX):
+    """Return the camera dict for /dev/video<camera_index>, or None if it is not a known capture device."""
+    return next((cam for cam in list_cameras(sysfs_root) if cam["index"] == camera_index), None)
+
+
+def invalidate_cache():
+    global _cache
+    _cache = None
+
+
+def udev_string(value):
+    """Sanitize a USB descriptor string the way udev does for ID_MODEL and ID_SERIAL_SHORT."""
+    value = re.sub(r"\s+", "_", value.strip())
+    return re.sub(r"[^0-9A-Za-z#+\-.:=@_]", "_", value)
+
+
+def _signature(sysfs_root):
+    """List the (entry, device path) pairs of the V4L2 nodes. Changes whenever a device is (un)plugged."""
+    try:
+        entries = os.listdir(sysfs_root)
+    except FileNotFoundError:
+        return ()
+
+    signature = []
+    for entry in entries:
+        if not re.fullmatch(r"video\d+", entry):
+            continue
+        try:
+            device_path = os.path.realpath(os.path.join(sysfs_root, entry, "device"), strict=True)
+        except OSError:
+            continue  # Device removed while scanning
+        signature.append((entry, device_path))
+    return tuple(sorted(signature))
+
+
+def _read_camera(sysfs_root, entry, device_path):
+    # UVC cameras expose a capture node (index 0) and a metadata node (index 1) per device
+    if _read_attribute(os.path.join(sysfs_root, entry), "index") not in (None, "0"):
+        return None
+
+    # The node's device is a USB interface (1-2:1.0), whose parent is the USB device (1-2)
+    usb_device_path = os.path.dirname(device_path)
+    model = _read_attribute(usb_device_path, "product") or _read_attribute(usb_device_path, "idProduct")
+    serial = _read_attribute(usb_device_path, "serial")
+    if model is None or serial is None:
+        return None
+
+    return {
+        "index": int(entry[len("video"):]),
+        "name": udev_string(model) + "--" + udev_string(serial),
+        "usb_path": os.path.basename(usb_device_path),
+    }
+
+
+def _read_attribute(path, name):
+    try:
+        with open(os.path.join(path, name), "r") as file:
+            return file.read().strip()
+    except OSError:
+        return None
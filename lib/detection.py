@@ -1,15 +1,500 @@
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
 import cv2 as cv
+import numpy as np
+import yaml
+
+from lib import vision
+
+# Named detector settings: ArUco dictionary and DetectorParameters overrides.
+# Optional keys: "backend" (see DETECTION_BACKENDS, "aruco" by default), "scale" (see `detect_markers`),
+# "marker_ids" to restrict the dictionary to some of its markers and "max_correction_bits" to override the error
+# correction of such a restricted dictionary.
+# Any of them can be overridden without editing code in detector-settings/<profile>.yaml, see `load_detector_profile`.
+DETECTOR_PROFILES = {
+    # Field, tin can and opponent markers seen by the mast cameras
+    "field": {"dictionary": cv.aruco.DICT_4X4_250, "params": {"minMarkerPerimeterRate": 0.003}},
+    # Same, but only identifies the markers we use, see 15_detection_benchmark.py
+    "field_restricted": {"dictionary": cv.aruco.DICT_4X4_250, "params": {"minMarkerPerimeterRate": 0.003},
+                         "marker_ids": vision.USED_MARKER_IDS},
+    # Markers on top of our robot
+    "robot": {"dictionary": cv.aruco.DICT_4X4_250, "params": {"minMarkerPerimeterRate": 0.003}},
+    # ChArUco calibration board, see 05_calibrate.py
+    "calibration": {"dictionary": cv.aruco.DICT_6X6_250, "params": {}},
+}
+
+# Detector pool: each thread owns one long-lived ArucoDetector per profile, so detectors are never shared between
+# threads and no locking is needed on the hot path.
+_thread_detectors = threading.local()
+_profiles_generation = 0  # Bumped when a profile changes, to rebuild the detectors of every thread
+
+
+# Detection backends. A backend is a function (dictionary, DetectorParameters) -> detector, where the detector has
+# a `detectMarkers(image)` method returning (corners, ids, rejected) like cv.aruco.ArucoDetector.
+DETECTION_BACKENDS = {}
+
+
+def detection_backend(name):
+    """Register a detection backend under a name usable in the "backend" key of the profiles."""
+
+    def decorator(func):
+        DETECTION_BACKENDS[name] = func
+        return func
+
+    return decorator
+
+
+@detection_backend("aruco")
+def _build_aruco_backend(aruco_dict, aruco_params):
+    """Classic ArUco: adaptive threshold sweep and quad search at full resolution."""
+    return cv.aruco.ArucoDetector(aruco_dict, aruco_params)
 
 
-def build_aruco_detector():
-    aruco_dict = cv.aruco.getPredefinedDictionary(cv.aruco.DICT_4X4_250)
+@detection_backend("aruco3")
+def _build_aruco3_backend(aruco_dict, aruco_params):
+    """
+    ArUco3 fast mode: the image is downscaled so that the smallest marker we care about, whose side is
+    minMarkerLengthRatioOriginalImg × the image size, shrinks to minSideLengthCanonicalImg pixels, and a single
+    threshold pass runs on it. The default ratio keeps the 7 cm opponent tags, ~30 px wide at 3 m on a 1080p frame.
+    """
+    aruco_params.useAruco3Detection = True
+    if aruco_params.minMarkerLengthRatioOriginalImg == 0:
+        aruco_params.minMarkerLengthRatioOriginalImg = 0.015
+        aruco_params.minSideLengthCanonicalImg = 16
+    return cv.aruco.ArucoDetector(aruco_dict, aruco_params)
+
+
+@detection_backend("apriltag")
+def _build_apriltag_backend(aruco_dict, aruco_params):
+    """
+    AprilTag quad detection (decimated edge clustering and line fitting) instead of the contour search. Works with
+    the AprilTag dictionaries (DICT_APRILTAG_*) as well as with our ArUco markers.
+    """
+    aruco_params.cornerRefinementMethod = cv.aruco.CORNER_REFINE_APRILTAG
+    return cv.aruco.ArucoDetector(aruco_dict, aruco_params)
+
+
+def build_aruco_detector(profile="field", size_scale=1):
+    settings = DETECTOR_PROFILES[profile]
+    return build_detector(settings["dictionary"], settings["params"], marker_ids=settings.get("marker_ids"),
+                          max_correction_bits=settings.get("max_correction_bits"),
+                          backend=settings.get("backend", "aruco"), size_scale=size_scale)
+
+
+# DetectorParameters given as a fraction of the largest image dimension
+RELATIVE_SIZE_PARAMS = ("minMarkerPerimeterRate", "maxMarkerPerimeterRate", "minMarkerLengthRatioOriginalImg")
+
+
+def build_detector(dictionary, params, marker_ids=None, max_correction_bits=None, backend="aruco", size_scale=1):
+    """
+    Build a detector from a predefined dictionary and DetectorParameters overrides, with one of the
+    DETECTION_BACKENDS. With `marker_ids`, only these markers of the dictionary are identified
+    (see `build_restricted_dictionary`).
+
+    size_scale: multiplies the RELATIVE_SIZE_PARAMS, for a detector run on crops of the images the parameters were
+                tuned for: the full image size divided by the crop size keeps the same limits in pixels.
+    """
     aruco_params = cv.aruco.DetectorParameters()
-    aruco_params.minMarkerPerimeterRate = 0.003
+    for name, value in params.items():
+        setattr(aruco_params, name, value)
     # common.print_fields(aruco_params)
-    detector = cv.aruco.ArucoDetector(aruco_dict, aruco_params)
+
+    if marker_ids is None:
+        aruco_dict = cv.aruco.getPredefinedDictionary(dictionary)
+    else:
+        aruco_dict = build_restricted_dictionary(dictionary, marker_ids, max_correction_bits)
+    detector = DETECTION_BACKENDS[backend](aruco_dict, aruco_params)
+
+    if size_scale != 1:
+        # After the backend, which may set some of these parameters itself
+        scaled_params = detector.getDetectorParameters()
+        for name in RELATIVE_SIZE_PARAMS:
+            setattr(scaled_params, name, getattr(scaled_params, name) * size_scale)
+        detector.setDetectorParameters(scaled_params)
+
+    if marker_ids is None:
+        return detector
+    return RestrictedArucoDetector(detector, marker_ids)
+
+
+def build_restricted_dictionary(dictionary, marker_ids, max_correction_bits=None):
+    """
+    Build a custom dictionary holding only the codewords of `marker_ids` from a predefined dictionary.
+
+    Each candidate is compared to fewer codewords, and bit patterns of markers we don't use can't be misread as
+    ours. The error correction defaults to what the minimum distance between the kept codewords allows; a higher
+    `max_correction_bits` accepts more damaged markers at the cost of false positives.
+    """
+    base = cv.aruco.getPredefinedDictionary(dictionary)
+    bytes_list = base.bytesList[list(marker_ids)]
+    if max_correction_bits is None:
+        max_correction_bits = (min_codeword_distance(bytes_list, base.markerSize) - 1) // 2
+    return cv.aruco.Dictionary(bytes_list, base.markerSize, max_correction_bits)
+
+
+def min_codeword_distance(bytes_list, marker_size):
+    """Minimum Hamming distance between the codewords of a dictionary, in any rotation, and with themselves rotated."""
+    bits = np.array([cv.aruco.Dictionary.getBitsFromByteList(bytes_list[i:i + 1], marker_size)
+                     for i in range(len(bytes_list))]).reshape(len(bytes_list), -1)
+    rotations = np.array([[np.rot90(b.reshape(marker_size, marker_size), k).ravel() for k in range(4)]
+                          for b in bits])  # (N, 4, bits)
+
+    distances = (bits[:, None, None, :] != rotations[None, :, :, :]).sum(axis=3)  # (N, N, 4)
+    # A codeword compared with itself only counts in its rotated versions
+    distances[np.arange(len(bits)), np.arange(len(bits)), 0] = bits.shape[1] + 1
+    return int(distances.min())
+
+
+class RestrictedArucoDetector:
+    """ArucoDetector over a restricted dictionary, reporting the marker IDs of the original dictionary."""
+
+    def __init__(self, detector, marker_ids):
+        self.detector = detector
+        self.marker_ids = np.asarray(marker_ids, dtype=np.int32)
+
+    def detectMarkers(self, image):
+        corners, ids, rejected = self.detector.detectMarkers(image)
+        if ids is not None:
+            ids = self.marker_ids[ids]
+        return corners, ids, rejected
+
+
+def get_aruco_detector(profile="field", size_scale=1):
+    """
+    Return the calling thread's detector for the profile, built on first use and reused afterwards. Detectors with
+    another `size_scale` (see `build_detector`) are pooled separately.
+    """
+    if getattr(_thread_detectors, "generation", None) != _profiles_generation:
+        _thread_detectors.generation = _profiles_generation
+        _thread_detectors.detectors = {}
+
+    key = (profile, size_scale)
+    detector = _thread_detectors.detectors.get(key)
+    if detector is None:
+        detector = build_aruco_detector(profile, size_scale)
+        _thread_detectors.detectors[key] = detector
     return detector
 
 
+def detect_markers(image, profile="field", scale=None, size_scale=1):
+    """
+    Detect markers with the pooled detector of the profile. Returns (corners, ids).
+
+    scale: when > 1, markers are searched in an image downscaled by this factor and their corners are refined at
+    full resolution (see `detect_markers_pyramid`). Defaults to the "scale" of the profile, or 1.
+    size_scale: for a crop of a larger image, that image size divided by the crop size (see `build_detector`).
+    """
+    if scale is None:
+        scale = DETECTOR_PROFILES[profile].get("scale", 1)
+    if scale > 1:
+        return detect_markers_pyramid(image, scale, profile, size_scale=size_scale)
+
+    corners, ids, _rejected = get_aruco_detector(profile, size_scale).detectMarkers(image)
+    return corners, ids
+
+
+def detect_markers_pyramid(image, scale=2, profile="field", small=None, size_scale=1):
+    """
+    Find markers on a grayscale image downscaled by `scale`, then refine their corners with sub-pixel accuracy on
+    the full-resolution image.
+
+    Thresholding and the quad search, which dominate the detection cost, run on scale² fewer pixels, while the
+    returned corners keep the accuracy of a full-resolution detection. Markers smaller than ~scale × the minimum
+    marker size may be missed.
+
+    small: the grayscale image already downscaled by `scale` with INTER_AREA, if the caller has it.
+    """
+    gray = image if image.ndim == 2 else cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    height, width = gray.shape
+    if small is None:
+        small = cv.resize(gray, (width // scale, height // scale), interpolation=cv.INTER_AREA)
+
+    small_corners, ids, _rejected = get_aruco_detector(profile, size_scale).detectMarkers(small)
+    if ids is None or len(ids) == 0:
+        return small_corners, ids
+
+    # Map the corners to full-resolution pixel centres, then refine them
+    points = np.concatenate(small_corners).reshape(-1, 2)
+    points = ((points + 0.5) * [width / (width // scale), height / (height // scale)] - 0.5).astype(np.float32)
+    window = (scale + 2, scale + 2)
+    criteria = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+    cv.cornerSubPix(gray, points, window, (-1, -1), criteria)
+
+    corners = tuple(points.reshape(-1, 1, 4, 2))
+    return corners, ids
+
+
+def detector_profile_path(profile):
+    return f"detector-settings/{profile}.yaml"
+
+
+def load_detector_profile(profile, path=None):
+    """
+    Override the settings of a profile with detector-settings/<profile>.yaml, as saved by 16_tune_detector.py or
+    written by hand. Keys missing from the file keep their current value, e.g. a file holding only
+    `backend: aruco3` switches the backend. Returns False, leaving the profile unchanged, if there is no such file.
+    """
+    try:
+        with open(path or detector_profile_path(profile), 'r') as file:
+            overrides = yaml.safe_load(file) or {}
+    except FileNotFoundError:
+        return False
+
+    settings = {**DETECTOR_PROFILES.get(profile, {}), **overrides}
+    settings.pop("tuning", None)
+    if isinstance(settings["dictionary"], str):
+        settings["dictionary"] = getattr(cv.aruco, settings["dictionary"])
+    set_detector_profile(profile, **settings)
+    return True
+
+
+def dictionary_name(dictionary):
+    """Return the name of a predefined dictionary, e.g. "DICT_4X4_250"."""
+    return next(name for name in dir(cv.aruco) if name.startswith("DICT_") and getattr(cv.aruco, name) == dictionary)
+
+
+def set_detector_profile(profile, dictionary, params, scale=1, marker_ids=None, max_correction_bits=None,
+                         backend="aruco"):
+    """Add or replace a profile. Detectors already built from the previous settings are discarded."""
+    global _profiles_generation
+    if backend not in DETECTION_BACKENDS:
+        raise ValueError(f"Unknown detection backend '{backend}', expected one of {list(DETECTION_BACKENDS)}")
+    DETECTOR_PROFILES[profile] = {"dictionary": dictionary, "params": dict(params), "scale": scale,
+                                  "marker_ids": marker_ids, "max_correction_bits": max_correction_bits,
+                                  "backend": backend}
+    _profiles_generation += 1
+
+
+TILE_THREADS = os.cpu_count() or 1  # Threads of the pool shared by all the tiled detections
+_tile_executor = None  # Created on first use
+_tile_executor_lock = threading.Lock()
+
+
+def detect_markers_tiled(image, tiles=(2, 2), overlap=160, workers=None, profile="field"):
+    """
+    Split the image into overlapping tiles and detect markers in each tile on a pool of worker threads.
+
+    OpenCV releases the GIL during detection, and every worker uses its own pooled detector, whose relative marker
+    size limits are scaled to the tile size so that they match those of a full-frame detection in pixels. Markers
+    found twice in an overlap zone are merged. Returns (corners, ids) as `detect_markers` does.
+
+    tiles: number of (columns, rows).
+    overlap: width of the band shared by two neighbouring tiles, in pixels. Must be larger than the biggest
+             marker, so that every marker lies entirely inside at least one tile.
+    workers: number of tiles detected at once; defaults to one per tile, capped to TILE_THREADS.
+    """
+    height, width = image.shape[:2]
+    columns, rows = tiles
+    windows = []
+    for row in range(rows):
+        for column in range(columns):
+            x0 = max(0, column * width // columns - overlap // 2)
+            x1 = min(width, (column + 1) * width // columns + overlap // 2)
+            y0 = max(0, row * height // rows - overlap // 2)
+            y1 = min(height, (row + 1) * height // rows + overlap // 2)
+            windows.append((x0, y0, x1, y1))
+
+    def detect_tile(window):
+        x0, y0, x1, y1 = window
+        # Rounded, so that the few tile sizes of a grid share their detectors
+        size_scale = round(max(height, width) / max(y1 - y0, x1 - x0), 2)
+        corners, ids = detect_markers(image[y0:y1, x0:x1], profile, scale=1, size_scale=size_scale)
+        if ids is None:
+            return []
+        offset = np.array([x0, y0], dtype=np.float32)
+        return [(corner + offset, marker_id) for corner, marker_id in zip(corners, ids)]
+
+    # Each lane detects every workers-th tile, which bounds the concurrency of this call on the shared pool
+    workers = min(workers or len(windows), len(windows), TILE_THREADS)
+    lanes = [_tile_pool().submit(lambda lane: [detect_tile(window) for window in windows[lane::workers]], lane)
+             for lane in range(workers)]
+    lane_results = [lane.result() for lane in lanes]
+    results = [lane_results[index % workers][index // workers] for index in range(len(windows))]
+
+    # Merge the markers seen in several tiles: same ID and centres closer than half the marker size
+    corners, ids, centres = [], [], []
+    for corner, marker_id in (marker for markers in results for marker in markers):
+        centre = corner.reshape(4, 2).mean(axis=0)
+        size = np.linalg.norm(corner.reshape(4, 2)[0] - corner.reshape(4, 2)[2])
+        if any(other_id[0] == marker_id[0] and np.linalg.norm(other_centre - centre) < size / 2
+               for other_id, other_centre in zip(ids, centres)):
+            continue
+        corners.append(corner)
+        ids.append(marker_id)
+        centres.append(centre)
+
+    if not ids:
+        return (), None
+    return tuple(corners), np.array(ids, dtype=np.int32).reshape(-1, 1)
+
+
+def _tile_pool():
+    global _tile_executor
+    with _tile_executor_lock:
+        if _tile_executor is None:
+            _tile_executor = ThreadPoolExecutor(max_workers=TILE_THREADS, thread_name_prefix="aruco-tile")
+        return _tile_executor
+
+
+class TrackedDetector:
+    """
+    Detect markers only around the places they were found in the previous frame.
+
+    Markers barely move between two frames, so instead of searching the whole image, detection runs in padded
+    windows around the previous corners (and around any hint, e.g. corners projected from the last known robot
+    poses) and the corners are mapped back to full-frame coordinates. A full-frame pass still runs every
+    `full_frame_interval` frames, and immediately whenever a tracked marker is lost.
+    """
+
+    def __init__(self, profile="field", full_frame_interval=10, padding=0.75, min_padding=30):
+        """
+        padding: window margin around a marker, as a fraction of the marker's size.
+        min_padding: minimum window margin, in pixels.
+        """
+        self.profile = profile
+        self.full_frame_interval = full_frame_interval
+        self.padding = padding
+        self.min_padding = min_padding
+
+        self.previous = None  # (corners, ids) of the previous frame
+        self._hints = []
+        self._frames_since_full = 0
+
+        # Timing statistics, in seconds
+        self.full_frame_time = None  # Moving average of full-frame detections
+        self.tracked_time = None  # Moving average of tracked detections
+        self.last_speedup = None  # Full-frame time / time of the last tracked detection
+        self.frame_count = 0
+        self.full_frame_count = 0
+
+    def hint(self, image_points):
+        """Add an (N,2) array of image points around which to search in the next frame."""
+        self._hints.append(np.asarray(image_points, dtype=np.float32).reshape(-1, 2))
+
+    def detect(self, image):
+        """Detect markers. Returns (corners, ids) as `detect_markers` does."""
+        self.frame_count += 1
+        hints, self._hints = self._hints, []
+
+        if self.previous is None or self.previous[1] is None or self._frames_since_full >= self.full_frame_interval:
+            return self._full_frame(image)
+
+        start = perf_counter()
+        corners, ids = self._detect_in_windows(image, self._windows(image.shape, hints))
+        elapsed = perf_counter() - start
+
+        if self._lost_marker(ids):
+            return self._full_frame(image)
+
+        self._frames_since_full += 1
+        self.tracked_time = _moving_average(self.tracked_time, elapsed)
+        self.last_speedup = self.full_frame_time / elapsed if self.full_frame_time and elapsed > 0 else None
+        self.previous = corners, ids
+        return self.previous
+
+    def statistics(self):
+        """Return a one-line summary of the tracked and full-frame detection costs."""
+        if self.tracked_time is None or self.full_frame_time is None:
+            return f"{self.full_frame_count}/{self.frame_count} full-frame detections"
+        return (f"tracked {self.tracked_time * 1000:.1f} ms vs full frame {self.full_frame_time * 1000:.1f} ms "
+                f"({self.full_frame_time / self.tracked_time:.1f}x), "
+                f"{self.full_frame_count}/{self.frame_count} full-frame detections")
+
+    def _full_frame(self, image):
+        start = perf_counter()
+        self.previous = detect_markers(image, self.profile)
+        self.full_frame_time = _moving_average(self.full_frame_time, perf_counter() - start)
+        self.full_frame_count += 1
+        self._frames_since_full = 0
+        self.last_speedup = 1.0
+        return self.previous
+
+    def _windows(self, shape, hints):
+        """Padded bounding boxes (x0, y0, x1, y1) around the previous markers and the hints, merged when they
+        overlap so that each marker lies entirely inside one window."""
+        height, width = shape[:2]
+        boxes = []
+        for points in [corner.reshape(-1, 2) for corner in self.previous[0]] + hints:
+            if len(points) == 0:
+                continue
+            x0, y0 = points.min(axis=0)
+            x1, y1 = points.max(axis=0)
+            margin = max(self.min_padding, self.padding * max(x1 - x0, y1 - y0))
+            boxes.append([max(0, int(x0 - margin)), max(0, int(y0 - margin)),
+                          min(width, int(x1 + margin) + 1), min(height, int(y1 + margin) + 1)])
+
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(boxes)):
+                for j in range(i + 1, len(boxes)):
+                    a, b = boxes[i], boxes[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        boxes[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                        del boxes[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return [box for box in boxes if box[2] > box[0] and box[3] > box[1]]
+
+    def _detect_in_windows(self, image, windows):
+        corners, ids = [], []
+        for x0, y0, x1, y1 in windows:
+            window_corners, window_ids = detect_markers(image[y0:y1, x0:x1], self.profile)
+            if window_ids is None:
+                continue
+            offset = np.array([x0, y0], dtype=np.float32)
+            corners.extend(corner + offset for corner in window_corners)
+            ids.append(window_ids)
+
+        if not ids:
+            return (), None
+        return tuple(corners), np.concatenate(ids)
+
+    def _lost_marker(self, ids):
+        previous_counts = Counter(int(i) for i in self.previous[1].ravel())
+        counts = Counter(int(i) for i in ids.ravel()) if ids is not None else Counter()
+        return any(counts[marker_id] < count for marker_id, count in previous_counts.items())
+
+
+def _moving_average(average, value, alpha=0.2):
+    return value if average is None else (1 - alpha) * average + alpha * value
+
+
+def match_detections(reference, candidate):
+    """
+    Pair each reference marker with the candidate marker of the same ID whose centre is the closest.
+    Both arguments are (corners, ids) detections. Returns a list of (reference_index, candidate_index) pairs.
+    """
+    ref_corners, ref_ids = reference
+    corners, ids = candidate
+    ref_ids = [] if ref_ids is None else [int(i) for i in np.ravel(ref_ids)]
+    ids = [] if ids is None else [int(i) for i in np.ravel(ids)]
+
+    available = list(range(len(ids)))
+    pairs = []
+    for ref_index, (ref_corner, ref_id) in enumerate(zip(ref_corners, ref_ids)):
+        ref_points = ref_corner.reshape(4, 2)
+        best, best_distance = None, None
+        for k in available:
+            if ids[k] != ref_id:
+                continue
+            distance = np.linalg.norm(corners[k].reshape(4, 2).mean(axis=0) - ref_points.mean(axis=0))
+            if best is None or distance < best_distance:
+                best, best_distance = k, distance
+        # A marker further than its own size is another marker with the same ID
+        if best is None or best_distance > np.linalg.norm(ref_points[0] - ref_points[2]):
+            continue
+        available.remove(best)
+        pairs.append((ref_index, best))
+    return pairs
+
+
 def draw_aruco_markers(image, corners, ids):
     if ids is None or len(ids) == 0:
         return
@@ -0,0 +1,70 @@
+import os
+import re
+import shutil
+import threading
+from collections import deque
+
+MB = 1024 * 1024
+
+
+class DiskBudget:
+    """
+    Keep the session folders (YYYYMMDD_HHMMSS) of a root folder within disk budgets.
+
+    Once the current session or all the sessions together exceed their budget, the oldest other sessions, then the
+    oldest deletable files of the current session, are deleted. Thread-safe.
+    """
+
+    def __init__(self, root, session_path, session_budget_mb, total_budget_mb):
+        self.session_path = session_path
+        self.session_budget = session_budget_mb * MB
+        self.total_budget = total_budget_mb * MB
+
+        self.session_bytes = 0
+        self.deleted = 0  # Files and sessions deleted to stay within the budgets
+
+        self._lock = threading.Lock()
+        self._session_files = deque()  # (path, size) of the deletable files of this session, oldest first
+        self._other_sessions = self._list_other_sessions(root)  # [(path, size)], oldest first
+        self._other_sessions_bytes = sum(size for _, size in self._other_sessions)
+
+    def add(self, size, path=None):
+        """
+        Account for `size` bytes written to the session, and enforce the budgets. `path` is the file holding them if
+        it may be deleted to stay within the budgets; the bytes of other files only count.
+        """
+        with self._lock:
+            self.session_bytes += size
+            if path is not None:
+                self._session_files.append((path, size))
+            self._enforce()
+
+    def statistics(self):
+        return f"session {self.session_bytes / MB:.0f}/{self.session_budget / MB:.0f} MB"
+
+    def _enforce(self):
+        while (self.session_bytes > self.session_budget or
+               self.session_bytes + self._other_sessions_bytes > self.total_budget):
+            if self.session_bytes <= self.session_budget and self._other_sessions:
+                path, size = self._other_sessions.pop(0)
+                self._other_sessions_bytes -= size
+                shutil.rmtree(path, ignore_errors=True)
+            elif self._session_files:
+                path, size = self._session_files.popleft()
+                self.session_bytes -= size
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            else:
+                return
+            self.deleted += 1
+
+    def _list_other_sessions(self, root):
+        sessions = []
+        # Session folders only (YYYYMMDD_HHMMSS), whose names sort chronologically
+        for entry in sorted(os.scandir(root), key=lambda entry: entry.name):
+            if entry.is_dir() and re.fullmatch(r"\d{8}_\d{6}", entry.name) and entry.path != self.session_path:
+                size = sum(file.stat().st_size for file in os.scandir(entry.path) if file.is_file())
+                sessions.append((entry.path, size))
+        return sessions
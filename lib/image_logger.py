@@ -1,21 +1,108 @@
 import cv2 as cv
 import os
+import threading
+from collections import deque
 from datetime import datetime
 
+from lib.disk_budget import DiskBudget
+
+LOGS_FOLDER = 'logs'
+
 
 class ImageLogger:
-    def __init__(self):
+    """
+    Save images to logs/<session>/HHMMSS_ffffff.jpg in the background.
+
+    `append()` only queues the image: encoder threads downscale it, JPEG-encode it (OpenCV releases the GIL) and
+    write it. When they fall behind, e.g. on a slow SD card, the queue keeps the newest `queue_size` images and the
+    oldest ones are dropped. Once the session or all the sessions together exceed their disk budget, the oldest
+    sessions, then the oldest images of the current session, are deleted.
+    """
+
+    def __init__(self, quality=90, scale=1.0, queue_size=4, workers=2, session_budget_mb=2048, total_budget_mb=8192,
+                 root=LOGS_FOLDER):
+        """
+        quality: JPEG quality, 0-100.
+        scale: downscale factor applied before encoding, e.g. 0.5 for 960x540 images from 1920x1080 boards.
+        queue_size: images waiting to be encoded beyond which the oldest are dropped.
+        workers: encoder threads.
+        session_budget_mb, total_budget_mb: disk budgets of this session and of all the sessions in `root`.
+        """
+        self.quality = quality
+        self.scale = scale
+        self.root = root
         self.folder_path = self._create_folder()
         print(f"Logging to {self.folder_path}")
 
+        # Statistics
+        self.logged = 0
+        self.dropped = 0
+
+        self._queue = deque(maxlen=queue_size)  # (time, image), oldest first
+        self._condition = threading.Condition()
+        self._running = True
+        self._busy = 0  # Images being encoded or written
+        self._budget = DiskBudget(root, self.folder_path, session_budget_mb, total_budget_mb)
+
+        self._threads = [threading.Thread(target=self._encode_loop, name=f"image-logger-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
     def append(self, image):
-        now = datetime.now()
-        filename = now.strftime('%H%M%S_') + f'{now.microsecond // 1000:03d}' + '.jpg'
+        """Queue an image for logging, without blocking. The image must not be modified afterwards."""
+        with self._condition:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1  # The deque drops the oldest image
+            self._queue.append((datetime.now(), image))
+            self._condition.notify()
+
+    def close(self, timeout=5.0):
+        """Write the queued images, within `timeout` seconds, and stop the encoder threads."""
+        with self._condition:
+            self._condition.wait_for(lambda: not self._queue and not self._busy, timeout)
+            self._running = False
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+
+    def statistics(self):
+        return (f"{self.logged} images logged, {self.dropped} dropped, {self._budget.deleted} deleted, "
+                f"{self._budget.statistics()}")
+
+    def _encode_loop(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or not self._running)
+                if not self._queue:
+                    return
+                time, image = self._queue.popleft()
+                self._busy += 1
+
+            try:
+                if self.scale != 1.0:
+                    image = cv.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv.INTER_AREA)
+                ok, data = cv.imencode('.jpg', image, [cv.IMWRITE_JPEG_QUALITY, self.quality])
+                if ok:
+                    self._write(time, data)
+            finally:
+                with self._condition:
+                    self._busy -= 1
+                    self._condition.notify_all()
+
+    def _write(self, time, data):
+        # Microseconds: the encoders run concurrently, and two images may be appended within a millisecond
+        filename = time.strftime('%H%M%S_%f') + '.jpg'
         path = os.path.join(self.folder_path, filename)
-        cv.imwrite(path, image)
+        with open(path, 'wb') as file:
+            file.write(data)
+
+        with self._condition:
+            self.logged += 1
+        self._budget.add(len(data), path)
 
     def _create_folder(self):
         now = datetime.now()
-        folder_path = os.path.join('logs', now.strftime('%Y%m%d_%H%M%S'))
+        folder_path = os.path.join(self.root, now.strftime('%Y%m%d_%H%M%S'))
         os.makedirs(folder_path)
         return folder_path
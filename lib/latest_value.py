@@ -0,0 +1,46 @@
+import threading
+
+
+class LatestValue:
+    """
+    One-slot queue between two threads running at different rates.
+
+    `put()` never blocks: it replaces any value the consumer hasn't taken yet, which is counted as dropped. The
+    consumer therefore always gets the newest value, and a slow consumer never holds back the producer.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._value = None
+        self._pending = False
+        self._closed = False
+
+        self.put_count = 0
+        self.dropped = 0
+
+    def put(self, value):
+        with self._condition:
+            if self._pending:
+                self.dropped += 1
+            self._value = value
+            self._pending = True
+            self.put_count += 1
+            self._condition.notify_all()
+
+    def get(self, timeout=None):
+        """Wait for a value that wasn't taken yet and take it. Return None on timeout, or once closed."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending or self._closed, timeout)
+            if not self._pending:
+                return None
+            value, self._value, self._pending = self._value, None, False
+            return value
+
+    def close(self):
+        """Wake up the consumer: `get()` returns the pending value if any, then None."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def statistics(self):
+        return f"{self.put_count} values, {self.dropped} dropped"
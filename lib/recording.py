@@ -0,0 +1,415 @@
+import os
+import struct
+import threading
+from collections import deque, namedtuple
+from datetime import datetime
+from time import monotonic
+
+import cv2 as cv
+import numpy as np
+
+from lib.disk_budget import DiskBudget
+
+# Recording of the raw camera frames and of what was made of them, for post-match analysis.
+#
+# A recording is a folder, recordings/YYYYMMDD_HHMMSS/, holding:
+#   camera<N>_<chunk>.mjpg  the JPEG frames of camera N, concatenated (a plain MJPEG stream), in chunks of at most
+#                           CHUNK_BYTES; the oldest chunks are deleted to stay within the disk budgets
+#   camera<N>.idx           one FRAME_INDEX_DTYPE entry (chunk, offset, length) per frame number of camera N; the
+#                           length of a frame dropped before being written is 0
+#   events.bin              the sidecar: EVENTS_MAGIC, then one record per event, an EVENT_HEADER (kind, camera,
+#                           time, payload length) followed by its payload, see the EVENT_* kinds
+#   index.bin               one INDEX_DTYPE entry (time, offset of the record in events.bin) per record, so that a
+#                           time is found by binary search without reading the rest
+#
+# The events are written in the order they were recorded, which follows their times to within REORDER_WINDOW: the
+# frames of a pose iteration may be older than the packet sent by the previous one. The index times are the latest
+# time recorded so far, so that they never decrease, and seeking never skips an event at or after the time sought.
+#
+# Times are POSIX timestamps. Cameras are numbered from 1, in the order of the streams of the competition loop.
+
+RECORDINGS_FOLDER = 'recordings'
+CHUNK_BYTES = 64 * 1024 * 1024
+REORDER_WINDOW = 1.0  # Seconds
+EVENTS_MAGIC = b'EREC\x02\x00\x00\x00'
+
+EVENT_HEADER = struct.Struct('<BBxxdI')  # kind, camera, time, payload length
+EVENT_FRAME = 1  # FRAME_PAYLOAD
+EVENT_DETECTIONS = 2  # DETECTION_PAYLOAD per marker
+EVENT_CAMERA_POSE = 3  # CAMERA_POSE_PAYLOAD
+EVENT_WORLD = 4  # WORLD_PAYLOAD, for the robots; camera is 0
+EVENT_PACKET = 5  # The bytes sent to the robot; camera is 0
+
+FRAME_PAYLOAD = struct.Struct('<II')  # sequence number in the stream, frame number in camera<N>.idx
+DETECTION_PAYLOAD = struct.Struct('<H8f')  # marker ID, 4 (x, y) corners
+CAMERA_POSE_PAYLOAD = struct.Struct('<7d')  # rvec, tvec, reprojection error (NaN if unknown)
+WORLD_PAYLOAD = struct.Struct('<BB6d')  # robot detected, opponent detected, robot (x, y, theta), opponent (x, y, theta)
+INDEX_DTYPE = np.dtype([('time', '<f8'), ('offset', '<u8')])
+FRAME_INDEX_DTYPE = np.dtype([('chunk', '<u4'), ('offset', '<u8'), ('length', '<u4')])
+
+Event = namedtuple('Event', 'kind camera time data')
+Frame = namedtuple('Frame', 'camera time seq image')
+
+_EVENTS_QUEUE = 0  # Queue of the events; the frames of camera N go to queue N
+
+
+class Recorder:
+    """
+    Record camera frames and events to a new recording folder, in the background.
+
+    The add_* methods only queue. Each camera has an encoder thread, which JPEG-encodes its frames (OpenCV releases
+    the GIL) and appends them to its chunks, and the events have a writer thread. When a thread falls behind, the
+    oldest entries of its queue are dropped, and counted. Frames are queued as JPEG bytes when the caller has them
+    (no re-encoding), else as a copy of the image.
+
+    Once the recording or all the recordings together exceed their disk budget, the oldest recordings, then the
+    oldest chunks of this one, are deleted as for ImageLogger. The sidecar and the indexes are kept.
+    """
+
+    def __init__(self, quality=90, frame_interval=0.2, frame_queue_size=4, event_queue_size=256, session_budget_mb=4096,
+                 total_budget_mb=16384, chunk_bytes=CHUNK_BYTES, root=RECORDINGS_FOLDER):
+        """
+        quality: JPEG quality, 0-100, of the frames queued as images.
+        frame_interval: minimum seconds between two frames of a camera recorded by `add_captures`, whose detections
+            and poses are all recorded. The default, 5 frames per second, is below the pose rate.
+        frame_queue_size, event_queue_size: entries waiting in each camera queue, and in the event queue, beyond which
+            the oldest are dropped.
+        session_budget_mb, total_budget_mb: disk budgets of this recording and of all the recordings in `root`.
+        chunk_bytes: size beyond which a camera starts a new chunk, the unit deleted to stay within the budgets.
+        """
+        self.quality = quality
+        self.frame_interval = frame_interval
+        self.frame_queue_size = frame_queue_size
+        self.chunk_bytes = chunk_bytes
+        self.folder_path = os.path.join(root, datetime.now().strftime('%Y%m%d_%H%M%S'))
+        os.makedirs(self.folder_path)
+        print(f"Recording to {self.folder_path}")
+
+        # Statistics
+        self.recorded = 0
+        self.dropped_frames = 0
+        self.dropped_events = 0
+
+        self._budget = DiskBudget(root, self.folder_path, session_budget_mb, total_budget_mb)
+        self._condition = threading.Condition()
+        self._running = True
+        self._frame_counts = {}  # camera -> frames numbered so far
+        self._last_capture_times = {}  # camera -> time of the last frame recorded by add_captures
+        self._queues = {}  # _EVENTS_QUEUE or camera -> deque, oldest first
+        self._threads = []
+        # Each thread opens, writes and closes its own files, so that none is closed while being written
+        self._start_thread(_EVENTS_QUEUE, event_queue_size, self._event_loop, 'recorder-events')
+
+    def add_frame(self, camera, time, seq, image=None, jpeg=None):
+        """Record a frame, given as its JPEG bytes or as an image (BGR), captured at `time` (datetime)."""
+        frame = bytes(jpeg) if jpeg is not None else np.array(image)  # The image may be reused
+        with self._condition:
+            if not self._running:
+                return
+            if camera not in self._queues:
+                self._start_thread(camera, self.frame_queue_size, self._frame_loop, f'recorder-camera-{camera}')
+            number = self._frame_counts.get(camera, 0)
+            self._frame_counts[camera] = number + 1
+            self._put(camera, (number, frame))
+            self._put(_EVENTS_QUEUE, (EVENT_FRAME, camera, time.timestamp(), FRAME_PAYLOAD.pack(seq, number)))
+
+    def add_detections(self, camera, time, corners, ids):
+        """Record the markers detected in a frame, as returned by `detection.detect_markers`."""
+        markers = [] if ids is None else zip(np.asarray(ids).ravel(), corners)
+        payload = b''.join(DETECTION_PAYLOAD.pack(int(marker_id), *np.asarray(corner, dtype=np.float32).ravel())
+                           for marker_id, corner in markers)
+        self._add_event(EVENT_DETECTIONS, camera, time, payload)
+
+    def add_camera_pose(self, camera, time, pose):
+        """Record the camera pose (vision.Pose) a frame was analysed with."""
+        error = pose.reprojection_error if pose.reprojection_error is not None else float('nan')
+        payload = CAMERA_POSE_PAYLOAD.pack(*np.ravel(pose.rvec), *np.ravel(pose.tvec), error)
+        self._add_event(EVENT_CAMERA_POSE, camera, time, payload)
+
+    def add_captures(self, captures):
+        """
+        Record the detections and camera pose of each Capture, numbering the cameras from 1, and its frame if
+        `frame_interval` has elapsed since the last frame recorded for the camera.
+        """
+        for camera, capture in enumerate(captures, start=1):
+            if capture is None:
+                continue
+            last_time = self._last_capture_times.get(camera)
+            if last_time is None or (capture.time - last_time).total_seconds() >= self.frame_interval:
+                self._last_capture_times[camera] = capture.time
+                self.add_frame(camera, capture.time, capture.seq, capture.image)
+            self.add_detections(camera, capture.time, *capture.context.detections())
+            pose = capture.context.pose()
+            if pose is not None:
+                self.add_camera_pose(camera, capture.time, pose)
+
+    def add_world(self, time, world):
+        """Record the poses of the robots sent to our robot."""
+        payload = WORLD_PAYLOAD.pack(world.robot_detected, world.opponent_detected,
+                                     world.robot_x, world.robot_y, world.robot_theta,
+                                     world.opponent_x, world.opponent_y, world.opponent_theta)
+        self._add_event(EVENT_WORLD, 0, time, payload)
+
+    def add_packet(self, time, packet):
+        self._add_event(EVENT_PACKET, 0, time, bytes(packet))
+
+    def close(self, timeout=5.0):
+        """
+        Write the queued frames and events, within `timeout` seconds in all. A thread still writing after that closes
+        its files once done, leaving complete records.
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        deadline = monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - monotonic()))
+        if any(thread.is_alive() for thread in self._threads):
+            print(f"Recorder still writing to {self.folder_path}")
+
+    def statistics(self):
+        return (f"{self.recorded} events recorded, {self.dropped_frames} frames and {self.dropped_events} events "
+                f"dropped, {self._budget.deleted} deleted, {self._budget.statistics()}")
+
+    def _add_event(self, kind, camera, time, payload):
+        with self._condition:
+            if self._running:
+                self._put(_EVENTS_QUEUE, (kind, camera, time.timestamp(), payload))
+
+    def _put(self, queue_key, entry):
+        """Queue an entry, holding the condition."""
+        queue = self._queues[queue_key]
+        if len(queue) == queue.maxlen:
+            # The deque drops the oldest entry
+            if queue_key == _EVENTS_QUEUE:
+                self.dropped_events += 1
+            else:
+                self.dropped_frames += 1
+        queue.append(entry)
+        self._condition.notify_all()
+
+    def _start_thread(self, queue_key, queue_size, loop, name):
+        queue = self._queues[queue_key] = deque(maxlen=queue_size)
+        thread = threading.Thread(target=loop, args=(queue_key, queue), name=name, daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def _entries(self, queue):
+        """Yield the entries of a queue until the recorder is closed and the queue is empty."""
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: queue or not self._running)
+                if not queue:
+                    return
+                entry = queue.popleft()
+            yield entry
+
+    def _event_loop(self, _, queue):
+        index_time = float('-inf')
+        with open(os.path.join(self.folder_path, 'events.bin'), 'wb') as events, \
+                open(os.path.join(self.folder_path, 'index.bin'), 'wb') as index:
+            events.write(EVENTS_MAGIC)
+            for kind, camera, time, payload in self._entries(queue):
+                offset = events.tell()
+                events.write(EVENT_HEADER.pack(kind, camera, time, len(payload)))
+                events.write(payload)
+                index_time = max(index_time, time)
+                index.write(np.array([(index_time, offset)], dtype=INDEX_DTYPE).tobytes())
+                self.recorded += 1
+                self._budget.add(EVENT_HEADER.size + len(payload) + INDEX_DTYPE.itemsize)
+
+    def _frame_loop(self, camera, queue):
+        chunk_number, chunk = -1, None
+        next_number = 0  # Frame number of the next entry of the frame index
+        try:
+            with open(os.path.join(self.folder_path, _frame_index_filename(camera)), 'wb') as frame_index:
+                for number, frame in self._entries(queue):
+                    data = frame
+                    if not isinstance(frame, bytes):
+                        ok, data = cv.imencode('.jpg', frame, [cv.IMWRITE_JPEG_QUALITY, self.quality])
+                        data = data.tobytes() if ok else b''
+
+                    if chunk is None or chunk.tell() + len(data) > self.chunk_bytes:
+                        if chunk is not None:
+                            self._close_chunk(chunk)
+                        chunk_number += 1
+                        chunk = open(os.path.join(self.folder_path, _chunk_filename(camera, chunk_number)), 'wb')
+                    offset = chunk.tell()
+                    chunk.write(data)
+
+                    # Empty entries for the frames dropped from the queue, so that entries stay at their frame number
+                    entries = np.zeros(number - next_number + 1, FRAME_INDEX_DTYPE)
+                    entries[-1] = chunk_number, offset, len(data)
+                    frame_index.write(entries.tobytes())
+                    next_number = number + 1
+                    self._budget.add(entries.nbytes)
+        finally:
+            if chunk is not None:
+                self._close_chunk(chunk)
+
+    def _close_chunk(self, chunk):
+        size = chunk.tell()
+        chunk.close()
+        # Closed chunks only: deleting the chunk being written would lose the frames written after
+        self._budget.add(size, chunk.name)
+
+
+class RecordingReader:
+    """
+    Read a recording written by Recorder, from any time on, without loading it.
+
+    The indexes are memory-mapped: `seek()` is a binary search touching O(log n) pages, after which the events are
+    read one by one from the sidecar, and the frames from their chunk only when decoded.
+    """
+
+    def __init__(self, folder_path):
+        self.folder_path = folder_path
+        self._index = _memmap(os.path.join(folder_path, 'index.bin'), INDEX_DTYPE)
+        self._frame_indexes = {}  # camera -> memory-mapped camera<N>.idx
+
+        with open(os.path.join(folder_path, 'events.bin'), 'rb') as file:
+            if file.read(len(EVENTS_MAGIC)) != EVENTS_MAGIC:
+                raise ValueError(f"{folder_path} is not a recording")
+
+    def __len__(self):
+        return len(self._index)
+
+    def time_range(self):
+        """(first, last) event times as datetimes, or None for an empty recording."""
+        if not len(self._index):
+            return None
+        return datetime.fromtimestamp(self._index[0]['time']), datetime.fromtimestamp(self._index[-1]['time'])
+
+    def seek(self, time):
+        """Position in the index of the first event which may be at or after `time` (datetime)."""
+        return int(np.searchsorted(self._index['time'], time.timestamp(), side='left'))
+
+    def events(self, start=None, end=None, kinds=None):
+        """
+        Yield the Events from `start` to `end` (datetimes, both optional), in recording order. The data is decoded:
+        (seq, frame number) for frames (see `frames()` for the images), (corners, ids) for detections, (rvec, tvec,
+        reprojection_error) for camera poses, (robot_detected, opponent_detected, robot_pose, opponent_pose) for the
+        world and the raw bytes of packets.
+        """
+        position = self.seek(start) if start is not None else 0
+        if position >= len(self._index):
+            return
+        start_time = start.timestamp() if start is not None else float('-inf')
+        end_time = end.timestamp() if end is not None else float('inf')
+
+        with open(os.path.join(self.folder_path, 'events.bin'), 'rb') as file:
+            file.seek(int(self._index[position]['offset']))
+            for position in range(position, len(self._index)):
+                if self._index[position]['time'] > end_time + REORDER_WINDOW:
+                    return
+                header = file.read(EVENT_HEADER.size)
+                if len(header) < EVENT_HEADER.size:
+                    return
+                kind, camera, time, length = EVENT_HEADER.unpack(header)
+                payload = file.read(length)
+                if len(payload) < length:
+                    return  # Truncated by a crash while recording
+                if start_time <= time <= end_time and (kinds is None or kind in kinds):
+                    yield Event(kind, camera, datetime.fromtimestamp(time), _decode_payload(kind, payload))
+
+    def frames(self, camera=None, start=None, end=None):
+        """
+        Yield the Frames of one camera, or of all of them, from `start` to `end`, decoding each image in turn. The
+        frames dropped while recording, or deleted to stay within the disk budgets, are skipped.
+        """
+        chunks = {}  # (camera, chunk) -> file
+        try:
+            for event in self.events(start, end, kinds=(EVENT_FRAME,)):
+                if camera is not None and event.camera != camera:
+                    continue
+                image = self.read_image(event, chunks)
+                if image is not None:
+                    yield Frame(event.camera, event.time, event.data[0], image)
+        finally:
+            for file in chunks.values():
+                file.close()
+
+    def has_image(self, event):
+        """Whether the image of a FRAME event was written and is still there."""
+        entry = self._frame_entry(event)
+        return entry is not None and os.path.exists(self._chunk_path(event.camera, entry['chunk']))
+
+    def read_image(self, event, chunks=None):
+        """Decode the image of a FRAME event, or None if it's gone. `chunks` caches the open chunk files."""
+        entry = self._frame_entry(event)
+        if entry is None:
+            return None
+        key = event.camera, int(entry['chunk'])
+        file = chunks.get(key) if chunks is not None else None
+        if file is None:
+            try:
+                file = open(self._chunk_path(*key), 'rb')
+            except FileNotFoundError:
+                return None
+            if chunks is not None:
+                chunks[key] = file
+        try:
+            file.seek(int(entry['offset']))
+            data = np.frombuffer(file.read(int(entry['length'])), np.uint8)
+        finally:
+            if chunks is None:
+                file.close()
+        return cv.imdecode(data, cv.IMREAD_COLOR)
+
+    def cameras(self):
+        """Numbers of the recorded cameras."""
+        return sorted(int(name[len('camera'):-len('.idx')]) for name in os.listdir(self.folder_path)
+                      if name.startswith('camera') and name.endswith('.idx'))
+
+    def _frame_entry(self, event):
+        """Frame index entry of a FRAME event, or None if the frame was dropped before being written."""
+        frame_index = self._frame_indexes.get(event.camera)
+        if frame_index is None:
+            path = os.path.join(self.folder_path, _frame_index_filename(event.camera))
+            frame_index = self._frame_indexes[event.camera] = _memmap(path, FRAME_INDEX_DTYPE)
+        number = event.data[1]
+        if number >= len(frame_index) or frame_index[number]['length'] == 0:
+            return None
+        return frame_index[number]
+
+    def _chunk_path(self, camera, chunk):
+        return os.path.join(self.folder_path, _chunk_filename(camera, chunk))
+
+
+def is_recording(folder_path):
+    return os.path.isfile(os.path.join(folder_path, 'index.bin'))
+
+
+def _chunk_filename(camera, chunk):
+    return f'camera{camera}_{chunk:04d}.mjpg'
+
+
+def _frame_index_filename(camera):
+    return f'camera{camera}.idx'
+
+
+def _memmap(path, dtype):
+    """Memory-map the complete entries of an index file; a crash may have left the last one incomplete."""
+    entries = os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+    if not entries:
+        return np.zeros(0, dtype)
+    return np.memmap(path, dtype, mode='r', shape=(entries,))
+
+
+def _decode_payload(kind, payload):
+    if kind == EVENT_FRAME:
+        return FRAME_PAYLOAD.unpack(payload)
+    if kind == EVENT_DETECTIONS:
+        markers = list(DETECTION_PAYLOAD.iter_unpack(payload))
+        if not markers:
+            return (), None
+        corners = tuple(np.array(marker[1:], dtype=np.float32).reshape(1, 4, 2) for marker in markers)
+        ids = np.array([[marker[0]] for marker in markers], dtype=np.int32)
+        return corners, ids
+    if kind == EVENT_CAMERA_POSE:
+        values = CAMERA_POSE_PAYLOAD.unpack(payload)
+        return np.array(values[:3]).reshape(3, 1), np.array(values[3:6]).reshape(3, 1), values[6]
+    if kind == EVENT_WORLD:
+        robot_detected, opponent_detected, *poses = WORLD_PAYLOAD.unpack(payload)
+        return bool(robot_detected), bool(opponent_detected), tuple(poses[:3]), tuple(poses[3:])
+    return payload
@@ -32,6 +32,14 @@ class MarkerId(IntEnum):
     OUR_ROBOT_REAR_RIGHT = 142
 
 
+# Every marker ID that can appear on the field
+USED_MARKER_IDS = sorted(int(marker_id) for marker_id in (
+    list(range(MarkerId.ROBOT_BLUE_LO, MarkerId.ROBOT_YELLOW_HI + 1)) +
+    [MarkerId.BOARD_TOP_LEFT, MarkerId.BOARD_TOP_RIGHT, MarkerId.BOARD_BOTTOM_LEFT, MarkerId.BOARD_BOTTOM_RIGHT,
+     MarkerId.TIN_CAN, MarkerId.OUR_ROBOT_FRONT_RIGHT, MarkerId.OUR_ROBOT_REAR_LEFT, MarkerId.OUR_ROBOT_REAR_RIGHT]
+))
+
+
 class MarkerRotation(IntEnum):
     BOTTOM_LEFT = 0
     TOP_LEFT = 1
@@ -39,15 +47,6 @@ class MarkerRotation(IntEnum):
     BOTTOM_RIGHT = 3
 
 
-def z_world(marker_id):
-    if marker_id == MarkerId.TIN_CAN:
-        return MarkerHeight.TIN_CAN
-    elif MarkerId.ROBOT_BLUE_LO <= marker_id <= MarkerId.ROBOT_YELLOW_HI:
-        return MarkerHeight.OPPONENT_MARKER
-    else:
-        return 0
-
-
 def marker_corner_positions(x, y, z, size, rotation: MarkerRotation):
     points_3d = [
         [x - size / 2, y - size / 2, z],  # Bottom Left
@@ -82,6 +81,107 @@ OUR_ROBOT_MARKERS = {
 }
 
 
+# Pose estimation
+WARM_START_MAX_ERROR = 4.0  # Pixels; a warm-started pose reprojecting worse than this is solved again from scratch
+RANSAC_REPROJECTION_ERROR = 3.0  # Pixels; corners further than this from the RANSAC pose are outliers
+RANSAC_ITERATIONS = 50
+
+
+class MarkerRole(IntEnum):
+    UNUSED = 0
+    FIELD = 1
+    OUR_ROBOT = 2
+    OPPONENT_BLUE = 3
+    OPPONENT_YELLOW = 4
+    TIN_CAN = 5
+
+
+MAX_MARKER_ID = 1023  # Covers the ArUco and AprilTag dictionaries we may use
+
+
+class MarkerRegistry:
+    """
+    Marker metadata in dense tables indexed by marker ID, so that the geometry of all the markers detected in a frame
+    is gathered with one indexing operation instead of dict lookups.
+
+    role: MarkerRole of each ID, UNUSED for the markers that are not on the field
+    height: height of the plane of the marker in meters, 0 when unknown
+    size: width of the marker in meters, NaN when unknown
+    corners: (4,3) corner coordinates, in the field frame for field markers and in the robot frame for robot markers,
+             NaN when unknown
+    """
+
+    def __init__(self, max_marker_id=MAX_MARKER_ID):
+        self.role = np.zeros(max_marker_id + 1, dtype=np.int8)
+        self.height = np.zeros(max_marker_id + 1)
+        self.size = np.full(max_marker_id + 1, np.nan)
+        self.corners = np.full((max_marker_id + 1, 4, 3), np.nan)
+        self._role_corners = {}
+
+    def register(self, marker_id, role, height, size=np.nan, corners=None):
+        self.role[marker_id] = role
+        self.height[marker_id] = height
+        self.size[marker_id] = size
+        if corners is not None:
+            self.corners[marker_id] = corners
+        self._role_corners = {}
+
+    def select(self, ids, roles):
+        """
+        ids: (N,1) ids returned by detectMarkers, or None
+        roles: a MarkerRole or a list of them
+        returns: (indices of the detections whose marker has one of the roles, their marker ids)
+        """
+        if ids is None:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        ids = np.asarray(ids).reshape(-1)
+        # IDs beyond the table can't be on the field
+        known = ids <= len(self.role) - 1
+        indices = np.flatnonzero(known & np.isin(self.role[np.where(known, ids, 0)], roles))
+        return indices, ids[indices].astype(np.intp)
+
+    def role_corners(self, role):
+        """Return the corners of all the markers of a role, as an (N*4,3) array."""
+        corners = self._role_corners.get(role)
+        if corners is None:
+            corners = self.corners[self.role == role].reshape(-1, 3)
+            self._role_corners[role] = corners
+        return corners
+
+
+def _build_marker_registry():
+    registry = MarkerRegistry()
+    for marker_id, corners in FIELD_MARKERS.items():
+        registry.register(marker_id, MarkerRole.FIELD, 0.0, MarkerSize.FIELD_MARKER, corners)
+    for marker_id, corners in OUR_ROBOT_MARKERS.items():
+        registry.register(marker_id, MarkerRole.OUR_ROBOT, MarkerHeight.OUR_MARKER, MarkerSize.OUR_MARKER, corners)
+
+    # All the opponent markers are at the center of the robot, facing the same way
+    opponent_corners = marker_corner_positions(0, 0, MarkerHeight.OPPONENT_MARKER, MarkerSize.OPPONENT_MARKER,
+                                               MarkerRotation.TOP_RIGHT)
+    for marker_id in range(MarkerId.ROBOT_BLUE_LO, MarkerId.ROBOT_BLUE_HI + 1):
+        registry.register(marker_id, MarkerRole.OPPONENT_BLUE, MarkerHeight.OPPONENT_MARKER,
+                          MarkerSize.OPPONENT_MARKER, opponent_corners)
+    for marker_id in range(MarkerId.ROBOT_YELLOW_LO, MarkerId.ROBOT_YELLOW_HI + 1):
+        registry.register(marker_id, MarkerRole.OPPONENT_YELLOW, MarkerHeight.OPPONENT_MARKER,
+                          MarkerSize.OPPONENT_MARKER, opponent_corners)
+
+    registry.register(MarkerId.TIN_CAN, MarkerRole.TIN_CAN, MarkerHeight.TIN_CAN)
+    return registry
+
+
+MARKERS = _build_marker_registry()
+
+
+def opponent_role(our_color):
+    return MarkerRole.OPPONENT_BLUE if our_color == "yellow" else MarkerRole.OPPONENT_YELLOW
+
+
+def z_world(marker_id):
+    """Height of the plane of a marker, 0 for unknown markers."""
+    return float(MARKERS.height[marker_id]) if 0 <= marker_id <= MAX_MARKER_ID else 0.0
+
+
 def compute_homography(corners, ids, known_markers_positions):
     # Separate known and unknown markers
     known_corners = []
@@ -113,7 +213,11 @@ def compute_homography(corners, ids, known_markers_positions):
 def rodrigues_to_euler(rvec):
     """Convert Rodrigues rotation vector to Euler angles (in degrees)"""
     R, _ = cv.Rodrigues(rvec)
-    # Get rotation matrix
+    return rotation_matrix_to_euler(R)
+
+
+def rotation_matrix_to_euler(R):
+    """Convert a rotation matrix to Euler angles (in degrees)"""
     sy = np.sqrt(R[0, 0] * R[0, 0] + R[1, 0] * R[1, 0])
     singular = sy < 1e-6
 
@@ -138,7 +242,154 @@ def get_camera_position(rvec, tvec):
     return pos.T[0]
 
 
-def estimate_pose(corners, ids, known_markers_positions, camera_matrix, dist_coeffs):
+class Pose:
+    """
+    Camera pose: rvec and tvec map world coordinates to camera coordinates, as returned by cv.solvePnP.
+
+    The derived values (rotation matrix, camera center, Euler angles, projection matrix) are computed on first use
+    and kept, so that consumers of the same pose don't convert it again.
+    """
+
+    __slots__ = ("rvec", "tvec", "reprojection_error", "inlier_count", "_R", "_camera_center", "_euler",
+                 "_extrinsic_matrix", "_projection_matrix", "_projection_camera_matrix")
+
+    def __init__(self, rvec, tvec, reprojection_error=None, inlier_count=0):
+        self.rvec = np.asarray(rvec, dtype=float).reshape(3, 1)
+        self.tvec = np.asarray(tvec, dtype=float).reshape(3, 1)
+        self.reprojection_error = reprojection_error  # RMS in pixels, when estimated from image points
+        self.inlier_count = inlier_count  # Number of image points the pose was estimated from
+
+        self._R = None
+        self._camera_center = None
+        self._euler = None
+        self._extrinsic_matrix = None
+        self._projection_matrix = None
+        self._projection_camera_matrix = None
+
+    def __repr__(self):
+        x, y, z = self.camera_center
+        return f"Pose(camera at ({x:.3f}, {y:.3f}, {z:.3f}), error={self.reprojection_error})"
+
+    @property
+    def R(self):
+        """Rotation matrix from world to camera coordinates."""
+        if self._R is None:
+            self._R, _ = cv.Rodrigues(self.rvec)
+        return self._R
+
+    @property
+    def R_T(self):
+        """Rotation matrix from camera to world coordinates."""
+        return self.R.T
+
+    @property
+    def camera_center(self):
+        """Camera position in world coordinates, as a (3,) array."""
+        if self._camera_center is None:
+            self._camera_center = -(self.R.T @ self.tvec)[:, 0]
+        return self._camera_center
+
+    @property
+    def euler(self):
+        """Roll, pitch and yaw in degrees."""
+        if self._euler is None:
+            self._euler = rotation_matrix_to_euler(self.R)
+        return self._euler
+
+    @property
+    def extrinsic_matrix(self):
+        """3x4 [R|t] matrix."""
+        if self._extrinsic_matrix is None:
+            self._extrinsic_matrix = np.hstack([self.R, self.tvec])
+        return self._extrinsic_matrix
+
+    def projection_matrix(self, camera_matrix):
+        """3x4 projection matrix K [R|t], from world coordinates to undistorted pixels."""
+        if self._projection_camera_matrix is not camera_matrix:
+            self._projection_matrix = np.asarray(camera_matrix, dtype=float) @ self.extrinsic_matrix
+            self._projection_camera_matrix = camera_matrix
+        return self._projection_matrix
+
+    def image_to_world_points(self, image_points, z_world, camera_matrix, dist_coeffs):
+        """See `image_to_world_points`."""
+        image_points = np.asarray(image_points, dtype=np.float32).reshape(-1, 1, 2)
+        if len(image_points) == 0:
+            return np.empty((0, 3))
+
+        # The undistorted points are in normalized camera coordinates
+        undistorted_points = cv.undistortPoints(image_points, camera_matrix, dist_coeffs).reshape(-1, 2)
+
+        # Create rays in camera coordinates, and transform them to world coordinates
+        rays_camera = np.column_stack([undistorted_points, np.ones(len(undistorted_points))])
+        rays_world = rays_camera @ self.R  # Same as (R.T @ rays_camera.T).T
+
+        # Calculate the scaling factors to reach the planes at z=z_world
+        # We need to solve: camera_center[2] + s * ray_world[2] = z_world
+        camera_center = self.camera_center
+        s = (np.asarray(z_world, dtype=float) - camera_center[2]) / rays_world[:, 2]
+
+        # Calculate the world points
+        return camera_center + s[:, None] * rays_world
+
+
+def estimate_pose(corners, ids, known_markers_positions, camera_matrix, dist_coeffs, guess=None, ransac=False,
+                  ransac_threshold=RANSAC_REPROJECTION_ERROR):
+    """
+    Estimate the camera pose from the corners of known markers.
+
+    known_markers_positions: dict[marker_id] -> (4,3) corners in the field frame, or a MarkerRole of `MARKERS`
+
+    guess: previous Pose of the camera. The pose is then refined iteratively from it instead of being solved from
+    scratch, unless the refined pose reprojects worse than `WARM_START_MAX_ERROR` pixels.
+    ransac: when True, corners further than `ransac_threshold` pixels from the pose found by RANSAC are rejected.
+
+    returns: a Pose, whose reprojection_error is the RMS distance in pixels between the inlier corners and their
+    reprojection, or None
+    """
+    obj_points, image_points = known_marker_points(corners, ids, known_markers_positions)
+    if len(obj_points) < 4:
+        return None
+
+    if ransac:
+        ret, rvec, tvec, inliers = _solve_pnp_ransac(obj_points, image_points, camera_matrix, dist_coeffs, guess,
+                                                     ransac_threshold)
+        if not ret:
+            return None
+        obj_points, image_points = obj_points[inliers], image_points[inliers]
+    elif guess is not None:
+        rvec, tvec = guess.rvec.copy(), guess.tvec.copy()
+        ret, rvec, tvec = cv.solvePnP(obj_points, image_points, camera_matrix, dist_coeffs, rvec, tvec,
+                                      useExtrinsicGuess=True, flags=cv.SOLVEPNP_ITERATIVE)
+        if ret and reprojection_error(obj_points, image_points, rvec, tvec, camera_matrix, dist_coeffs) > \
+                WARM_START_MAX_ERROR:
+            # The camera moved, or the guess converged to the wrong solution: solve from scratch
+            ret = False
+        if not ret:
+            ret, rvec, tvec = cv.solvePnP(obj_points, image_points, camera_matrix, dist_coeffs,
+                                          flags=cv.SOLVEPNP_IPPE)
+    else:
+        ret, rvec, tvec = cv.solvePnP(obj_points, image_points, camera_matrix, dist_coeffs, flags=cv.SOLVEPNP_IPPE)
+
+    if not ret:
+        return None
+
+    error = reprojection_error(obj_points, image_points, rvec, tvec, camera_matrix, dist_coeffs)
+    return Pose(rvec, tvec, error, len(obj_points))
+
+
+def known_marker_points(corners, ids, known_markers_positions):
+    """
+    Return the (N,3) object points and (N,2) image points of the corners of the known markers, as float32.
+    known_markers_positions: dict[marker_id] -> (4,3) corners, or a MarkerRole of `MARKERS`
+    """
+    if isinstance(known_markers_positions, MarkerRole):
+        indices, marker_ids = MARKERS.select(ids, known_markers_positions)
+        if len(indices) == 0:
+            return np.empty((0, 3), np.float32), np.empty((0, 2), np.float32)
+        obj_points = MARKERS.corners[marker_ids].reshape(-1, 3).astype(np.float32)
+        image_points = np.concatenate([corners[i] for i in indices]).reshape(-1, 2).astype(np.float32)
+        return obj_points, image_points
+
     obj_points = []
     image_points = []
 
@@ -147,40 +398,177 @@ def estimate_pose(corners, ids, known_markers_positions, camera_matrix, dist_coe
             obj_points.extend(known_markers_positions[id[0]])
             image_points.extend(corner[0])
 
-    obj_points = np.array(obj_points, np.float32)
-    image_points = np.array(image_points, np.float32)
+    return np.array(obj_points, np.float32).reshape(-1, 3), np.array(image_points, np.float32).reshape(-1, 2)
 
-    if len(obj_points) > 0:
-        ret, rvec, tvec = cv.solvePnP(obj_points, image_points, camera_matrix, dist_coeffs, flags=cv.SOLVEPNP_IPPE)
-        if ret:
-            return True, rvec, tvec
 
-    return False, None, None
+def average_pose(poses):
+    """
+    Average camera poses which are close to each other. The rotation is the chordal mean: the rotation matrix
+    closest to the mean of the rotation matrices.
+    """
+    mean_rotation = np.mean([pose.R for pose in poses], axis=0)
+    u, _, vt = np.linalg.svd(mean_rotation)
+    rotation = u @ vt
+    if np.linalg.det(rotation) < 0:
+        rotation = u @ np.diag([1.0, 1.0, -1.0]) @ vt
 
+    rvec, _ = cv.Rodrigues(rotation)
+    tvec = np.mean([pose.tvec for pose in poses], axis=0)
+    return Pose(rvec, tvec)
 
-def image_to_world_point(image_point, z_world, rvec, tvec, camera_matrix, dist_coeffs):
-    R, _ = cv.Rodrigues(rvec)
-
-    image_points = np.array([[[image_point[0], image_point[1]]]], dtype=np.float32)
-    undistorted_points = cv.undistortPoints(image_points, camera_matrix, dist_coeffs)
 
-    # The undistorted point is in normalized camera coordinates
-    x_normalized, y_normalized = undistorted_points[0, 0]
+def reprojection_error(obj_points, image_points, rvec, tvec, camera_matrix, dist_coeffs):
+    """RMS distance in pixels between image points and the reprojection of their object points."""
+    projected, _ = cv.projectPoints(obj_points, rvec, tvec, camera_matrix, dist_coeffs)
+    return float(np.sqrt(((projected.reshape(-1, 2) - image_points) ** 2).sum(axis=1).mean()))
 
-    # Create a ray in camera coordinates
-    ray_camera = np.array([x_normalized, y_normalized, 1.0])
 
-    # Transform ray to world coordinates
-    ray_world = np.matmul(R.T, ray_camera)
-
-    # Camera center in world coordinates
-    camera_center = -np.matmul(R.T, tvec.reshape(3, 1)).flatten()
+def _solve_pnp_ransac(obj_points, image_points, camera_matrix, dist_coeffs, guess, threshold):
+    """Return (ret, rvec, tvec, inlier indices), the pose being refined on the inliers."""
+    if guess is not None:
+        rvec, tvec = guess.rvec.copy(), guess.tvec.copy()
+        ret, rvec, tvec, inliers = cv.solvePnPRansac(obj_points, image_points, camera_matrix, dist_coeffs, rvec, tvec,
+                                                     useExtrinsicGuess=True, iterationsCount=RANSAC_ITERATIONS,
+                                                     reprojectionError=threshold, flags=cv.SOLVEPNP_ITERATIVE)
+    else:
+        ret, rvec, tvec, inliers = cv.solvePnPRansac(obj_points, image_points, camera_matrix, dist_coeffs,
+                                                     iterationsCount=RANSAC_ITERATIONS, reprojectionError=threshold,
+                                                     flags=cv.SOLVEPNP_IPPE)
+    if not ret or inliers is None or len(inliers) < 4:
+        return False, None, None, None
+    inliers = inliers.ravel()
 
-    # Calculate the scaling factor to reach the plane at z=z_world
-    # We need to solve: camera_center[2] + s * ray_world[2] = z_world
-    s = (z_world - camera_center[2]) / ray_world[2]
+    rvec, tvec = cv.solvePnPRefineLM(obj_points[inliers], image_points[inliers], camera_matrix, dist_coeffs, rvec,
+                                     tvec)
+    return True, rvec, tvec, inliers
 
-    # Calculate the world point
-    world_point = camera_center + s * ray_world
 
-    return world_point
+def image_to_world_point(image_point, z_world, rvec, tvec, camera_matrix, dist_coeffs):
+    return image_to_world_points([image_point], z_world, rvec, tvec, camera_matrix, dist_coeffs)[0]
+
+
+def image_to_world_points(image_points, z_world, rvec, tvec, camera_matrix, dist_coeffs):
+    """
+    Project image points onto horizontal planes of the world.
+
+    image_points: (N,2) pixel coordinates
+    z_world: height of the plane of each point, as an (N,) array or a scalar shared by all points
+    returns: (N,3) world points
+    """
+    return Pose(rvec, tvec).image_to_world_points(image_points, z_world, camera_matrix, dist_coeffs)
+
+
+# Heights of the horizontal planes markers can lie on
+PLANE_HEIGHTS = (0.0, MarkerHeight.TIN_CAN, MarkerHeight.OUR_MARKER, MarkerHeight.OPPONENT_MARKER)
+
+_ray_luts = {}  # (camera_matrix, dist_coeffs, size) -> undistorted ray table, shared by projectors of a camera
+
+
+def undistorted_ray_lut(camera_matrix, dist_coeffs, width, height):
+    """
+    Return a (height, width, 2) float32 table of the normalized camera coordinates of every pixel, i.e. the result of
+    cv.undistortPoints for the whole image. It only depends on the intrinsics, so it is computed once per camera.
+    """
+    key = (np.asarray(camera_matrix).tobytes(), np.asarray(dist_coeffs).tobytes(), width, height)
+    lut = _ray_luts.get(key)
+    if lut is None:
+        xs, ys = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        pixels = np.stack([xs, ys], axis=-1).reshape(-1, 1, 2)
+        lut = cv.undistortPoints(pixels, camera_matrix, dist_coeffs).reshape(height, width, 2)
+        _ray_luts[key] = lut
+    return lut
+
+
+class PlaneProjector:
+    """
+    Project image points of one camera onto horizontal planes of the world, like `image_to_world_points`.
+
+    Once the camera pose is known, a plane z=h maps to normalized camera coordinates through the homography
+    [r1 r2 h*r3+t], so projecting a point onto it is a 3x3 matrix product after undistortion. The inverse homographies
+    are computed for `PLANE_HEIGHTS` whenever the pose changes, and for other heights the first time they are used.
+    Points on different planes in the same call skip the homographies: their world rays are intersected with their
+    planes in a single vectorized computation.
+
+    ray_lut_size: (width, height) of the images. When given, pixels are undistorted with a bilinear lookup in
+    `undistorted_ray_lut` instead of cv.undistortPoints.
+    """
+
+    def __init__(self, camera_matrix, dist_coeffs, ray_lut_size=None):
+        self.camera_matrix = camera_matrix
+        self.dist_coeffs = dist_coeffs
+        self.ray_lut = None
+        if ray_lut_size is not None:
+            self.ray_lut = undistorted_ray_lut(camera_matrix, dist_coeffs, *ray_lut_size)
+
+        self.pose = None
+        self._homographies = {}  # plane height -> 3x3 normalized camera coordinates to world (x, y, 1)
+
+    def set_pose(self, pose):
+        """Use a new camera Pose. The plane homographies are only recomputed if the pose changed."""
+        if self.pose is not None and (pose is self.pose or (np.array_equal(pose.rvec, self.pose.rvec) and
+                                                            np.array_equal(pose.tvec, self.pose.tvec))):
+            return
+
+        self.pose = pose
+        self._homographies = {}
+        for height in PLANE_HEIGHTS:
+            self._plane_homography(height)
+
+    def project(self, image_points, z_world):
+        """
+        image_points: (N,2) pixel coordinates
+        z_world: height of the plane of each point, as an (N,) array or a scalar shared by all points
+        returns: (N,3) world points
+        """
+        if self.pose is None:
+            raise RuntimeError("PlaneProjector.project() called before set_pose()")
+
+        image_points = np.asarray(image_points, dtype=np.float32).reshape(-1, 2)
+        if len(image_points) == 0:
+            return np.empty((0, 3))
+
+        rays = np.column_stack([self.undistort(image_points), np.ones(len(image_points))])
+        z_world = np.asarray(z_world, dtype=float)
+        if z_world.ndim == 0 or z_world.min() == z_world.max():
+            # All the points are on the same plane, e.g. the markers of one robot
+            height = float(z_world.flat[0])
+            return self._project_on_plane(rays, height)
+
+        # Points on several planes: a ray-plane intersection per point is cheaper than grouping them by plane
+        rays_world = rays @ self.pose.R
+        camera_center = self.pose.camera_center
+        s = (z_world - camera_center[2]) / rays_world[:, 2]
+        return camera_center + s[:, None] * rays_world
+
+    def undistort(self, image_points):
+        """Return the (N,2) normalized camera coordinates of (N,2) float32 pixel coordinates."""
+        if self.ray_lut is None:
+            return cv.undistortPoints(image_points.reshape(-1, 1, 2), self.camera_matrix,
+                                      self.dist_coeffs).reshape(-1, 2)
+
+        # Bilinear lookup, with NaN for the points too close to the edges of the table to be interpolated
+        rays = cv.remap(self.ray_lut, image_points[:, 0].reshape(1, -1), image_points[:, 1].reshape(1, -1),
+                        cv.INTER_LINEAR, borderMode=cv.BORDER_CONSTANT, borderValue=(np.nan, np.nan))
+        rays = rays.reshape(-1, 2)
+        outside = np.isnan(rays[:, 0])
+        if outside.any():
+            # Corners can be refined slightly outside of the image
+            rays[outside] = cv.undistortPoints(image_points[outside].reshape(-1, 1, 2), self.camera_matrix,
+                                               self.dist_coeffs).reshape(-1, 2)
+        return rays
+
+    def _project_on_plane(self, rays, height):
+        plane_points = rays @ self._plane_homography(height).T
+        world_points = np.empty((len(rays), 3))
+        world_points[:, :2] = plane_points[:, :2] / plane_points[:, 2:]
+        world_points[:, 2] = height
+        return world_points
+
+    def _plane_homography(self, height):
+        homography = self._homographies.get(height)
+        if homography is None:
+            R = self.pose.R
+            world_to_camera = np.column_stack([R[:, 0], R[:, 1], height * R[:, 2] + self.pose.tvec[:, 0]])
+            homography = np.linalg.inv(world_to_camera)
+            self._homographies[height] = homography
+        return homography
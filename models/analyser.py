@@ -1,106 +1,164 @@
+import cv2 as cv
 import numpy as np
-from math import atan2, cos, sin
-
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from math import cos, sin
+from time import monotonic
+
+from models.pose_lock import PoseLock
 from models.world import World
 from lib import vision
 
+CORNER_PIXEL_NOISE = 1.0  # Pixels; detection noise of a marker corner
+CORNER_NOISE_FLOOR = 0.005  # Meters; camera pose and marker height errors, whatever the view
+MIN_COS_INCIDENCE = 0.1  # Caps the error of corners seen at grazing angles to 10x that of a straight view
+RIGID_INLIER_SIGMAS = 3.0  # Corners further than this many expected errors from the robot pose are outliers
+RIGID_HUBER_SIGMAS = 1.345  # Residuals beyond this many expected errors are down-weighted
+RIGID_RANSAC_HYPOTHESES = 128  # Maximum number of point pairs tried
+RIGID_IRLS_ITERATIONS = 5
+RIGID_CONVERGENCE = 1e-6  # Meters and radians
+
+# Analyse the frames of all the cameras on the camera pool, see `Analyser._analyse_cameras`. With a single CPU the
+# threads only contend for it, which measured 15% slower than one camera after the other.
+PARALLEL_CAMERAS = (os.cpu_count() or 1) > 1
+# Roles whose corners are projected for each camera before the fusion; the opponent role depends on the team color,
+# which needs the poses of both cameras, so both opponent colors are projected
+CAMERA_ROLES = (vision.MarkerRole.OUR_ROBOT, vision.MarkerRole.OPPONENT_BLUE, vision.MarkerRole.OPPONENT_YELLOW)
+
+# Threads of the camera pool, shared by all the Analysers; more cameras than this wait for a free thread. It is not
+# the pool of detection.detect_markers_tiled: a camera waiting there for its tiles would hold one of their threads
+CAMERA_THREADS = 4
+_camera_executor = None  # Created on first use
+_camera_executor_lock = threading.Lock()
+
 
 class Analyser:
-    def __init__(self, capture_1, capture_2):
-        self.capture_1 = capture_1
-        self.capture_2 = capture_2
+    def __init__(self, *captures, parallel=PARALLEL_CAMERAS):
+        """
+        captures: one Capture per camera, any number of them. None stands for a camera without a fresh frame, which
+        is left out of the analysis.
+        """
+        self.captures = [capture for capture in captures if capture is not None]
+        self.parallel = parallel
 
     # ------------------------------------------------------------------ #
     #  public entry
     # ------------------------------------------------------------------ #
     def generate_world(self, persistent_state):
+        self._analyse_cameras(persistent_state)
+
         world = World()
         world.score = persistent_state.score or 0
-        world.team_color = self._find_team_color(persistent_state) or persistent_state.team_color
+        world.team_color = self._find_team_color() or persistent_state.team_color
         persistent_state.team_color = world.team_color
 
         # --- our robot ----------------------------------------------------
-        robot_pose = self._calculate_pose(vision.OUR_ROBOT_MARKERS, persistent_state)
+        robot_pose = self._calculate_pose(vision.MarkerRole.OUR_ROBOT)
         if robot_pose:
             world.robot_detected = True
-            world.robot_x, world.robot_y, world.robot_theta, rmse = robot_pose
-            print(f"[Analyser] Robot pose RMSE = {rmse:.4f} m")
+            world.robot_x, world.robot_y, world.robot_theta, rmse, inliers, _ = robot_pose
+            print(f"[Analyser] Robot pose RMSE = {rmse:.4f} m, {inliers.sum()}/{len(inliers)} corners")
+            self._hint_trackers(vision.MarkerRole.OUR_ROBOT, robot_pose)
+            self._update_tracker(persistent_state.robot_tracker, robot_pose)
 
         # --- opponent robot ----------------------------------------------
         if world.team_color:
-            opponent_pose = self._calculate_pose(
-                self._opponent_marker_lookup(world.team_color), persistent_state
-            )
+            opponent_role = vision.opponent_role(world.team_color)
+            opponent_pose = self._calculate_pose(opponent_role)
             if opponent_pose:
                 world.opponent_detected = True
-                world.opponent_x, world.opponent_y, world.opponent_theta, rmse = opponent_pose
-                print(f"[Analyser] Opponent pose RMSE = {rmse:.4f} m")
+                world.opponent_x, world.opponent_y, world.opponent_theta, rmse, inliers, _ = opponent_pose
+                print(f"[Analyser] Opponent pose RMSE = {rmse:.4f} m, {inliers.sum()}/{len(inliers)} corners")
+                self._hint_trackers(opponent_role, opponent_pose)
+                self._update_tracker(persistent_state.opponent_tracker, opponent_pose)
 
         return world, persistent_state
 
+    # ------------------------------------------------------------------ #
+    #  per-camera stage
+    # ------------------------------------------------------------------ #
+    def _analyse_cameras(self, persistent_state):
+        """
+        Run the work that only depends on one camera, detection, camera pose and the projection of the robot
+        markers, for all the cameras at once. OpenCV releases the GIL, so the frame is ready when the slower camera
+        is, and the fusion that follows only reads the memoized products of the FrameContexts.
+        """
+        if not self.parallel or len(self.captures) < 2:
+            for capture in self.captures:
+                self._analyse_camera(capture, persistent_state)
+            return
+
+        pool = _camera_pool()
+        futures = [pool.submit(self._analyse_camera, capture, persistent_state) for capture in self.captures]
+        for future in futures:
+            future.result()
+
+    def _analyse_camera(self, capture, persistent_state):
+        # Each camera only touches its own FrameContext and its own entries of persistent_state
+        self._resolve_camera_pose(capture, persistent_state)
+        for role in CAMERA_ROLES:
+            capture.context.marker_world_points(role)
+
     # ------------------------------------------------------------------ #
     #  pose helpers
     # ------------------------------------------------------------------ #
-    def _opponent_marker_lookup(self, our_color):
-        if our_color == "yellow":
-            tag_lo, tag_hi = vision.MarkerId.ROBOT_BLUE_LO, vision.MarkerId.ROBOT_BLUE_HI
-        else:
-            tag_lo, tag_hi = vision.MarkerId.ROBOT_YELLOW_LO, vision.MarkerId.ROBOT_YELLOW_HI
-
-        opponent_corners = {}
-        for tag_id in range(tag_lo, tag_hi + 1):
-            opponent_corners[tag_id] = vision.marker_corner_positions(
-                0, 0, vision.MarkerHeight.OPPONENT_MARKER, vision.MarkerSize.OPPONENT_MARKER,
-                vision.MarkerRotation.TOP_RIGHT
-            )
-        return opponent_corners
-
-    def _calculate_pose(self, marker_lookup, persistent_state):
+    def _calculate_pose(self, role):
         """
         General 2-D rigid fit for any set of tags.
 
-        marker_lookup: dict[tag_id] -> ndarray(shape=(4,3)) of corner (x,y,z) in tag frame
-        returns: (x, y, theta, rmse) or None if not enough points
+        role: vision.MarkerRole of the tags, whose corners in the tag frame come from vision.MARKERS
+        returns: (x, y, theta, rmse, inliers, covariance) as returned by `_solve_2d_rigid`, or None if not enough points
+                 agree on a pose
         """
         # (x,y) coordinates of each known point, in the reference frames of the tags and the field
         tag_frame_points = []
         field_frame_points = []
+        sigmas = []
 
-        for capture in [self.capture_1, self.capture_2]:
-            ret = self._pose_corner_ids_from_capture(capture, persistent_state)
-            if ret is None:
+        for capture in self.captures:
+            points = capture.context.marker_world_points(role)
+            if points is None:
                 continue
-            rvec, tvec, corners, ids = ret
-
-            for tag_id, image_corners in zip(ids, corners):
-                tag_id = int(tag_id[0])
-                tag_corners = marker_lookup.get(tag_id)
-                if tag_corners is None:
-                    continue
-
-                for i in range(4):
-                    image_point = image_corners[0][i]
-                    world_point = vision.image_to_world_point(
-                        image_point,
-                        z_world=tag_corners[i][2],
-                        rvec=rvec,
-                        tvec=tvec,
-                        camera_matrix=capture.camera_matrix,
-                        dist_coeffs=capture.dist_coeffs,
-                    )
-                    tag_frame_points.append(tag_corners[i][:2])
-                    field_frame_points.append(world_point[:2])
+            tag_points, world_points = points
+            tag_frame_points.extend(tag_points[:, :2])
+            field_frame_points.extend(world_points[:, :2])
+            sigmas.extend(self._corner_sigmas(capture, world_points))
 
         if len(tag_frame_points) < 2:
             return None
 
         # Compute the rigid-body transform that converts the tag frame points to the field frame points
         # Return the x, y, theta, and the RMSE of the fit, which is the position and orientation of the robot.
-        return self._solve_2d_rigid(tag_frame_points, field_frame_points)
+        return self._solve_2d_rigid(tag_frame_points, field_frame_points, sigmas)
 
-    def _solve_2d_rigid(self, robot_points, world_points):
+    def _corner_sigmas(self, capture, world_points):
+        """
+        Expected position error in meters of corners projected onto their plane: a pixel of detection noise moves
+        a corner proportionally to its distance from the camera, and more so when the plane is seen at a grazing
+        angle. A constant floor accounts for the errors of the camera pose and of the marker heights.
+        """
+        world_points = np.asarray(world_points, dtype=float)
+        camera_pose = capture.context.pose()
+        if camera_pose is None:
+            return np.full(len(world_points), CORNER_NOISE_FLOOR)
+
+        rays = world_points - camera_pose.camera_center
+        distances = np.linalg.norm(rays, axis=1)
+        # Cosine of the angle between the rays and the normal of the (horizontal) planes
+        cos_incidence = np.maximum(np.abs(rays[:, 2]) / distances, MIN_COS_INCIDENCE)
+        focal_length = capture.camera_matrix[0, 0]
+        image_sigmas = CORNER_PIXEL_NOISE * distances / (focal_length * cos_incidence)
+        return np.sqrt(image_sigmas ** 2 + CORNER_NOISE_FLOOR ** 2)
+
+    def _solve_2d_rigid(self, robot_points, world_points, sigmas=None):
         """
-        Least‑squares 2‑D rigid‑body transform.
+        Robust weighted 2‑D rigid‑body transform.
+
+        Hypotheses are fitted on pairs of points (RANSAC) and all scored at once by the weights of the points they
+        explain within RIGID_INLIER_SIGMAS. The best one is then refined on its inliers by Huber-weighted iteratively
+        reweighted least squares.
 
         Parameters
         ----------
@@ -108,74 +166,195 @@ class Analyser:
             Coordinates in the robot frame.
         world_points : list/ndarray (N,2)
             Corresponding coordinates in the world frame.
+        sigmas : list/ndarray (N,), optional
+            Expected error of each world point in meters, see `_corner_sigmas`. Defaults to CORNER_NOISE_FLOOR.
 
         Returns
         -------
-        (x, y, theta, rmse)
-            Translation (x,y), rotation (theta rad) and
-            root‑mean‑squared error of the fit.
+        (x, y, theta, rmse, inliers, covariance) or None
+            Translation (x,y), rotation (theta rad), root‑mean‑squared error of the inliers, (N,) boolean mask of
+            the inliers and 3x3 covariance of (x, y, theta). None if no two points agree on a pose: every point is
+            an outlier.
         """
-        P = np.asarray(robot_points, dtype=float)
-        W = np.asarray(world_points, dtype=float)
-
-        P_cent = P.mean(axis=0)
-        W_cent = W.mean(axis=0)
-        P_hat = P - P_cent
-        W_hat = W - W_cent
-
-        num = np.sum(P_hat[:, 0] * W_hat[:, 1] - P_hat[:, 1] * W_hat[:, 0])
-        den = np.sum(P_hat[:, 0] * W_hat[:, 0] + P_hat[:, 1] * W_hat[:, 1])
-        theta = atan2(num, den)
-
-        c, s = cos(theta), sin(theta)
-        R = np.array([[c, -s], [s, c]])
-        t = W_cent - R @ P_cent
-
-        residuals = (R @ P.T).T + t - W
-        rmse = float(np.sqrt((residuals ** 2).sum(axis=1).mean()))
-
-        x, y = t
-        return float(x), float(y), float(theta), rmse
+        # Points as complex numbers: a rotation by theta is a product by exp(i theta)
+        P = np.asarray(robot_points, dtype=float) @ [1, 1j]
+        W = np.asarray(world_points, dtype=float) @ [1, 1j]
+        sigmas = np.full(len(P), CORNER_NOISE_FLOOR) if sigmas is None else np.asarray(sigmas, dtype=float)
+        weights = 1.0 / sigmas ** 2
+        threshold = RIGID_INLIER_SIGMAS * sigmas
+
+        inliers = np.ones(len(P), dtype=bool)
+        if len(P) > 2:
+            inliers = self._rigid_consensus(P, W, weights, threshold)
+            if np.count_nonzero(inliers) < 2:
+                return None
+
+        rotation, translation = self._weighted_rigid_fit(P, W, weights * inliers)
+        for _ in range(RIGID_IRLS_ITERATIONS):
+            distances = np.abs(rotation * P + translation - W)
+            new_inliers = distances < threshold
+            if np.count_nonzero(new_inliers) < 2:
+                break
+            # Huber weights: quadratic cost up to RIGID_HUBER_SIGMAS, linear beyond
+            huber = np.minimum(1.0, RIGID_HUBER_SIGMAS * sigmas / np.maximum(distances, 1e-12))
+            previous = rotation, translation
+            rotation, translation = self._weighted_rigid_fit(P, W, weights * huber * new_inliers)
+            converged = abs(rotation - previous[0]) < RIGID_CONVERGENCE and \
+                abs(translation - previous[1]) < RIGID_CONVERGENCE and np.array_equal(new_inliers, inliers)
+            inliers = new_inliers
+            if converged:
+                break
+
+        rotated = rotation * P[inliers]
+        residuals = np.abs(rotated + translation - W[inliers])
+        rmse = float(np.sqrt(np.mean(residuals ** 2)))
+        covariance = self._rigid_covariance(rotated, residuals, weights[inliers])
+        theta = float(np.angle(rotation))
+        return float(translation.real), float(translation.imag), theta, rmse, inliers, covariance
+
+    @staticmethod
+    def _weighted_rigid_fit(P, W, weights):
+        """Closed-form weighted least-squares (rotation, translation), as complex numbers, mapping P onto W."""
+        total = weights.sum()
+        P_cent = weights @ P / total
+        W_cent = weights @ W / total
+        # The angle of sum(w * conj(P_hat) * W_hat) is the rotation minimising the weighted squared residuals
+        correlation = weights @ (np.conj(P - P_cent) * (W - W_cent))
+        rotation = correlation / abs(correlation) if correlation != 0 else 1.0 + 0j
+        return rotation, W_cent - rotation * P_cent
+
+    @staticmethod
+    def _rigid_consensus(P, W, weights, threshold):
+        """RANSAC over point pairs, all hypotheses evaluated at once. Returns the inliers of the best hypothesis."""
+        first, second = _point_pairs(len(P))
+
+        # Rotation taking each robot frame segment onto its world frame segment, and translation of the pair middle.
+        # A corner seen by both cameras pairs with itself: its hypothesis is NaN and explains nothing.
+        with np.errstate(divide="ignore", invalid="ignore"):
+            segments = (W[second] - W[first]) / (P[second] - P[first])
+            rotations = segments / np.abs(segments)
+        translations = (W[first] + W[second] - rotations * (P[first] + P[second])) / 2
+
+        # (hypotheses, points) residuals
+        residuals = np.outer(rotations, P) + (translations[:, None] - W)
+        with np.errstate(invalid="ignore"):
+            explained = residuals.real ** 2 + residuals.imag ** 2 < threshold ** 2
+        return explained[np.argmax(explained @ weights)]
+
+    @staticmethod
+    def _rigid_covariance(rotated, residuals, weights):
+        """
+        Covariance of (x, y, theta) from the weighted normal equations, inflated by the reduced chi-square.
+        rotated: the rotated robot frame points, whose residuals change by i * rotated per radian of theta
+        """
+        total = weights.sum()
+        moment_x = weights @ rotated.real
+        moment_y = weights @ rotated.imag
+        information = np.array([[total, 0.0, -moment_y],
+                                [0.0, total, moment_x],
+                                [-moment_y, moment_x, weights @ (rotated.real ** 2 + rotated.imag ** 2)]])
+        degrees_of_freedom = 2 * len(rotated) - 3
+        chi_square = float(weights @ residuals ** 2)
+        scale = max(1.0, chi_square / degrees_of_freedom) if degrees_of_freedom > 0 else 1.0
+        try:
+            return scale * np.linalg.inv(information)
+        except np.linalg.LinAlgError:
+            # Coincident points: the rotation is unobservable
+            return np.diag([CORNER_NOISE_FLOOR ** 2, CORNER_NOISE_FLOOR ** 2, np.pi ** 2])
 
     # ------------------------------------------------------------------ #
     #  misc helpers
     # ------------------------------------------------------------------ #
-    def _find_team_color(self, persistent_state):
+    def _find_team_color(self):
         x_values = []
-        for capture in [self.capture_1, self.capture_2]:
-            pose = self._get_pose_with_fallback(capture, persistent_state)
+        for capture in self.captures:
+            pose = capture.context.pose()
             if pose is not None:
-                x_values.append(pose[2][0])
+                x_values.append(pose.camera_center[0])
 
-        if len(x_values) == 2:
+        # The cameras stand on the side of their team (an overhead camera, near the middle, barely moves the mean)
+        if len(x_values) >= 2:
             return "blue" if np.mean(x_values) > 1.5 else "yellow"
         return None
 
-    def _pose_corner_ids_from_capture(self, capture, persistent_state):
-        pose = self._get_pose_with_fallback(capture, persistent_state)
-        if pose is None:
-            return None
-        rvec, tvec = pose[:2]
-
-        corners, ids = capture._detection()
-        if ids is None:
-            return None
+    def _hint_trackers(self, role, pose):
+        """Project the markers of a robot into each camera, so that tracked detection searches there next frame."""
+        x, y, theta = pose[:3]
+        c, s = cos(theta), sin(theta)
+        R = np.array([[c, -s], [s, c]])
 
-        return rvec, tvec, corners, ids
+        tag_corners = vision.MARKERS.role_corners(role)
+        world_corners = np.column_stack([tag_corners[:, :2] @ R.T + [x, y], tag_corners[:, 2]])
 
-    def _get_pose_with_fallback(self, capture, persistent_state):
+        for capture in self.captures:
+            if capture.tracker is None:
+                continue
+            camera_pose = capture.context.pose()
+            if camera_pose is None:
+                continue
+            image_points, _ = cv.projectPoints(world_corners, camera_pose.rvec, camera_pose.tvec, capture.camera_matrix,
+                                               capture.dist_coeffs)
+            capture.tracker.hint(image_points.reshape(-1, 2))
+
+    def _update_tracker(self, tracker, pose):
+        """Feed a pose measured by `_calculate_pose` to a PoseTracker, at the time the frames were captured."""
+        times = [capture.time for capture in self.captures if capture.time is not None]
+        if times:
+            x, y, theta, rmse, _, covariance = pose
+            # Both frames were captured within the skew of each other: the latest one dates the measurement
+            tracker.update((x, y, theta), max(times), rmse, covariance)
+
+    def _resolve_camera_pose(self, capture, persistent_state):
         """
-        Get pose from capture, falling back to memorized pose if needed.
-        Updates memorized pose when a new valid pose is obtained.
-
-        Returns: pose tuple (rvec, tvec, pos, euler) or None
+        Settle the camera pose of the frame once for all its consumers: the locked pose if the camera hasn't moved,
+        else a fresh estimate, falling back to the last memorized pose of the camera.
         """
-        pose = capture.estimate_pose()
+        context = capture.context
+        camera_index = capture.camera_index
+
+        lock = None
+        time = capture.monotonic_time if capture.monotonic_time is not None else monotonic()
+        if persistent_state.pose_locks is not None:
+            lock = persistent_state.pose_locks.setdefault(camera_index, PoseLock())
+            if lock.locked:
+                if not lock.check_due(time) or \
+                        lock.check(*context.detections(), capture.camera_matrix, capture.dist_coeffs, time):
+                    context.provide("pose", lock.pose)
+                    persistent_state.camera_poses[camera_index] = lock.pose
+                    return
+                print(f"[Analyser] Camera {camera_index} moved (residual {lock.residual:.1f} px): pose unlocked")
+
+        memorized_pose = persistent_state.camera_poses.get(camera_index)
+        # The cameras are fixed, so their last pose is a good starting point
+        pose = context.pose(guess=memorized_pose)
         if pose is None:
             # Use last memorized pose for this camera if available
-            pose = persistent_state.camera_poses.get(capture.camera_index)
-        else:
-            # Store/update the reliable pose
-            persistent_state.camera_poses[capture.camera_index] = pose
-
-        return pose
+            context.provide("pose", memorized_pose)
+            return
+
+        if lock is not None and lock.add_sample(pose, time):
+            print(f"[Analyser] Camera {camera_index} pose locked")
+            # The robots are located with the steadier averaged pose from this frame on
+            pose = lock.pose
+            context.provide("pose", pose)
+
+        # Store/update the reliable pose
+        persistent_state.camera_poses[camera_index] = pose
+
+
+def _camera_pool():
+    global _camera_executor
+    with _camera_executor_lock:
+        if _camera_executor is None:
+            _camera_executor = ThreadPoolExecutor(max_workers=CAMERA_THREADS, thread_name_prefix="analyser-camera")
+        return _camera_executor
+
+
+@lru_cache(maxsize=None)
+def _point_pairs(count):
+    """Indices of the point pairs tried by the RANSAC of `Analyser._solve_2d_rigid`: all of them, or a fixed sample."""
+    first, second = np.triu_indices(count, k=1)
+    if len(first) > RIGID_RANSAC_HYPOTHESES:
+        pick = np.random.default_rng(0).choice(len(first), RIGID_RANSAC_HYPOTHESES, replace=False)
+        first, second = first[pick], second[pick]
+    return first, second
@@ -1,76 +1,36 @@
-from lib import detection, vision, common
-import cv2 as cv
+import weakref
+
+from models.frame_context import FrameContext
 
 
 class Capture:
-    def __init__(self, stream, image, time=None):
+    def __init__(self, stream, image, time=None, monotonic_time=None, seq=None, skew=None, release=None):
+        """
+        release: called once the image is no longer needed, on `release()` or when the Capture is garbage collected,
+        e.g. to let the stream reuse a buffer the image is a view of.
+        """
         self.camera_index = stream.camera_index
         self.camera_matrix = stream.camera_matrix
         self.dist_coeffs = stream.dist_coeffs
+        self.tracker = getattr(stream, "tracker", None)  # Optional detection.TrackedDetector of the stream
+        self.plane_projector = getattr(stream, "plane_projector", None)  # vision.PlaneProjector of the stream
 
         self.image = image
         self.time = time
-
-        self.last_pose = None
-        self.last_detection = None
-
-    def _detection(self):
-        if self.last_detection is not None:
-            return self.last_detection
-
-        self.aruco_detector = detection.build_aruco_detector()
-        corners, ids, _rejected = self.aruco_detector.detectMarkers(self.image)
-        self.last_detection = corners, ids
-        return self.last_detection
-
-    def estimate_pose(self):
-        if self.last_pose is not None:
-            return self.last_pose
-
-        # Return None unless we have 2 markers
-        corners, ids = self._detection()
-        if ids is None:
-            return None
-
-        field_marker_ids = set(vision.FIELD_MARKERS.keys())
-        detected_field_markers = set()
-        for id_array in ids:
-            marker_id = int(id_array[0])
-            if marker_id in field_marker_ids:
-                detected_field_markers.add(marker_id)
-
-        if len(detected_field_markers) < 2:
-            return None
-
-        ret, rvec, tvec = \
-            vision.estimate_pose(corners, ids, vision.FIELD_MARKERS, self.camera_matrix, self.dist_coeffs)
-        if ret:
-            pos = vision.get_camera_position(rvec, tvec)
-            euler = vision.rodrigues_to_euler(rvec)
-            self.last_pose = rvec, tvec, pos, euler
-
-        return self.last_pose
-
-    def debug_image(self):
-        """Generate an image of the capture augmented with detected markers and pose."""
-        IMG_WIDTH, IMG_HEIGHT = 1920, 1080
-
-        # Copy the image
-        img = self.image.copy()
-
-        # Show camera position and angles
-        pose = self.estimate_pose()
-        if pose:
-            x, y, z = pose[2]
-            common.draw_text_with_background(img, f"X:{x:.2f} Y:{y:.2f} Z:{z:.2f}", (10, 30))
-            roll, pitch, yaw = pose[3]
-            common.draw_text_with_background(img, f"Roll:{roll:.1f} Pitch:{pitch:.1f} Yaw:{yaw:.1f}", (10, 70))
-
-        # Draw contours around detected markers
-        corners, ids = self._detection()
-        detection.draw_aruco_markers(img, corners, ids)
-
-        # Resize
-        img = cv.resize(img, (IMG_WIDTH, IMG_HEIGHT))
-
-        return img
+        self.monotonic_time = monotonic_time  # time.monotonic() when the frame was decoded
+        self.seq = seq  # Frame sequence number within the stream
+        self.skew = skew  # Seconds between the oldest and newest frames of a synchronized set, if any
+
+        # Detections, pose and other products of the frame, computed on demand
+        self.context = FrameContext(self)
+
+        self._finalizer = weakref.finalize(self, release) if release is not None else None
+
+    def release(self):
+        """
+        Give the image back to the stream as soon as it is no longer needed, rather than when the last reference to
+        the Capture goes away.
+        """
+        self.image = None
+        if self._finalizer is not None:
+            self._finalizer()
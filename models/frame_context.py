@@ -0,0 +1,153 @@
+import weakref
+from time import perf_counter
+
+import cv2 as cv
+import numpy as np
+
+from lib import common, detection, vision
+
+POSE_RANSAC = True  # Reject badly detected field marker corners (see vision.estimate_pose)
+MAX_POSE_REPROJECTION_ERROR = 5.0  # Pixels; worse poses are not trusted
+
+
+class FrameContext:
+    """
+    Products derived from one captured frame: grayscale image, downscaled images, marker detections, camera pose,
+    world points of the markers and debug overlay.
+
+    Each stage is computed the first time it is asked for, from the stages it depends on, and kept until the end of
+    the frame, so the analyser, the board rendering and the logs never compute it twice. The time spent in each stage
+    is accumulated in `timings`, excluding the stages it depends on.
+    """
+
+    def __init__(self, capture):
+        # Weak, as the Capture owns its context: a cycle would keep the Capture, and the stream buffer its image may
+        # pin, alive until the next cycle collection
+        self._capture = weakref.ref(capture)
+        self.timings = {}  # stage name -> seconds
+        self._products = {}  # (stage name, *arguments) -> product
+        self._nested_time = 0.0  # Time spent in the stages called by the stage being computed
+
+    @property
+    def capture(self):
+        return self._capture()
+
+    def gray(self):
+        return self._stage("gray", lambda: cv.cvtColor(self.capture.image, cv.COLOR_BGR2GRAY)
+                           if self.capture.image.ndim == 3 else self.capture.image)
+
+    def pyramid(self, scale):
+        """The grayscale image downscaled by `scale`, as searched by `detection.detect_markers_pyramid`."""
+        def compute():
+            height, width = self.gray().shape
+            return cv.resize(self.gray(), (width // scale, height // scale), interpolation=cv.INTER_AREA)
+        return self._stage("pyramid", compute, scale)
+
+    def detections(self):
+        """(corners, ids) of the markers, found by the tracker of the stream if it has one."""
+        def compute():
+            if self.capture.tracker is not None:
+                return self.capture.tracker.detect(self.gray())
+            scale = detection.DETECTOR_PROFILES["field"].get("scale", 1)
+            if scale > 1:
+                return detection.detect_markers_pyramid(self.gray(), scale, small=self.pyramid(scale))
+            return detection.detect_markers(self.gray(), scale=1)
+        return self._stage("detections", compute)
+
+    def pose(self, guess=None):
+        """
+        vision.Pose of the camera, estimated from the field markers, or None.
+        guess: previous vision.Pose of the camera, refined instead of solving the pose from scratch.
+        """
+        return self._stage("pose", lambda: self._estimate_pose(guess))
+
+    def marker_world_points(self, role):
+        """
+        Project the corners of the markers of a role onto their planes, with the camera pose of the frame.
+        returns: ((N,3) corners in the tag frame, (N,3) corners in the field frame), or None
+        """
+        return self._stage("marker world points", lambda: self._project_markers(role), role)
+
+    def debug_overlay(self):
+        """The frame with the detected markers and the camera pose drawn over it, at 1920x1080."""
+        return self._stage("debug overlay", self._draw_debug_overlay)
+
+    def provide(self, name, product, *args):
+        """Set the product of a stage computed elsewhere, e.g. a camera pose taken from a PoseLock."""
+        self._products[(name, *args)] = product
+
+    def timing_summary(self):
+        return ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.timings.items())
+
+    def _stage(self, name, compute, *args):
+        key = (name, *args)
+        if key in self._products:
+            return self._products[key]
+
+        outer_nested_time, self._nested_time = self._nested_time, 0.0
+        start = perf_counter()
+        product = compute()
+        elapsed = perf_counter() - start
+        self.timings[name] = self.timings.get(name, 0.0) + elapsed - self._nested_time
+        self._nested_time = outer_nested_time + elapsed
+
+        self._products[key] = product
+        return product
+
+    def _estimate_pose(self, guess):
+        # Return None unless we have 2 markers
+        corners, ids = self.detections()
+        _, field_marker_ids = vision.MARKERS.select(ids, vision.MarkerRole.FIELD)
+        if len(np.unique(field_marker_ids)) < 2:
+            return None
+
+        capture = self.capture
+        pose = vision.estimate_pose(corners, ids, vision.MarkerRole.FIELD, capture.camera_matrix, capture.dist_coeffs,
+                                    guess=guess, ransac=POSE_RANSAC)
+        if pose is None or pose.reprojection_error > MAX_POSE_REPROJECTION_ERROR:
+            return None
+        return pose
+
+    def _project_markers(self, role):
+        camera_pose = self.pose()
+        corners, ids = self.detections()
+        if camera_pose is None or ids is None:
+            return None
+
+        indices, tag_ids = vision.MARKERS.select(ids, role)
+        if len(indices) == 0:
+            return None
+        image_points = np.concatenate([corners[i] for i in indices]).reshape(-1, 2)
+        tag_points = vision.MARKERS.corners[tag_ids].reshape(-1, 3)
+
+        # Project all the corners seen by this camera at once, each onto the plane of its tag
+        capture = self.capture
+        if capture.plane_projector is not None:
+            # The plane homographies of the stream are reused as long as the camera pose doesn't change
+            capture.plane_projector.set_pose(camera_pose)
+            world_points = capture.plane_projector.project(image_points, tag_points[:, 2])
+        else:
+            world_points = camera_pose.image_to_world_points(image_points, tag_points[:, 2], capture.camera_matrix,
+                                                             capture.dist_coeffs)
+        return tag_points, world_points
+
+    def _draw_debug_overlay(self):
+        IMG_WIDTH, IMG_HEIGHT = 1920, 1080
+
+        # Copy the image
+        img = self.capture.image.copy()
+
+        # Show camera position and angles
+        pose = self.pose()
+        if pose:
+            x, y, z = pose.camera_center
+            common.draw_text_with_background(img, f"X:{x:.2f} Y:{y:.2f} Z:{z:.2f}", (10, 30))
+            roll, pitch, yaw = pose.euler
+            common.draw_text_with_background(img, f"Roll:{roll:.1f} Pitch:{pitch:.1f} Yaw:{yaw:.1f}", (10, 70))
+
+        # Draw contours around detected markers
+        corners, ids = self.detections()
+        detection.draw_aruco_markers(img, corners, ids)
+
+        # Resize
+        return cv.resize(img, (IMG_WIDTH, IMG_HEIGHT))
@@ -1,7 +1,17 @@
+from models.pose_tracker import PoseTracker
+
+
 class PersistentState:
-    def __init__(self):
+    def __init__(self, pose_lock=True):
         self.team_color = None
         self.score = 40
 
         # Last reliable poses for each camera
-        self.camera_poses = {}  # camera_index -> (rvec, tvec, pos, euler)
+        self.camera_poses = {}  # camera_index -> vision.Pose
+
+        # Locked poses of the fixed cameras (see PoseLock), or None to solve the pose on every frame
+        self.pose_locks = {} if pose_lock else None  # camera_index -> PoseLock
+
+        # Filtered poses of the robots, predicted to the time the packet is sent
+        self.robot_tracker = PoseTracker()
+        self.opponent_tracker = PoseTracker()
@@ -0,0 +1,101 @@
+import numpy as np
+
+from lib import vision
+
+
+class PoseLock:
+    """
+    Lock the pose of a fixed camera, so that it doesn't have to be solved on every frame.
+
+    The poses estimated during the first `settle_time` seconds are fused into a robust average, after which the lock
+    is engaged and the solver skipped. Every `check_interval` seconds, the field markers are reprojected with the
+    locked pose: if their residual stays above `max_residual` pixels for `unlock_after` checks in a row, the camera
+    has moved (someone bumped the mast) and the lock is released until the pose settles again.
+    """
+
+    def __init__(self, settle_time=2.0, min_samples=5, check_interval=0.5, max_residual=4.0, unlock_after=2):
+        self.settle_time = settle_time
+        self.min_samples = min_samples
+        self.check_interval = check_interval
+        self.max_residual = max_residual
+        self.unlock_after = unlock_after
+
+        self.pose = None  # Locked vision.Pose
+        self.residual = None  # Residual of the last check, in pixels
+
+        self._samples = []  # (time, vision.Pose) of the poses estimated while unlocked
+        self._last_check_time = None
+        self._failed_checks = 0
+
+        # Statistics
+        self.locks = 0
+        self.unlocks = 0
+        self.checks = 0
+
+    @property
+    def locked(self):
+        return self.pose is not None
+
+    def add_sample(self, pose, time):
+        """Record a pose estimated while unlocked. Return True if the lock was engaged."""
+        if self.locked:
+            return False
+
+        self._samples.append((time, pose))
+        if len(self._samples) < self.min_samples or time - self._samples[0][0] < self.settle_time:
+            return False
+
+        self.pose = self._robust_average()
+        self.pose.reprojection_error, self.pose.inlier_count = pose.reprojection_error, pose.inlier_count
+        self._samples = []
+        self._last_check_time = time
+        self._failed_checks = 0
+        self.locks += 1
+        return True
+
+    def check_due(self, time):
+        return self._last_check_time is None or time - self._last_check_time >= self.check_interval
+
+    def check(self, corners, ids, camera_matrix, dist_coeffs, time):
+        """
+        Reproject the field markers detected in a frame with the locked pose. Return False if the lock was released.
+        Frames where no field marker is visible don't count.
+        """
+        self._last_check_time = time
+        if ids is None:
+            return True
+        obj_points, image_points = vision.known_marker_points(corners, ids, vision.MarkerRole.FIELD)
+        if len(obj_points) == 0:
+            return True
+
+        self.checks += 1
+        self.residual = vision.reprojection_error(obj_points, image_points, self.pose.rvec, self.pose.tvec,
+                                                  camera_matrix, dist_coeffs)
+        if self.residual <= self.max_residual:
+            self._failed_checks = 0
+            return True
+
+        # A single bad detection isn't enough to unlock
+        self._failed_checks += 1
+        if self._failed_checks < self.unlock_after:
+            return True
+
+        self.pose = None
+        self.unlocks += 1
+        return False
+
+    def statistics(self):
+        state = "locked" if self.locked else f"settling ({len(self._samples)} samples)"
+        residual = "" if self.residual is None else f", last residual {self.residual:.2f} px"
+        return f"pose {state}: {self.locks} locks, {self.unlocks} unlocks, {self.checks} checks{residual}"
+
+    def _robust_average(self):
+        """Average the samples whose camera position is close to the median one."""
+        poses = [pose for _, pose in self._samples]
+        positions = np.array([pose.camera_center for pose in poses])
+
+        distances = np.linalg.norm(positions - np.median(positions, axis=0), axis=1)
+        # Median absolute deviation, with a floor so that identical samples don't reject everything else
+        threshold = max(3 * np.median(distances), 0.005)
+        inliers = [i for i, distance in enumerate(distances) if distance <= threshold]
+        return vision.average_pose([poses[i] for i in inliers])
@@ -0,0 +1,119 @@
+import math
+
+import numpy as np
+
+from lib import common
+
+
+def _wrap(angle):
+    """Wrap an angle in radians to [-pi, pi), with `common.normalize_angle`."""
+    return math.radians(common.normalize_angle(math.degrees(angle)))
+
+
+class PoseTracker:
+    """
+    Constant-velocity Kalman filter over the (x, y, theta) pose of a robot, in meters and radians.
+
+    The state is (x, y, theta, vx, vy, omega). It is updated with the poses measured on each frame, at the time the
+    frame was captured, and `predict()` extrapolates it to any later time, e.g. when the packet is sent to the robot.
+    Without measurements the prediction coasts on the last velocity for up to `max_coast` seconds.
+    """
+
+    def __init__(self, acceleration=2.0, angular_acceleration=8.0, min_position_noise=0.005, lever_arm=0.1,
+                 max_coast=0.5, gate=16.0, max_rejections=3):
+        """
+        acceleration, angular_acceleration: standard deviation of the unmodelled accelerations, in m/s² and rad/s²
+        min_position_noise: floor of the measurement noise in meters, which is otherwise the RMSE of the pose fit
+        lever_arm: distance in meters between the markers and the centre of the robot, converting the position noise
+            of the markers into an angular noise
+        gate: squared Mahalanobis distance beyond which a measurement is rejected as an outlier
+        max_rejections: consecutive rejected measurements after which the filter restarts from the measurement
+        """
+        self.acceleration = acceleration
+        self.angular_acceleration = angular_acceleration
+        self.min_position_noise = min_position_noise
+        self.lever_arm = lever_arm
+        self.max_coast = max_coast
+        self.gate = gate
+        self.max_rejections = max_rejections
+
+        self.state = None  # (6,) x, y, theta, vx, vy, omega
+        self.covariance = None  # (6, 6)
+        self.time = None  # datetime of the state
+        self.last_measurement_time = None
+        self._rejections = 0
+
+    def update(self, pose, time, rmse=None, covariance=None):
+        """
+        Correct the filter with a measured (x, y, theta) pose, captured at `time` (datetime). The measurement noise
+        is the 3x3 `covariance` of the pose if known, on top of `min_position_noise`, else derived from the `rmse`.
+        A measurement which isn't finite, e.g. from a degenerate fit, is ignored: the gate can't reject NaNs.
+        """
+        if covariance is not None:
+            measurement_covariance = np.asarray(covariance) + np.diag(
+                [self.min_position_noise ** 2, self.min_position_noise ** 2,
+                 (self.min_position_noise / self.lever_arm) ** 2])
+        else:
+            position_noise = max(rmse or 0.0, self.min_position_noise)
+            measurement_covariance = np.diag([position_noise ** 2, position_noise ** 2,
+                                              (position_noise / self.lever_arm) ** 2])
+        measurement = np.array(pose, dtype=float)
+        if not (np.all(np.isfinite(measurement)) and np.all(np.isfinite(measurement_covariance))):
+            return
+
+        if self.state is None or self.time is None or time < self.time:
+            self._reset(measurement, measurement_covariance, time)
+            return
+
+        state, covariance = self._propagate((time - self.time).total_seconds())
+        innovation = measurement - state[:3]
+        innovation[2] = _wrap(innovation[2])
+        innovation_covariance = covariance[:3, :3] + measurement_covariance
+
+        if innovation @ np.linalg.solve(innovation_covariance, innovation) > self.gate:
+            self._rejections += 1
+            if self._rejections >= self.max_rejections:
+                # The robot really is somewhere else (or was lifted): start over
+                self._reset(measurement, measurement_covariance, time)
+            return
+
+        gain = np.linalg.solve(innovation_covariance, covariance[:3, :]).T  # P Hᵀ S⁻¹, S being symmetric
+        state = state + gain @ innovation
+        state[2] = _wrap(state[2])
+        covariance = covariance - gain @ covariance[:3, :]
+
+        self.state, self.covariance, self.time = state, covariance, time
+        self.last_measurement_time = time
+        self._rejections = 0
+
+    def predict(self, time):
+        """Return the (x, y, theta) pose extrapolated to `time`, or None if the robot hasn't been seen recently."""
+        if self.state is None or (time - self.last_measurement_time).total_seconds() > self.max_coast:
+            return None
+        state, _ = self._propagate(max((time - self.time).total_seconds(), 0.0))
+        return float(state[0]), float(state[1]), _wrap(state[2])
+
+    def _reset(self, measurement, measurement_covariance, time):
+        self.state = np.concatenate([measurement, np.zeros(3)])
+        self.covariance = np.zeros((6, 6))
+        self.covariance[:3, :3] = measurement_covariance
+        # Unknown velocities: about as fast as a robot goes
+        self.covariance[3:, 3:] = np.diag([1.0, 1.0, 4.0])
+        self.time = self.last_measurement_time = time
+        self._rejections = 0
+
+    def _propagate(self, dt):
+        transition = np.eye(6)
+        transition[:3, 3:] = dt * np.eye(3)
+
+        # White-noise acceleration model, independently for each axis
+        noise = np.zeros((6, 6))
+        for axis, sigma in enumerate([self.acceleration, self.acceleration, self.angular_acceleration]):
+            q = sigma ** 2
+            noise[axis, axis] = q * dt ** 4 / 4
+            noise[axis, axis + 3] = noise[axis + 3, axis] = q * dt ** 3 / 2
+            noise[axis + 3, axis + 3] = q * dt ** 2
+
+        state = transition @ self.state
+        state[2] = _wrap(state[2])
+        return state, transition @ self.covariance @ transition.T + noise
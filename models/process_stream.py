@@ -0,0 +1,277 @@
+import multiprocessing
+from datetime import datetime
+from functools import partial
+from multiprocessing import shared_memory
+from time import monotonic
+
+import numpy as np
+
+from lib import camera, detection, vision
+from models.capture import Capture
+
+# Worker processes are spawned rather than forked: the parent runs the BLE and grabber threads, which a fork copies
+# in whatever state they are in
+_mp = multiprocessing.get_context("spawn")
+
+# Fields of the per-slot metadata: sequence number (0: empty, -1: being written), datetime timestamp, monotonic time
+_SEQ, _TIMESTAMP, _MONOTONIC = range(3)
+
+
+class ProcessStream:
+    """
+    Stream-compatible camera decoded in its own worker process.
+
+    The worker decodes the frames straight into a ring of slots in shared memory, and the frames returned here are
+    views of those slots, without any copy. A stalled V4L2 read only stalls the worker: its frames go stale (see
+    `StreamSet`), and the worker is killed and started again once no frame arrived for `restart_after` seconds.
+
+    The slot of a Capture is pinned, so that the worker doesn't write over its image, until the Capture is released
+    (`Capture.release()`) or garbage collected. While more Captures than `pinned` are alive, the worker may run out
+    of slots and wait, dropping frames: release the Captures once done with them.
+    """
+
+    def __init__(self, camera_index, history=4, pinned=3, tracked=False, ray_lut=False, start_timeout=10.0,
+                 restart_after=3.0):
+        """
+        history: number of recent frames offered to `StreamSet` to pair frames across streams.
+        pinned: number of Captures expected to be alive at once, which sizes the ring.
+        tracked, ray_lut: as for Stream.
+        start_timeout: how long to wait for the first frame of the camera.
+        restart_after: seconds without a new frame after which the worker is restarted.
+        """
+        self.camera_index = camera_index
+        self.threaded = True
+        self.history = history
+        self.restart_after = restart_after
+        self.camera_matrix, self.dist_coeffs = camera.load_calibration(camera_index)
+        self.tracker = detection.TrackedDetector() if tracked else None
+
+        # Frame freshness statistics, as for Stream
+        self.frame_count = 0
+        self.dropped_frames = 0
+        self.duplicated_frames = 0
+        self.restarts = 0
+        self._last_seq = None
+
+        # Slots: the frames offered to StreamSet, the pinned ones, the one being written and a spare one
+        self._slot_count = history + pinned + 2
+        self._condition = _mp.Condition()
+        self._metadata = _mp.Array("d", self._slot_count * 3, lock=False)
+        self._pins = _mp.Array("b", self._slot_count, lock=False)
+        self._latest_seq = _mp.Value("q", 0, lock=False)
+        self._stop = _mp.Event()
+
+        # The worker opens the camera and reports the size of its frames, which sizes the ring
+        parent_connection, child_connection = _mp.Pipe()
+        self._process = self._start_worker(child_connection, None, None)
+        if not parent_connection.poll(start_timeout):
+            self._process.kill()
+            raise RuntimeError(f"Camera {camera_index} sent no frame within {start_timeout:.0f} s")
+        message = parent_connection.recv()
+        if message[0] == "error":
+            raise RuntimeError(message[1])
+        _, self._shape, self._dtype = message
+
+        self._shm = shared_memory.SharedMemory(create=True, size=self._slot_count * int(np.prod(self._shape)) *
+                                               np.dtype(self._dtype).itemsize)
+        self._ring = np.ndarray((self._slot_count, *self._shape), self._dtype, buffer=self._shm.buf)
+        parent_connection.send(self._shm.name)
+        parent_connection.close()
+
+        self.plane_projector = None
+        if self.camera_matrix is not None:
+            ray_lut_size = (self._shape[1], self._shape[0]) if ray_lut else None
+            self.plane_projector = vision.PlaneProjector(self.camera_matrix, self.dist_coeffs, ray_lut_size)
+
+    def capture(self):
+        frames = self.recent_frames()
+        if not frames:
+            return None
+        return self.capture_frame(frames[-1])
+
+    def capture_frame(self, frame, skew=None):
+        """
+        Build a Capture from one of the frames returned by `recent_frames()`, and pin its slot. Return None if the
+        stream has no frame left, e.g. after a restart.
+        """
+        image, time, monotonic_time, seq = frame
+        slot = self._pin(seq)
+        while slot is None:
+            # Written over since it was listed: fall back to the newest frame
+            frames = self.recent_frames()
+            if not frames:
+                return None
+            image, time, monotonic_time, seq = frames[-1]
+            slot = self._pin(seq)
+
+        self._update_statistics(seq)
+        return Capture(self, self._ring[slot], time, monotonic_time=monotonic_time, seq=seq, skew=skew,
+                       release=partial(self._unpin, slot))
+
+    def recent_frames(self):
+        """
+        Return the newest frames as (image, time, monotonic_time, seq), oldest first, or [] if the camera hasn't
+        sent any frame yet. The images are views of the ring: only `capture_frame()` keeps them from being reused.
+        """
+        self._restart_if_stalled()
+        with self._condition:
+            slots = [slot for slot in range(self._slot_count) if self._slot_metadata(slot)[_SEQ] > 0]
+            slots.sort(key=lambda slot: self._slot_metadata(slot)[_SEQ])
+            frames = []
+            for slot in slots[-self.history:]:
+                seq, timestamp, monotonic_time = self._slot_metadata(slot)
+                frames.append((self._ring[slot], datetime.fromtimestamp(timestamp), monotonic_time, int(seq)))
+            self.frame_count = self._latest_seq.value
+            return frames
+
+    def wait_for_frame(self, after_seq, timeout):
+        """Block until a frame newer than `after_seq` is decoded. Return False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._latest_seq.value > after_seq, timeout)
+
+    def close(self):
+        """Stop the worker and release the shared memory. The images of the Captures become invalid."""
+        self._stop.set()
+        self._process.join(timeout=1.0)
+        if self._process.is_alive():
+            self._process.kill()
+        self._ring = None
+        self._shm.unlink()
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # Captures still hold views of the ring; the memory is freed along with them
+
+    def statistics(self):
+        """Return a one-line summary of how fresh the frames returned by capture() are."""
+        return (f"camera {self.camera_index} (process): {self.frame_count} frames, {self.dropped_frames} dropped, "
+                f"{self.duplicated_frames} duplicated, {self.restarts} restarts")
+
+    def _start_worker(self, connection, shm_name, shape):
+        self._started = monotonic()
+        process = _mp.Process(target=_capture_worker, name=f"camera-{self.camera_index}", daemon=True,
+                              args=(self.camera_index, connection, shm_name, shape,
+                                    getattr(self, "_dtype", None), self._slot_count, self._condition,
+                                    self._metadata, self._pins, self._latest_seq, self._stop))
+        process.start()
+        return process
+
+    def _restart_if_stalled(self):
+        with self._condition:
+            newest = max((self._slot_metadata(slot)[_MONOTONIC] for slot in range(self._slot_count)
+                          if self._slot_metadata(slot)[_SEQ] > 0), default=self._started)
+            # A worker waiting for the Captures to be released isn't stalled
+            waiting = not _free_slots(self._slot_count, self._metadata, self._pins, self._latest_seq)
+        # Give a new worker as long to open the camera as a running one has to deliver a frame
+        if (waiting and self._process.is_alive()) or monotonic() - max(newest, self._started) <= self.restart_after:
+            return
+
+        print(f"Camera {self.camera_index} worker {'stalled' if self._process.is_alive() else 'died'}, "
+              f"restarting it")
+        # A read stuck in the driver may ignore SIGTERM
+        self._process.kill()
+        self._process.join(timeout=0.1)
+        with self._condition:
+            # Slot left half-written by the killed worker
+            for slot in range(self._slot_count):
+                if self._slot_metadata(slot)[_SEQ] < 0:
+                    self._metadata[slot * 3 + _SEQ] = 0
+        self.restarts += 1
+        self._process = self._start_worker(None, self._shm.name, self._shape)
+
+    def _pin(self, seq):
+        """Pin the slot holding frame `seq`. Return the slot, or None if it's gone."""
+        with self._condition:
+            slot = next((slot for slot in range(self._slot_count) if self._slot_metadata(slot)[_SEQ] == seq), None)
+            if slot is not None:
+                self._pins[slot] += 1
+            return slot
+
+    def _unpin(self, slot):
+        """Release callback of the Captures: wake up the worker if it was waiting for a free slot."""
+        with self._condition:
+            self._pins[slot] -= 1
+            self._condition.notify_all()
+
+    def _slot_metadata(self, slot):
+        return self._metadata[slot * 3:slot * 3 + 3]
+
+    def _update_statistics(self, seq):
+        if self._last_seq is not None:
+            if seq == self._last_seq:
+                self.duplicated_frames += 1
+            elif seq > self._last_seq + 1:
+                self.dropped_frames += seq - self._last_seq - 1
+        self._last_seq = seq
+
+
+def _capture_worker(camera_index, connection, shm_name, shape, dtype, slot_count, condition, metadata, pins,
+                    latest_seq, stop):
+    """
+    Worker process entry: decode the frames of a camera into the shared ring.
+
+    On the first start, `connection` is used to report the frame size and receive the name of the ring. On a
+    restart, the ring already exists and `shm_name`, `shape` and `dtype` describe it.
+    """
+    cap = camera.capture(camera_index)
+    camera.load_properties(cap, camera_index)
+
+    ret, first_image = cap.read()
+    if connection is not None:
+        if not ret:
+            connection.send(("error", f"Error capturing image from camera {camera_index}"))
+            return
+        connection.send(("ready", first_image.shape, first_image.dtype.str))
+        shm_name, shape, dtype = connection.recv(), first_image.shape, first_image.dtype.str
+        connection.close()
+    elif not ret or first_image.shape != tuple(shape):
+        print(f"Error capturing image from camera {camera_index}")
+        return
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    ring = np.ndarray((slot_count, *shape), dtype, buffer=shm.buf)
+
+    try:
+        while not stop.is_set():
+            with condition:
+                # Write over the oldest frame which is neither pinned nor the newest one, once there is one
+                free = _free_slots(slot_count, metadata, pins, latest_seq)
+                if not free:
+                    condition.wait(0.1)
+                    continue
+                slot = min(free, key=lambda slot: metadata[slot * 3 + _SEQ])
+                metadata[slot * 3 + _SEQ] = -1
+
+            if first_image is not None:
+                ring[slot] = first_image
+                first_image = None
+            else:
+                # Decode in place; read() blocks until the frame arrives
+                ret, image = cap.read(ring[slot])
+                if ret and not np.shares_memory(image, ring[slot]):
+                    ring[slot] = image  # The backend allocated its own buffer
+            if not ret:
+                print(f"Error capturing image from camera {camera_index}")
+                with condition:
+                    metadata[slot * 3 + _SEQ] = 0
+                return
+            time = datetime.now()
+            monotonic_time = monotonic()
+
+            with condition:
+                latest_seq.value += 1
+                metadata[slot * 3 + _SEQ] = latest_seq.value
+                metadata[slot * 3 + _TIMESTAMP] = time.timestamp()
+                metadata[slot * 3 + _MONOTONIC] = monotonic_time
+                condition.notify_all()
+    finally:
+        cap.release()
+        ring = None
+        shm.close()
+
+
+def _free_slots(slot_count, metadata, pins, latest_seq):
+    """Slots the worker may write to: neither pinned by a Capture nor holding the newest frame. Hold the condition."""
+    seqs = [metadata[slot * 3 + _SEQ] for slot in range(slot_count)]
+    return [slot for slot in range(slot_count)
+            if pins[slot] == 0 and (seqs[slot] != latest_seq.value or seqs[slot] == 0)]
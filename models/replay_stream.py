@@ -0,0 +1,187 @@
+import os
+import re
+from datetime import datetime, timedelta
+from time import monotonic, sleep
+
+import cv2 as cv
+
+from lib import board, camera, detection, recording, vision
+from models.capture import Capture
+
+# Resolution of the camera frames the calibrations were made for
+CAMERA_WIDTH, CAMERA_HEIGHT = 1920, 1080
+
+
+class ReplayStream:
+    """
+    Stream-compatible source that replays recorded frames instead of reading a camera.
+
+    source can be:
+      - a recordings/<session> folder written by recording.Recorder; camera_index is the number of the recorded
+        camera, from 1, and `start` (datetime) seeks to that time,
+      - a logs/<session> folder written by ImageLogger (HHMMSS_ffffff.jpg debug boards); pass one of
+        `board.DEBUG_CAPTURE_REGIONS` as `region` to replay one of the camera insets,
+      - a folder of frame_NNNN.jpg files written by 11_capture.py, timed at `fps`,
+      - a video file readable by OpenCV (mp4...).
+
+    realtime: when True, frames are paced by their original timestamps and frames whose time has already passed
+    are dropped, as a live camera would. Otherwise frames are returned as fast as they are consumed.
+    """
+
+    def __init__(self, source, camera_index=0, camera_name="W4DS--SN0001", realtime=False, fps=6.0, region=None,
+                 tracked=False, ray_lut=False, start=None):
+        self.camera_index = camera_index
+        self.source = source
+        self.realtime = realtime
+        self.region = region
+        self.threaded = False
+        self.tracker = detection.TrackedDetector() if tracked else None
+
+        self.camera_matrix, self.dist_coeffs = camera.load_calibration(camera_name=camera_name)
+        if region is not None and self.camera_matrix is not None:
+            self.camera_matrix = _scale_camera_matrix(self.camera_matrix, region[2] / CAMERA_WIDTH,
+                                                      region[3] / CAMERA_HEIGHT)
+
+        self.plane_projector = None
+        if self.camera_matrix is not None:
+            ray_lut_size = (region[2], region[3]) if region is not None else (CAMERA_WIDTH, CAMERA_HEIGHT)
+            self.plane_projector = vision.PlaneProjector(self.camera_matrix, self.dist_coeffs,
+                                                         ray_lut_size if ray_lut else None)
+
+        # Same statistics as Stream
+        self.frame_count = 0
+        self.dropped_frames = 0
+        self.duplicated_frames = 0
+
+        self._cap = None
+        if recording.is_recording(source):
+            self._frames = _recording_frames(recording.RecordingReader(source), camera_index, start)
+        elif os.path.isdir(source):
+            self._frames = _folder_frames(source, fps)
+        else:
+            self._cap = cv.VideoCapture(source)
+            if not self._cap.isOpened():
+                raise ValueError(f"Could not open video file {source}")
+            self._frames = _video_frames(self._cap, source)
+
+        self._first_time = None
+        self._start_monotonic = None
+
+    def capture(self):
+        """Return the next Capture, or None once the recording is exhausted."""
+        frame = next(self._frames, None)
+        if frame is None:
+            return None
+        time, load_image = frame
+
+        if self._first_time is None:
+            self._first_time = time
+            self._start_monotonic = monotonic()
+
+        if self.realtime:
+            frame = self._pace(frame)
+            if frame is None:
+                return None
+            time, load_image = frame
+
+        image = load_image()
+        if image is None:
+            return None
+        if self.region is not None:
+            image = board.crop_debug_board(image, self.region)
+
+        self.frame_count += 1
+        # Monotonic clock of the recording, so that time differences between captures are preserved
+        monotonic_time = (time - self._first_time).total_seconds()
+        return Capture(self, image, time, monotonic_time=monotonic_time, seq=self.frame_count)
+
+    def close(self):
+        if self._cap is not None:
+            self._cap.release()
+
+    def statistics(self):
+        return (f"replay {os.path.basename(os.path.normpath(self.source))}: {self.frame_count} frames, "
+                f"{self.dropped_frames} dropped")
+
+    def _pace(self, frame):
+        """Wait until the frame is due, or skip to the newest frame which is due if we are late."""
+        while True:
+            elapsed = monotonic() - self._start_monotonic
+            due = (frame[0] - self._first_time).total_seconds()
+            if due > elapsed:
+                sleep(due - elapsed)
+                return frame
+
+            next_frame = next(self._frames, None)
+            if next_frame is None:
+                return frame
+            if (next_frame[0] - self._first_time).total_seconds() > elapsed:
+                # The next frame isn't due yet: the current one is the newest available
+                self._frames = _prepend(next_frame, self._frames)
+                return frame
+
+            self.dropped_frames += 1
+            frame = next_frame
+
+
+def _folder_frames(folder, fps):
+    """Yield (time, load_image) for the JPEG files of a folder, in order."""
+    filenames = sorted(f for f in os.listdir(folder) if f.lower().endswith(".jpg"))
+
+    # ImageLogger: logs/YYYYMMDD_HHMMSS/HHMMSS_ffffff.jpg, or HHMMSS_mmm.jpg for older sessions
+    session_match = re.fullmatch(r"(\d{8})_\d{6}", os.path.basename(os.path.normpath(folder)))
+    session_date = datetime.strptime(session_match.group(1), "%Y%m%d") if session_match else datetime.now()
+
+    previous_time = None
+    for index, filename in enumerate(filenames):
+        path = os.path.join(folder, filename)
+        logger_match = re.fullmatch(r"(\d{6})_(\d{3}|\d{6})\.jpg", filename)
+        if logger_match:
+            time_of_day = datetime.strptime(logger_match.group(1), "%H%M%S")
+            time = session_date.replace(hour=time_of_day.hour, minute=time_of_day.minute,
+                                        second=time_of_day.second,
+                                        microsecond=int(logger_match.group(2).ljust(6, "0")))
+            if previous_time is not None and time < previous_time:
+                # The session went past midnight
+                session_date += timedelta(days=1)
+                time += timedelta(days=1)
+        else:
+            # 11_capture.py frames carry no timestamp
+            time = session_date + timedelta(seconds=index / fps)
+
+        previous_time = time
+        yield time, lambda path=path: cv.imread(path)
+
+
+def _recording_frames(reader, camera_index, start):
+    """Yield (time, load_image) for the frames of one camera of a recording, from `start` on."""
+    chunks = {}
+    try:
+        for event in reader.events(start, kinds=(recording.EVENT_FRAME,)):
+            if event.camera == camera_index and reader.has_image(event):
+                yield event.time, lambda event=event: reader.read_image(event, chunks)
+    finally:
+        for file in chunks.values():
+            file.close()
+
+
+def _video_frames(cap, path):
+    """Yield (time, load_image) for the frames of a video."""
+    start_time = datetime.fromtimestamp(os.path.getmtime(path))
+    while cap.grab():
+        time = start_time + timedelta(milliseconds=cap.get(cv.CAP_PROP_POS_MSEC))
+        # Decode now: _pace() grabs the next frame before this one is loaded, and retrieve() returns the last grabbed
+        _, image = cap.retrieve()
+        yield time, lambda image=image: image
+
+
+def _prepend(item, iterator):
+    yield item
+    yield from iterator
+
+
+def _scale_camera_matrix(camera_matrix, scale_x, scale_y):
+    scaled = camera_matrix.copy()
+    scaled[0, :] *= scale_x
+    scaled[1, :] *= scale_y
+    return scaled
@@ -1,25 +1,160 @@
-from lib import camera, common
-from models.capture import Capture
+import threading
+from collections import deque
 from datetime import datetime
+from time import monotonic
+
+import cv2 as cv
+
+from lib import camera, common, detection, vision
+from models.capture import Capture
 
 
 class Stream:
-    def __init__(self, camera_index):
+    def __init__(self, camera_index, threaded=False, history=4, tracked=False, ray_lut=False):
+        """
+        threaded: when True, a background thread keeps decoding frames into a latest-frame slot and
+        `capture()` returns the newest one without waiting for the camera.
+        history: number of recent frames kept by the grabber thread, used to pair frames across streams.
+        tracked: when True, markers are searched around their previous locations (see detection.TrackedDetector).
+        ray_lut: when True, pixels are projected onto the field with a per-pixel table of undistorted rays
+        (see vision.PlaneProjector).
+        """
         self.camera_index = camera_index
         self.cap = camera.capture(camera_index)
 
         camera.load_properties(self.cap, camera_index)
         self.camera_matrix, self.dist_coeffs = camera.load_calibration(camera_index)
+        self.tracker = detection.TrackedDetector() if tracked else None
+
+        self.plane_projector = None
+        if self.camera_matrix is not None:
+            ray_lut_size = None
+            if ray_lut:
+                ray_lut_size = int(self.cap.get(cv.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv.CAP_PROP_FRAME_HEIGHT))
+            self.plane_projector = vision.PlaneProjector(self.camera_matrix, self.dist_coeffs, ray_lut_size)
+
+        # Frame freshness statistics
+        self.frame_count = 0  # Frames decoded from the camera
+        self.dropped_frames = 0  # Frames decoded but never returned by capture()
+        self.duplicated_frames = 0  # Frames returned more than once by capture()
+        self._last_seq = None
+
+        self.threaded = threaded
+        self._latest = None  # (image, time, monotonic_time, seq)
+        self._history = deque(maxlen=history)  # Recent frames, oldest first
+        self._latest_cond = threading.Condition()
+        self._running = False
+        self._error = False
+        self._thread = None
+        if threaded:
+            self._running = True
+            self._thread = threading.Thread(target=self._grab_loop, daemon=True)
+            self._thread.start()
 
     def capture(self):
+        """Return a Capture of the newest frame, or None once the grabber thread stopped on a failed read."""
+        if self.threaded:
+            frame = self._wait_latest()
+            if frame is None:
+                return None
+            image, time, monotonic_time, seq = frame
+        else:
+            image, time, monotonic_time, seq = self._read_frame(evict_stale=True)
+
+        self._update_statistics(seq)
+        return Capture(self, image, time, monotonic_time=monotonic_time, seq=seq)
+
+    def capture_frame(self, frame, skew=None):
+        """Build a Capture from one of the frames returned by `recent_frames()`."""
+        image, time, monotonic_time, seq = frame
+        self._update_statistics(seq)
+        return Capture(self, image, time, monotonic_time=monotonic_time, seq=seq, skew=skew)
+
+    def recent_frames(self):
+        """
+        Return the frames kept by the grabber thread as (image, time, monotonic_time, seq), oldest first, or [] once
+        the grabber thread stopped on a failed read: the last frames would otherwise be returned forever.
+        """
+        with self._latest_cond:
+            self._latest_cond.wait_for(lambda: self._latest is not None or self._error or not self._running)
+            if self._error:
+                return []
+            if self._latest is None:
+                print(f"Error capturing image from camera {self.camera_index}")
+                exit(1)
+            return list(self._history)
+
+    def wait_for_frame(self, after_seq, timeout):
+        """Block until a frame newer than `after_seq` is decoded. Return False on timeout."""
+        with self._latest_cond:
+            return self._latest_cond.wait_for(
+                lambda: self._error or not self._running or self._latest[3] > after_seq, timeout)
+
+    def close(self):
+        """Stop the grabber thread, if any, and release the camera."""
+        with self._latest_cond:
+            self._running = False
+            self._latest_cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self.cap.release()
+
+    def _read_frame(self, evict_stale=False):
         time = datetime.now()
+        monotonic_time = monotonic()
 
-        # Evict any stale images from the one-image buffer (CAP_PROP_BUFFERSIZE=1)
-        self.cap.grab()
+        if evict_stale:
+            # Evict any stale images from the one-image buffer (CAP_PROP_BUFFERSIZE=1)
+            self.cap.grab()
+            self.frame_count += 1
 
         ret, image = self.cap.read()
         if not ret:
             print(f"Error capturing image from camera {self.camera_index}")
             exit(1)
 
-        return Capture(self, image, time)
+        self.frame_count += 1
+        return image, time, monotonic_time, self.frame_count
+
+    def _grab_loop(self):
+        """Thread entry: decode frames continuously and keep only the newest one."""
+        while self._running:
+            ret, image = self.cap.read()
+            # read() blocks until the frame arrives, so stamp it afterwards
+            time = datetime.now()
+            monotonic_time = monotonic()
+
+            with self._latest_cond:
+                if not ret:
+                    print(f"Error capturing image from camera {self.camera_index}, grabber thread stopped")
+                    self._error = True
+                    self._latest_cond.notify_all()
+                    return
+                self.frame_count += 1
+                self._latest = image, time, monotonic_time, self.frame_count
+                self._history.append(self._latest)
+                self._latest_cond.notify_all()
+
+    def _wait_latest(self):
+        """Return the newest frame, or None once the grabber thread stopped on a failed read."""
+        with self._latest_cond:
+            self._latest_cond.wait_for(lambda: self._latest is not None or self._error or not self._running)
+            if self._error:
+                return None
+            if self._latest is None:
+                print(f"Error capturing image from camera {self.camera_index}")
+                exit(1)
+            return self._latest
+
+    def _update_statistics(self, seq):
+        if self._last_seq is not None:
+            if seq == self._last_seq:
+                self.duplicated_frames += 1
+            elif seq > self._last_seq + 1:
+                self.dropped_frames += seq - self._last_seq - 1
+        self._last_seq = seq
+
+    def statistics(self):
+        """Return a one-line summary of how fresh the frames returned by capture() are."""
+        return (f"camera {self.camera_index}: {self.frame_count} frames, "
+                f"{self.dropped_frames} dropped, {self.duplicated_frames} duplicated")
@@ -0,0 +1,90 @@
+from time import monotonic
+
+
+class StreamSet:
+    """
+    Capture several threaded streams at (nearly) the same instant.
+
+    Each stream decodes frames on its own grabber thread or worker process. `capture()` pairs the recent frames of
+    all streams by their monotonic timestamps and returns one Capture per stream, each carrying the skew of the set.
+    """
+
+    def __init__(self, streams, tolerance=0.02, timeout=0.2, stale_after=0.5):
+        """
+        tolerance: maximum accepted skew (in seconds) between the oldest and newest frame of a set.
+        timeout: how long to wait for fresher frames before giving up and returning the best set found.
+        stale_after: a stream whose newest frame is older than this (in seconds) is left out of the set, so that
+        a stalled camera doesn't hold back the others. Its Capture is None.
+        """
+        for stream in streams:
+            if not stream.threaded:
+                raise ValueError(f"Stream of camera {stream.camera_index} must be threaded to be synchronized")
+
+        self.streams = streams
+        self.tolerance = tolerance
+        self.timeout = timeout
+        self.stale_after = stale_after
+
+        # Skew statistics
+        self.set_count = 0
+        self.max_skew = 0.0
+        self.total_skew = 0.0
+        self.out_of_tolerance = 0
+        self.stale_captures = 0
+
+    def capture(self):
+        deadline = monotonic() + self.timeout
+        while True:
+            histories = [stream.recent_frames() for stream in self.streams]
+            now = monotonic()
+            live = [i for i, history in enumerate(histories) if history and now - history[-1][2] <= self.stale_after]
+            if not live:
+                self.stale_captures += len(self.streams)
+                return [None] * len(self.streams)
+
+            frames, skew = self._pair_frames([histories[i] for i in live])
+            if skew <= self.tolerance:
+                break
+
+            # Wait for the stream lagging behind to decode a fresher frame
+            laggard = min(live, key=lambda i: histories[i][-1][2])
+            remaining = deadline - monotonic()
+            if remaining <= 0 or not self.streams[laggard].wait_for_frame(histories[laggard][-1][3], remaining):
+                self.out_of_tolerance += 1
+                break
+
+        self.set_count += 1
+        self.max_skew = max(self.max_skew, skew)
+        self.total_skew += skew
+        self.stale_captures += len(self.streams) - len(live)
+
+        captures = [None] * len(self.streams)
+        for i, frame in zip(live, frames):
+            captures[i] = self.streams[i].capture_frame(frame, skew)
+        return captures
+
+    def close(self):
+        for stream in self.streams:
+            stream.close()
+
+    def statistics(self):
+        """Return a one-line summary of the skew of the sets returned by capture()."""
+        mean_skew = self.total_skew / self.set_count if self.set_count else 0.0
+        return (f"{self.set_count} sets, skew mean {mean_skew * 1000:.1f} ms, max {self.max_skew * 1000:.1f} ms, "
+                f"{self.out_of_tolerance} over {self.tolerance * 1000:.0f} ms, {self.stale_captures} stale captures")
+
+    @staticmethod
+    def _pair_frames(histories):
+        """
+        Pick one frame per stream so that the set is as recent and as tight as possible.
+
+        The anchor is the newest frame of the stream lagging behind; every other stream contributes the frame
+        closest in time to it.
+
+        histories: list of frame lists (image, time, monotonic_time, seq), oldest first
+        returns: (frames, skew) where skew is in seconds
+        """
+        anchor_time = min(history[-1][2] for history in histories)
+        frames = [min(history, key=lambda frame: abs(frame[2] - anchor_time)) for history in histories]
+        times = [frame[2] for frame in frames]
+        return frames, max(times) - min(times)
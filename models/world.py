@@ -19,6 +19,21 @@ class World:
         self.opponent_y: float = 0.0
         self.opponent_theta: float = 0.0
 
+    def predict_poses(self, robot_tracker, opponent_tracker, time):
+        """
+        Replace the measured poses with the PoseTracker predictions at `time` (datetime), typically when the packet
+        is sent. A robot which wasn't detected on this frame is still reported while its prediction coasts.
+        """
+        robot_pose = robot_tracker.predict(time)
+        if robot_pose is not None:
+            self.robot_detected = True
+            self.robot_x, self.robot_y, self.robot_theta = robot_pose
+
+        opponent_pose = opponent_tracker.predict(time) if self.team_color else None
+        if opponent_pose is not None:
+            self.opponent_detected = True
+            self.opponent_x, self.opponent_y, self.opponent_theta = opponent_pose
+
     def to_eagle_packet(self):
         robot_pose = (self.robot_x, self.robot_y, self.robot_theta) if self.robot_detected else None
         opponent_pose = (self.opponent_x, self.opponent_y, self.opponent_theta) if self.opponent_detected else None
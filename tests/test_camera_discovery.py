@@ -0,0 +1,55 @@
+import os
+import sys
+
+# Ensure project root is on PYTHONPATH so that `lib` can be imported when the
+# tests are executed from any working directory.
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from lib import camera_discovery
+
+
+def _add_usb_camera(root, usb_path, nodes, product="W4DS", serial="SN0001"):
+    """Create a fake USB camera in sysfs, with one V4L2 node per (video_index, node_index) pair."""
+    usb_device = root / "devices" / "usb1" / usb_path
+    interface = usb_device / f"{usb_path}:1.0"
+    interface.mkdir(parents=True)
+    (usb_device / "product").write_text(product + "\n")
+    (usb_device / "serial").write_text(serial + "\n")
+
+    for video_index, node_index in nodes:
+        node = root / "class" / f"video{video_index}"
+        node.mkdir(parents=True)
+        (node / "index").write_text(f"{node_index}\n")
+        os.symlink(interface, node / "device")
+
+
+def test_lists_capture_nodes_with_usb_path(tmp_path):
+    camera_discovery.invalidate_cache()
+    _add_usb_camera(tmp_path, "1-2", [(2, 0), (3, 1)])
+    _add_usb_camera(tmp_path, "1-1", [(0, 0), (1, 1)])
+    _add_usb_camera(tmp_path, "1-3", [(4, 0)], product="HD Pro Webcam C920", serial="D5AA1BBF")
+
+    cameras = camera_discovery.list_cameras(str(tmp_path / "class"))
+
+    assert cameras == [
+        {"index": 0, "name": "W4DS--SN0001", "usb_path": "1-1"},
+        {"index": 2, "name": "W4DS--SN0001", "usb_path": "1-2"},
+        {"index": 4, "name": "HD_Pro_Webcam_C920--D5AA1BBF", "usb_path": "1-3"},
+    ]
+
+
+def test_cache_is_invalidated_on_hotplug(tmp_path):
+    camera_discovery.invalidate_cache()
+    sysfs_root = str(tmp_path / "class")
+    _add_usb_camera(tmp_path, "1-1", [(0, 0), (1, 1)])
+    assert [cam["index"] for cam in camera_discovery.list_cameras(sysfs_root)] == [0]
+
+    _add_usb_camera(tmp_path, "1-2", [(2, 0), (3, 1)])
+    assert [cam["index"] for cam in camera_discovery.list_cameras(sysfs_root)] == [0, 2]
+
+
+def test_missing_sysfs_returns_no_camera(tmp_path):
+    camera_discovery.invalidate_cache()
+    assert camera_discovery.list_cameras(str(tmp_path / "missing")) == []
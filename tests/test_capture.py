@@ -0,0 +1,43 @@
+import gc
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Ensure project root is on PYTHONPATH so that `models` can be imported when the
+# tests are executed from any working directory.
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from models.capture import Capture
+
+STREAM = SimpleNamespace(camera_index=1, camera_matrix=np.eye(3), dist_coeffs=np.zeros(5))
+
+
+def test_a_dropped_capture_is_released_without_a_cycle_collection():
+    released = []
+    capture = Capture(STREAM, np.zeros((48, 64, 3), np.uint8), seq=1, release=lambda: released.append(1))
+    capture.context.gray()
+
+    gc.disable()
+    try:
+        del capture
+        assert released == [1]
+    finally:
+        gc.enable()
+
+
+def test_release_is_called_once():
+    released = []
+    capture = Capture(STREAM, np.zeros((48, 64, 3), np.uint8), seq=1, release=lambda: released.append(1))
+
+    capture.release()
+    capture.release()
+    del capture
+
+    assert released == [1]
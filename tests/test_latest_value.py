@@ -0,0 +1,39 @@
+import os
+import sys
+import threading
+
+# Ensure project root is on PYTHONPATH so that `lib` can be imported when the
+# tests are executed from any working directory.
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from lib.latest_value import LatestValue
+
+
+def test_get_returns_the_newest_value_and_counts_the_dropped_ones():
+    queue = LatestValue()
+    for value in range(5):
+        queue.put(value)
+
+    assert queue.get(timeout=0) == 4
+    assert queue.get(timeout=0) is None
+    assert (queue.put_count, queue.dropped) == (5, 4)
+
+
+def test_get_waits_for_the_producer():
+    queue = LatestValue()
+    timer = threading.Timer(0.05, queue.put, args=("frame",))
+    timer.start()
+
+    assert queue.get(timeout=5) == "frame"
+    timer.join()
+
+
+def test_close_wakes_up_the_consumer():
+    queue = LatestValue()
+    queue.put("last")
+    threading.Timer(0.05, queue.close).start()
+
+    assert queue.get(timeout=5) == "last"
+    assert queue.get(timeout=5) is None
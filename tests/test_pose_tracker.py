@@ -0,0 +1,71 @@
+import math
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+# Ensure project root is on PYTHONPATH so that `models` can be imported when the
+# tests are executed from any working directory.
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from models.pose_tracker import PoseTracker
+
+START = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def _at(seconds):
+    return START + timedelta(seconds=seconds)
+
+
+def _track_still_robot(tracker, pose=(1.0, 0.5, 0.2), frames=10):
+    for frame in range(frames):
+        tracker.update(pose, _at(frame * 0.1), rmse=0.005)
+
+
+def test_non_finite_measurements_are_ignored():
+    tracker = PoseTracker()
+    _track_still_robot(tracker)
+
+    tracker.update((math.nan, 0.5, 0.2), _at(1.0), rmse=0.005)
+    tracker.update((1.0, 0.5, 0.2), _at(1.1), rmse=math.nan)
+    tracker.update((1.0, 0.5, 0.2), _at(1.2), covariance=[[math.inf, 0, 0], [0, 1, 0], [0, 0, 1]])
+
+    assert tracker.predict(_at(0.95)) == pytest.approx((1.0, 0.5, 0.2), abs=1e-3)
+    assert tracker.time == _at(0.9)
+
+
+def test_an_outlier_is_rejected_by_the_gate():
+    tracker = PoseTracker()
+    _track_still_robot(tracker)
+
+    tracker.update((2.0, 0.5, 0.2), _at(1.0), rmse=0.005)
+
+    assert tracker.predict(_at(1.0)) == pytest.approx((1.0, 0.5, 0.2), abs=1e-3)
+
+
+def test_the_filter_restarts_after_max_rejections():
+    tracker = PoseTracker(max_rejections=3)
+    _track_still_robot(tracker)
+
+    for frame in range(3):
+        tracker.update((2.0, 0.5, 0.2), _at(1.0 + frame * 0.1), rmse=0.005)
+
+    assert tracker.predict(_at(1.2)) == pytest.approx((2.0, 0.5, 0.2), abs=1e-6)
+
+
+def test_prediction_coasts_on_the_velocity_then_expires():
+    tracker = PoseTracker(max_coast=0.5)
+    for frame in range(20):
+        tracker.update((0.5 * frame * 0.1, 0.0, 0.0), _at(frame * 0.1), rmse=0.001)
+
+    x, y, theta = tracker.predict(_at(1.9 + 0.3))
+
+    assert x == pytest.approx(0.5 * 2.2, abs=0.01)
+    assert (y, theta) == pytest.approx((0.0, 0.0), abs=1e-3)
+    assert tracker.predict(_at(1.9 + 0.6)) is None
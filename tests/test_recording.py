@@ -0,0 +1,128 @@
+import os
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+# Ensure project root is on PYTHONPATH so that `lib` can be imported when the
+# tests are executed from any working directory.
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from lib import recording
+from lib.disk_budget import MB
+
+START = datetime(2026, 1, 1, 12, 0, 0)
+FRAME_COUNT = 20
+
+
+def _at(frame):
+    return START + timedelta(seconds=frame * 0.1)
+
+
+def _image(frame, camera):
+    """Uniform image whose grey level tells the frame and the camera apart, even after JPEG compression."""
+    return np.full((48, 64, 3), frame * 10 + camera * 5, np.uint8)
+
+
+def _grey_level(image):
+    return int(round(float(image.mean())))
+
+
+def _record(root, **options):
+    recorder = recording.Recorder(root=str(root), **options)
+    for frame in range(FRAME_COUNT):
+        for camera in (1, 2):
+            recorder.add_frame(camera, _at(frame), frame + 1, _image(frame, camera))
+            corners = (np.arange(8, dtype=np.float32).reshape(1, 4, 2) + frame,)
+            recorder.add_detections(camera, _at(frame), corners, np.array([[frame]]))
+            pose = SimpleNamespace(rvec=np.full(3, 0.1 * camera), tvec=np.full(3, frame), reprojection_error=None)
+            recorder.add_camera_pose(camera, _at(frame), pose)
+        world = SimpleNamespace(robot_detected=True, robot_x=frame, robot_y=1.0, robot_theta=0.5,
+                                opponent_detected=False, opponent_x=0.0, opponent_y=0.0, opponent_theta=0.0)
+        recorder.add_world(_at(frame), world)
+        recorder.add_packet(_at(frame), bytes([frame, 0xAA]))
+    recorder.close(timeout=10.0)
+    assert (recorder.dropped_frames, recorder.dropped_events) == (0, 0)
+    return recorder
+
+
+def test_round_trip_from_a_seek(tmp_path):
+    recorder = _record(tmp_path, frame_queue_size=FRAME_COUNT, event_queue_size=10 * FRAME_COUNT)
+    reader = recording.RecordingReader(recorder.folder_path)
+
+    assert len(reader) == FRAME_COUNT * 8
+    assert reader.time_range() == (_at(0), _at(FRAME_COUNT - 1))
+    assert reader.cameras() == [1, 2]
+
+    events = list(reader.events(start=_at(12), end=_at(13)))
+    assert {event.time for event in events} == {_at(12), _at(13)}
+    kinds = [(event.kind, event.camera) for event in events if event.time == _at(12)]
+    assert sorted(kinds) == sorted([(recording.EVENT_FRAME, 1), (recording.EVENT_FRAME, 2),
+                                    (recording.EVENT_DETECTIONS, 1), (recording.EVENT_DETECTIONS, 2),
+                                    (recording.EVENT_CAMERA_POSE, 1), (recording.EVENT_CAMERA_POSE, 2),
+                                    (recording.EVENT_WORLD, 0), (recording.EVENT_PACKET, 0)])
+
+    data = {(event.kind, event.camera): event.data for event in events if event.time == _at(12)}
+    corners, ids = data[recording.EVENT_DETECTIONS, 2]
+    assert ids.tolist() == [[12]]
+    assert corners[0].tolist() == (np.arange(8, dtype=np.float32).reshape(1, 4, 2) + 12).tolist()
+    rvec, tvec, reprojection_error = data[recording.EVENT_CAMERA_POSE, 1]
+    assert rvec.ravel().tolist() == pytest.approx([0.1] * 3)
+    assert tvec.ravel().tolist() == [12.0] * 3
+    assert np.isnan(reprojection_error)
+    assert data[recording.EVENT_WORLD, 0] == (True, False, (12.0, 1.0, 0.5), (0.0, 0.0, 0.0))
+    assert data[recording.EVENT_PACKET, 0] == bytes([12, 0xAA])
+
+    frames = list(reader.frames(camera=2, start=_at(15)))
+    assert [(frame.time, frame.seq) for frame in frames] == [(_at(k), k + 1) for k in range(15, FRAME_COUNT)]
+    assert [_grey_level(frame.image) for frame in frames] == [k * 10 + 10 for k in range(15, FRAME_COUNT)]
+
+
+def test_frames_are_read_across_chunks(tmp_path):
+    recorder = _record(tmp_path, frame_queue_size=FRAME_COUNT, event_queue_size=10 * FRAME_COUNT, chunk_bytes=2000)
+    reader = recording.RecordingReader(recorder.folder_path)
+
+    chunks = [name for name in os.listdir(recorder.folder_path) if name.startswith("camera1_")]
+    assert len(chunks) > 2
+    frames = list(reader.frames(camera=1))
+    assert [_grey_level(frame.image) for frame in frames] == [k * 10 + 5 for k in range(FRAME_COUNT)]
+
+
+def test_oldest_chunks_are_deleted_beyond_the_budget(tmp_path):
+    recorder = _record(tmp_path, frame_queue_size=FRAME_COUNT, event_queue_size=10 * FRAME_COUNT, chunk_bytes=2000,
+                       session_budget_mb=25000 / MB)
+    reader = recording.RecordingReader(recorder.folder_path)
+
+    chunk_bytes = sum(entry.stat().st_size for entry in os.scandir(recorder.folder_path)
+                      if entry.name.endswith(".mjpg"))
+    sidecar_bytes = sum(entry.stat().st_size for entry in os.scandir(recorder.folder_path)
+                        if not entry.name.endswith(".mjpg"))
+    assert 0 < chunk_bytes <= 25000 - sidecar_bytes
+    assert len(reader) == FRAME_COUNT * 8
+
+    # The deleted frames are skipped, and the frames kept are the newest of each camera
+    for camera in (1, 2):
+        seqs = [frame.seq for frame in reader.frames(camera=camera)]
+        assert seqs == list(range(FRAME_COUNT - len(seqs) + 1, FRAME_COUNT + 1))
+    assert 0 < len(list(reader.frames())) < 2 * FRAME_COUNT
+
+
+def test_captures_record_frames_at_the_frame_interval(tmp_path):
+    recorder = recording.Recorder(root=str(tmp_path), frame_interval=0.25, frame_queue_size=FRAME_COUNT,
+                                  event_queue_size=10 * FRAME_COUNT)
+    for frame in range(FRAME_COUNT):
+        corners = (np.arange(8, dtype=np.float32).reshape(1, 4, 2),)
+        context = SimpleNamespace(detections=lambda: (corners, np.array([[frame]])), pose=lambda: None)
+        capture = SimpleNamespace(time=_at(frame), seq=frame + 1, image=_image(frame, 1), context=context)
+        recorder.add_captures([capture, None])
+    recorder.close(timeout=10.0)
+    reader = recording.RecordingReader(recorder.folder_path)
+
+    assert [frame.seq for frame in reader.frames(camera=1)] == [1, 4, 7, 10, 13, 16, 19]
+    assert len(list(reader.events(kinds=[recording.EVENT_DETECTIONS]))) == FRAME_COUNT
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+# Ensure project root is on PYTHONPATH so that `models` can be imported when the
+# tests are executed from any working directory.
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+cv = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+from models.replay_stream import ReplayStream
+
+FPS = 10.0
+FRAME_COUNT = 5
+
+
+def _write_video(path):
+    """Write a video whose frame k is uniformly k * 40 grey, so that each image tells its frame number."""
+    writer = cv.VideoWriter(str(path), cv.VideoWriter_fourcc(*"MJPG"), FPS, (64, 48))
+    assert writer.isOpened()
+    for k in range(FRAME_COUNT):
+        writer.write(np.full((48, 64, 3), k * 40, np.uint8))
+    writer.release()
+
+
+def _replay(path, realtime):
+    stream = ReplayStream(str(path), realtime=realtime)
+    frames = []
+    while (capture := stream.capture()) is not None:
+        frame_number = round(capture.monotonic_time * FPS)
+        frames.append((frame_number, round(float(capture.image.mean()) / 40)))
+    stream.close()
+    return frames
+
+
+@pytest.mark.parametrize("realtime", [False, True])
+def test_video_images_match_their_timestamps(tmp_path, realtime):
+    path = tmp_path / "video.avi"
+    _write_video(path)
+
+    frames = _replay(path, realtime)
+
+    assert frames == [(k, k) for k in range(FRAME_COUNT)]
@@ -0,0 +1,43 @@
+import math
+import os
+import sys
+
+import pytest
+
+# Ensure project root is on PYTHONPATH so that `models` can be imported when the
+# tests are executed from any working directory.
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from models.analyser import Analyser
+
+# Corners of a 5 cm marker, in the robot frame
+ROBOT_POINTS = np.array([[-0.025, 0.025], [0.025, 0.025], [0.025, -0.025], [-0.025, -0.025],
+                         [0.035, 0.075], [0.085, 0.075], [0.085, 0.025], [0.035, 0.025]])
+
+
+def _to_world(points, x, y, theta):
+    rotation = np.array([[math.cos(theta), -math.sin(theta)], [math.sin(theta), math.cos(theta)]])
+    return points @ rotation.T + [x, y]
+
+
+def test_fit_ignores_a_gross_outlier():
+    world_points = _to_world(ROBOT_POINTS, 1.2, 0.8, 0.4)
+    world_points[3] += [0.5, -0.3]
+
+    x, y, theta, rmse, inliers, covariance = Analyser()._solve_2d_rigid(ROBOT_POINTS, world_points)
+
+    assert (x, y, theta) == pytest.approx((1.2, 0.8, 0.4), abs=1e-6)
+    assert inliers.tolist() == [True, True, True, False, True, True, True, True]
+    assert np.all(np.isfinite(covariance))
+
+
+def test_no_pose_when_every_point_is_an_outlier():
+    # Scattered far apart: no pair of points has the length of its robot frame segment
+    world_points = np.random.default_rng(1).uniform(0.0, 3.0, size=ROBOT_POINTS.shape)
+
+    assert Analyser()._solve_2d_rigid(ROBOT_POINTS, world_points) is None